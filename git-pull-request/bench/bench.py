@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End to end benchmarks for git-pull-request.py against a synthetic repository
+and the fake GitHub API in fake_github.py.
+
+Usage:
+
+	bench.py [<options>]
+	bench.py --compare <baseline.json> <results.json>
+
+Options:
+
+	--commits <count>
+		Number of commits in the synthetic repository (default 2000).
+
+	--pulls <count>
+		Number of open pull requests, each with its own refs/pull/<n>/head
+		(default 50).
+
+	--members <count>
+		Number of organization members, which is also the number of forks
+		(default 100).
+
+	--latency <milliseconds>
+		Delay the fake API adds to every response (default 0).
+
+	--repeat <count>
+		Number of timed runs of each scenario (default 3).
+
+	--scenarios <name,...>
+		Comma separated scenarios to run (default all of them: help,
+		show-alias, show, fetch-all, stats, update, merge, update-users). help
+		and show-alias measure the startup time.
+
+	--script <path>
+		The git-pull-request.py or gitpr.pyz to benchmark (default the script
+		next to this directory), so different versions can be compared.
+
+	--output <file>
+		Save the results as JSON.
+
+	--keep
+		Keep the temporary workspace and print its location.
+
+	--compare <baseline.json> <results.json>
+		Print the relative change between two saved results.
+
+Every scenario reports its median wall time, the number of git processes it
+spawned (counted through a git wrapper on the PATH), the number of HTTP requests
+the fake API received and the peak resident set size of the process tree.
+"""
+
+import getopt
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_github import FakeGitHub
+
+EXTENSIONS = ("java", "js", "jsp", "css", "xml", "properties")
+
+OWNER = "liferay"
+
+REPO = "liferay-portal"
+
+SCRIPT_PATH = os.path.join(
+	os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "git-pull-request.py"
+)
+
+SCENARIOS = (
+	"help", "show-alias", "show", "fetch-all", "stats", "update", "merge",
+	"update-users",
+)
+
+
+def build_fast_import_stream(commit_count, pull_count):
+	"""Returns a git fast-import stream with the master history and one
+	branch under refs/pull/<n>/head for every pull request"""
+
+	file_count = max(commit_count // 4, 10)
+	lines = []
+	timestamp = 1300000000
+
+	def add_commit(ref, mark, parent_mark, message, changes):
+		lines.append("commit %s" % ref)
+		lines.append("mark :%s" % mark)
+		lines.append("author Bench User <bench@liferay.com> %s +0000" % (timestamp + mark))
+		lines.append("committer Bench User <bench@liferay.com> %s +0000" % (timestamp + mark))
+		lines.append("data %s" % len(message.encode("utf-8")))
+		lines.append(message)
+
+		if parent_mark:
+			lines.append("from :%s" % parent_mark)
+
+		for path, content in changes:
+			lines.append("M 100644 inline %s" % path)
+			lines.append("data %s" % len(content.encode("utf-8")))
+			lines.append(content)
+
+		lines.append("")
+
+	for index in range(1, commit_count + 1):
+		changes = []
+
+		for offset in range(1 + index % 3):
+			file_index = (index * 7 + offset * 13) % file_count
+
+			path = "modules/module%s/src/File%s.%s" % (
+				file_index % 40, file_index, EXTENSIONS[file_index % len(EXTENSIONS)]
+			)
+
+			changes.append((path, "file %s\nchanged by commit %s\n" % (file_index, index)))
+
+		add_commit(
+			"refs/heads/master",
+			index,
+			index - 1,
+			"LPS-%s Synthetic change %s" % (index % 5000 + 1, index),
+			changes,
+		)
+
+	mark = commit_count
+
+	for number in range(1, pull_count + 1):
+		parent_mark = max(commit_count - number % 50, 1)
+
+		for commit_index in range(2):
+			mark += 1
+
+			changes = [
+				(
+					"modules/pull%s/src/Change%s.%s" % (number, file_index, extension),
+					"pull request %s\ncommit %s\n" % (number, commit_index),
+				)
+				for file_index, extension in enumerate(EXTENSIONS[0:3 + commit_index])
+			]
+
+			add_commit(
+				"refs/pull/%s/head" % number,
+				mark,
+				parent_mark,
+				"LPS-%s Pull request %s commit %s" % (10000 + number, number, commit_index),
+				changes,
+			)
+
+			parent_mark = mark
+
+	return "\n".join(lines) + "\n"
+
+
+def git(*args, **kwargs):
+	return subprocess.check_output(("git",) + args, **kwargs).decode("utf-8").strip()
+
+
+def create_workspace(workspace, commit_count, pull_count, member_count):
+	"""Creates the upstream repository, one fork per member sharing its objects
+	and a working clone configured to talk to the fake API"""
+
+	forks_path = os.path.join(workspace, "forks")
+	upstream_path = os.path.join(forks_path, OWNER, "%s.git" % REPO)
+
+	os.makedirs(upstream_path)
+
+	git("init", "-q", "--bare", upstream_path)
+
+	subprocess.run(
+		("git", "fast-import", "--quiet"),
+		cwd=upstream_path,
+		input=build_fast_import_stream(commit_count, pull_count).encode("utf-8"),
+		check=True,
+	)
+
+	master_sha = git("rev-parse", "refs/heads/master", cwd=upstream_path)
+
+	members = ["user%s" % index for index in range(1, member_count + 1)]
+
+	fixtures = []
+
+	for number in range(1, pull_count + 1):
+		head_sha = git("rev-parse", "refs/pull/%s/head" % number, cwd=upstream_path)
+
+		files = []
+
+		for line in git(
+			"diff", "--numstat", "%s...%s" % (master_sha, head_sha), cwd=upstream_path
+		).splitlines():
+			additions, deletions, path = line.split("\t", 2)
+
+			files.append({
+				"filename": path,
+				"status": "modified",
+				"additions": int(additions),
+				"deletions": int(deletions),
+			})
+
+		fixtures.append({
+			"number": number,
+			"user": members[number % len(members)],
+			"head_ref": "LPS-%s-synthetic" % (10000 + number),
+			"head_sha": head_sha,
+			"base_ref": "master",
+			"base_sha": master_sha,
+			"files": files,
+		})
+
+	for fixture in fixtures:
+		fork_path = os.path.join(forks_path, fixture["user"], REPO)
+
+		if not os.path.exists(fork_path):
+			os.makedirs(fork_path)
+			git("init", "-q", "--bare", fork_path)
+
+			with open(os.path.join(fork_path, "objects", "info", "alternates"), "w") as f:
+				f.write(os.path.join(upstream_path, "objects") + "\n")
+
+		git(
+			"update-ref", "refs/heads/%s" % fixture["head_ref"], fixture["head_sha"],
+			cwd=fork_path,
+		)
+
+	pulls_file = os.path.join(workspace, "pulls.json")
+
+	with open(pulls_file, "w") as f:
+		json.dump(fixtures, f)
+
+	work_path = os.path.join(workspace, REPO)
+
+	git("clone", "-q", upstream_path, work_path)
+
+	config = (
+		("user.name", "Bench User"),
+		("user.email", "bench@liferay.com"),
+		("github.user", "bench"),
+		("github.repo", "%s/%s" % (OWNER, REPO)),
+		("github.oauth-token", "bench-token"),
+		("git-pull-request.users-alias-file", os.path.join(workspace, "users.json")),
+		("git-pull-request.submit-open-github", "false"),
+		("url.%s/.insteadOf" % forks_path, "git@github.com:"),
+		("url.%s/.insteadof" % forks_path, "git://github.com/"),
+	)
+
+	for key, value in config:
+		git("config", "--add", key, value, cwd=work_path)
+
+	git("remote", "add", "upstream", upstream_path, cwd=work_path)
+
+	with open(os.path.join(workspace, "users.json"), "w") as f:
+		json.dump({}, f)
+
+	return work_path, pulls_file, master_sha
+
+
+def create_git_wrapper(workspace):
+	"""Puts a git wrapper that logs every invocation first on the PATH"""
+
+	bin_path = os.path.join(workspace, "bin")
+	os.makedirs(bin_path)
+
+	wrapper_path = os.path.join(bin_path, "git")
+
+	with open(wrapper_path, "w") as f:
+		f.write(
+			'#!/bin/sh\necho >> "$GITPR_BENCH_GIT_LOG"\nexec %s "$@"\n' % shutil.which("git")
+		)
+
+	os.chmod(wrapper_path, 0o755)
+
+	return bin_path
+
+
+def compare(baseline_path, results_path):
+	with open(baseline_path) as f:
+		baseline = json.load(f)
+
+	with open(results_path) as f:
+		results = json.load(f)
+
+	print("%-14s %24s %18s %18s %22s" % (
+		"scenario", "wall (s)", "git processes", "http requests", "peak rss (MB)"
+	))
+
+	def change(old, new):
+		if not old:
+			return "%s -> %s" % (old, new)
+
+		return "%s -> %s (%+.0f%%)" % (old, new, (new - old) * 100.0 / old)
+
+	for name, result in results["results"].items():
+		if name not in baseline["results"]:
+			continue
+
+		old = baseline["results"][name]
+
+		print("%-14s %24s %18s %18s %22s" % (
+			name,
+			change(round(old["wall"], 3), round(result["wall"], 3)),
+			change(old["git_processes"], result["git_processes"]),
+			change(old["http_requests"], result["http_requests"]),
+			change(round(old["peak_rss_kb"] / 1024.0, 1), round(result["peak_rss_kb"] / 1024.0, 1)),
+		))
+
+
+def run_gitpr(script_path, work_path, env, args):
+	"""Runs gitpr and returns its wall time, rusage and exit status"""
+
+	start = time.perf_counter()
+
+	process = subprocess.Popen(
+		(sys.executable, script_path) + tuple(args),
+		cwd=work_path,
+		env=env,
+		stdin=subprocess.DEVNULL,
+		stdout=subprocess.DEVNULL,
+		stderr=subprocess.DEVNULL,
+	)
+
+	_, status, rusage = os.wait4(process.pid, 0)
+	process.returncode = os.waitstatus_to_exitcode(status)
+
+	return time.perf_counter() - start, rusage, process.returncode
+
+
+def run_scenarios(
+	script_path, work_path, pulls_file, master_sha, bin_path, github, scenarios,
+	repeat, pull_count,
+):
+	git_log_path = os.path.join(os.path.dirname(work_path), "git.log")
+
+	env = dict(os.environ)
+	env["PATH"] = "%s%s%s" % (bin_path, os.pathsep, env.get("PATH", ""))
+	env["GITPR_BENCH_GIT_LOG"] = git_log_path
+
+	def gitpr(*args):
+		subprocess.run(
+			(sys.executable, script_path) + args,
+			cwd=work_path,
+			env=env,
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL,
+		)
+
+	def reset_master():
+		git("checkout", "-q", "-f", "master", cwd=work_path)
+		git("reset", "-q", "--hard", master_sha, cwd=work_path)
+
+	def delete_pull_request_branches():
+		reset_master()
+
+		refs = git(
+			"for-each-ref", "--format=delete %(refname)", "refs/heads/pull-request-*",
+			cwd=work_path,
+		)
+
+		if refs:
+			subprocess.run(
+				("git", "update-ref", "--stdin"),
+				cwd=work_path,
+				input=(refs + "\n").encode("utf-8"),
+				check=True,
+			)
+
+	def checkout_pull_request(number):
+		reset_master()
+		gitpr("fetch", str(number))
+
+		branch_name = git(
+			"for-each-ref", "--format=%(refname:short)",
+			"refs/heads/pull-request-%s-*" % number,
+			cwd=work_path,
+		)
+
+		git("checkout", "-q", branch_name, cwd=work_path)
+
+	plans = {
+		"help": lambda run: (None, ("help",)),
+		"show-alias": lambda run: (None, ("show-alias", "user1")),
+		"show": lambda run: (None, ("--all",)),
+		"fetch-all": lambda run: (delete_pull_request_branches, ("fetch-all",)),
+		"stats": lambda run: (reset_master, ("stats",)),
+		"update": lambda run: (
+			lambda: checkout_pull_request(run + 1), ("update", str(run + 1))
+		),
+		"merge": lambda run: (
+			lambda: checkout_pull_request(pull_count - run), ("merge",)
+		),
+		"update-users": lambda run: (None, ("update-users",)),
+	}
+
+	results = {}
+
+	for name in scenarios:
+		runs = []
+
+		for run in range(repeat):
+			setup, args = plans[name](run)
+
+			if setup:
+				setup()
+
+			open(git_log_path, "w").close()
+			http_before = sum(github.stats.values())
+
+			wall, rusage, returncode = run_gitpr(script_path, work_path, env, args)
+
+			with open(git_log_path) as f:
+				git_processes = len(f.readlines())
+
+			runs.append({
+				"wall": wall,
+				"git_processes": git_processes,
+				"http_requests": sum(github.stats.values()) - http_before,
+				"peak_rss_kb": rusage.ru_maxrss,
+				"returncode": returncode,
+			})
+
+		results[name] = {
+			"wall": statistics.median(run["wall"] for run in runs),
+			"git_processes": max(run["git_processes"] for run in runs),
+			"http_requests": max(run["http_requests"] for run in runs),
+			"peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+			"failures": len([run for run in runs if run["returncode"] != 0]),
+			"runs": runs,
+		}
+
+		result = results[name]
+
+		print("%-14s %8.3fs %6s git %6s http %8.1f MB%s" % (
+			name,
+			result["wall"],
+			result["git_processes"],
+			result["http_requests"],
+			result["peak_rss_kb"] / 1024.0,
+			" (%s failed)" % result["failures"] if result["failures"] else "",
+		))
+		sys.stdout.flush()
+
+	return results
+
+
+def main():
+	try:
+		opts, args = getopt.gnu_getopt(
+			sys.argv[1:],
+			"h",
+			[
+				"help",
+				"commits=",
+				"pulls=",
+				"members=",
+				"latency=",
+				"repeat=",
+				"scenarios=",
+				"script=",
+				"output=",
+				"keep",
+				"compare",
+			],
+		)
+	except getopt.GetoptError as e:
+		print("%s\nFor help use --help" % e)
+		sys.exit(1)
+
+	commit_count = 2000
+	pull_count = 50
+	member_count = 100
+	latency = 0
+	repeat = 3
+	scenarios = SCENARIOS
+	script_path = SCRIPT_PATH
+	output_path = None
+	keep = False
+
+	for o, a in opts:
+		if o in ("-h", "--help"):
+			print(__doc__)
+			sys.exit(0)
+		elif o == "--commits":
+			commit_count = int(a)
+		elif o == "--pulls":
+			pull_count = int(a)
+		elif o == "--members":
+			member_count = int(a)
+		elif o == "--latency":
+			latency = int(a)
+		elif o == "--repeat":
+			repeat = int(a)
+		elif o == "--scenarios":
+			scenarios = [scenario for scenario in a.split(",") if scenario]
+		elif o == "--script":
+			script_path = os.path.abspath(a)
+		elif o == "--output":
+			output_path = a
+		elif o == "--keep":
+			keep = True
+		elif o == "--compare":
+			if len(args) != 2:
+				print("--compare needs a baseline and a results file")
+				sys.exit(1)
+
+			compare(*args)
+			sys.exit(0)
+
+	for scenario in scenarios:
+		if scenario not in SCENARIOS:
+			print("Unknown scenario %s, use one of %s" % (scenario, ", ".join(SCENARIOS)))
+			sys.exit(1)
+
+	workspace = tempfile.mkdtemp(prefix="gitpr-bench-")
+
+	try:
+		print("Creating a repository with %s commits and %s pull requests in %s" % (
+			commit_count, pull_count, workspace
+		))
+		sys.stdout.flush()
+
+		work_path, pulls_file, master_sha = create_workspace(
+			workspace, commit_count, pull_count, member_count
+		)
+		bin_path = create_git_wrapper(workspace)
+
+		github = FakeGitHub(
+			port=0,
+			repo="%s/%s" % (OWNER, REPO),
+			pulls_file=pulls_file,
+			members=member_count,
+			latency=latency,
+			rate_limit=10 ** 9,
+		).start()
+
+		git("config", "git-pull-request.api-url", github.url, cwd=work_path)
+
+		results = run_scenarios(
+			script_path, work_path, pulls_file, master_sha, bin_path, github,
+			scenarios, repeat, pull_count,
+		)
+
+		github.stop()
+	finally:
+		if keep:
+			print("Kept the workspace in %s" % workspace)
+		else:
+			shutil.rmtree(workspace, ignore_errors=True)
+
+	if output_path:
+		with open(output_path, "w") as f:
+			json.dump(
+				{
+					"meta": {
+						"date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+						"commits": commit_count,
+						"pulls": pull_count,
+						"members": member_count,
+						"latency": latency,
+						"repeat": repeat,
+						"script": script_path,
+						"python": platform.python_version(),
+						"git": git("--version"),
+					},
+					"results": results,
+				},
+				f,
+				indent=4,
+				sort_keys=True,
+			)
+
+		print("Saved the results to %s" % output_path)
+
+
+if __name__ == "__main__":
+	main()
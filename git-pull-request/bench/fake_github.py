@@ -0,0 +1,690 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the parts of the GitHub API used by git-pull-request.py, so
+its performance can be measured and regression-tested without a network.
+
+Usage:
+
+	fake_github.py [<options>]
+
+	Point gitpr at it with:
+
+		git config git-pull-request.api-url http://127.0.0.1:<port>
+
+Options:
+
+	--port <port>
+		Port to listen on (default 8765, 0 picks a free port).
+
+	--repo <owner/repo>
+		Repository that owns the generated pull requests (default
+		liferay/liferay-portal).
+
+	--pulls <count>
+		Number of generated open pull requests (default 50).
+
+	--pulls-file <file>
+		JSON list of pull request fields (number, title, body, user, head_ref,
+		head_sha, head_repo, base_ref, base_sha, files) used instead of
+		generated ones. files is the list served by pulls/<n>/files.
+
+	--members <count>
+		Number of generated organization members (default 100).
+
+	--body-size <bytes>
+		Size of each generated pull request body (default 2000).
+
+	--per-page <count>
+		Default page size of listings (default 30, like GitHub).
+
+	--latency <milliseconds>
+		Delay added to every response (default 0).
+
+	--fail-every <count>
+		Answer every <count>th request with a 502 (default 0, never).
+
+	--rate-limit <count>
+		Number of requests allowed before answering 403 (default 5000).
+
+	--token <token>
+		Reject requests that do not send this bearer token.
+
+Besides the GitHub endpoints it serves GET /_stats with the number of requests
+received per endpoint, and POST /_reset to zero them.
+"""
+
+import getopt
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOREM = (
+	"Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod "
+	"tempor incididunt ut labore et dolore magna aliqua. "
+)
+
+
+def fake_sha(*parts):
+	return hashlib.sha1("-".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def build_repo(owner, name, html_base):
+	"""Returns a repository payload with the fields GitHub sends, most of which
+	gitpr never reads"""
+
+	full_name = "%s/%s" % (owner, name)
+
+	repo = {
+		"id": int(fake_sha(full_name)[0:8], 16),
+		"node_id": fake_sha("node", full_name)[0:20],
+		"name": name,
+		"full_name": full_name,
+		"private": False,
+		"owner": build_user(owner, html_base),
+		"html_url": "%s/%s" % (html_base, full_name),
+		"description": "Fake repository %s" % full_name,
+		"fork": owner != "liferay",
+		"ssh_url": "git@github.com:%s.git" % full_name,
+		"clone_url": "%s/%s.git" % (html_base, full_name),
+		"git_url": "git://github.com/%s.git" % full_name,
+		"default_branch": "master",
+		"open_issues": 0,
+		"open_issues_count": 0,
+		"forks_count": 0,
+		"stargazers_count": 0,
+		"watchers_count": 0,
+		"size": 1024,
+		"created_at": "2011-01-01T00:00:00Z",
+		"updated_at": "2020-01-01T00:00:00Z",
+		"pushed_at": "2020-01-01T00:00:00Z",
+	}
+
+	for key in (
+		"archive", "assignees", "blobs", "branches", "collaborators", "comments",
+		"commits", "compare", "contents", "contributors", "deployments",
+		"downloads", "events", "forks", "git_commits", "git_refs", "git_tags",
+		"hooks", "issue_comment", "issue_events", "issues", "keys", "labels",
+		"languages", "merges", "milestones", "notifications", "pulls", "releases",
+		"stargazers", "statuses", "subscribers", "subscription", "tags", "teams",
+		"trees",
+	):
+		repo["%s_url" % key] = "https://api.github.com/repos/%s/%s" % (full_name, key)
+
+	return repo
+
+
+def build_user(login, html_base):
+	user = {
+		"login": login,
+		"id": int(fake_sha("user", login)[0:8], 16),
+		"node_id": fake_sha("user-node", login)[0:20],
+		"type": "User",
+		"site_admin": False,
+		"html_url": "%s/%s" % (html_base, login),
+		"avatar_url": "https://avatars.githubusercontent.com/u/1?v=4",
+		"gravatar_id": "",
+	}
+
+	for key in (
+		"events", "followers", "following", "gists", "organizations",
+		"received_events", "repos", "starred", "subscriptions",
+	):
+		user["%s_url" % key] = "https://api.github.com/users/%s/%s" % (login, key)
+
+	return user
+
+
+class FakeGitHub(object):
+	"""Holds the fake API state and serves it on a background thread"""
+
+	def __init__(
+		self,
+		port=8765,
+		repo="liferay/liferay-portal",
+		pulls=50,
+		pulls_file=None,
+		members=100,
+		body_size=2000,
+		per_page=30,
+		latency=0,
+		fail_every=0,
+		rate_limit=5000,
+		token=None,
+		html_base="https://github.com",
+	):
+		self.repo = repo
+		self.per_page = per_page
+		self.latency = latency
+		self.fail_every = fail_every
+		self.received = 0
+		self.rate_limit = rate_limit
+		self.rate_remaining = rate_limit
+		self.token = token
+		self.html_base = html_base
+
+		self.lock = threading.Lock()
+		self.stats = {}
+		self.comments = {}
+		self.files = {}
+
+		self.org = repo.split("/")[0]
+		self.members = ["user%s" % index for index in range(1, members + 1)]
+
+		fixtures = []
+
+		if pulls_file:
+			with open(pulls_file) as f:
+				fixtures = json.load(f)
+		else:
+			fixtures = [{"number": number} for number in range(1, pulls + 1)]
+
+		body = (LOREM * (body_size // len(LOREM) + 1))[0:body_size]
+
+		self.pulls = {}
+
+		for fixture in fixtures:
+			pull = self.build_pull(fixture, body)
+			self.pulls[pull["number"]] = pull
+			self.files[pull["number"]] = self.build_files(fixture)
+
+		self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler_class())
+		self.server.daemon_threads = True
+		self.port = self.server.server_address[1]
+		self.thread = None
+
+	@property
+	def url(self):
+		return "http://127.0.0.1:%s" % self.port
+
+	def build_pull(self, fixture, body):
+		number = int(fixture["number"])
+		login = fixture.get("user")
+
+		if not login:
+			login = self.members[number % len(self.members)] if self.members else "user1"
+
+		head_ref = fixture.get("head_ref", "LPS-%s-fake-change" % (1000 + number))
+		owner, name = self.repo.split("/")
+
+		head_repo = build_repo(login, name, self.html_base)
+
+		if fixture.get("head_repo"):
+			head_repo["html_url"] = fixture["head_repo"]
+
+		updated_at = time.strftime(
+			"%Y-%m-%dT%H:%M:%SZ", time.gmtime(1600000000 + number * 3600)
+		)
+
+		return {
+			"url": "https://api.github.com/repos/%s/pulls/%s" % (self.repo, number),
+			"id": number + 100000,
+			"node_id": fake_sha("pull-node", number)[0:20],
+			"html_url": "%s/%s/pull/%s" % (self.html_base, self.repo, number),
+			"diff_url": "%s/%s/pull/%s.diff" % (self.html_base, self.repo, number),
+			"patch_url": "%s/%s/pull/%s.patch" % (self.html_base, self.repo, number),
+			"issue_url": "https://api.github.com/repos/%s/issues/%s" % (self.repo, number),
+			"number": number,
+			"state": fixture.get("state", "open"),
+			"locked": False,
+			"title": fixture.get("title", "LPS-%s Fake change number %s" % (1000 + number, number)),
+			"user": build_user(login, self.html_base),
+			"body": fixture.get("body", body),
+			"labels": [],
+			"milestone": None,
+			"active_lock_reason": None,
+			"created_at": updated_at,
+			"updated_at": updated_at,
+			"closed_at": None,
+			"merged_at": None,
+			"merge_commit_sha": None,
+			"assignee": None,
+			"assignees": [],
+			"requested_reviewers": [],
+			"requested_teams": [],
+			"draft": False,
+			"head": {
+				"label": "%s:%s" % (login, head_ref),
+				"ref": head_ref,
+				"sha": fixture.get("head_sha", fake_sha("head", number)),
+				"user": build_user(login, self.html_base),
+				"repo": head_repo,
+			},
+			"base": {
+				"label": "%s:%s" % (owner, fixture.get("base_ref", "master")),
+				"ref": fixture.get("base_ref", "master"),
+				"sha": fixture.get("base_sha", fake_sha("base", number)),
+				"user": build_user(owner, self.html_base),
+				"repo": build_repo(owner, name, self.html_base),
+			},
+			"author_association": "CONTRIBUTOR",
+			"auto_merge": None,
+		}
+
+	def build_files(self, fixture):
+		"""Returns the changed files of a pull request, as listed by
+		pulls/<n>/files"""
+
+		number = int(fixture["number"])
+
+		files = fixture.get("files") or [
+			{
+				"filename": "modules/pull%s/src/Change%s.%s" % (number, index, extension),
+				"status": "added",
+				"additions": 2,
+				"deletions": 0,
+			}
+			for index, extension in enumerate(("java", "js", "jsp", "css"))
+		]
+
+		for file in files:
+			file.setdefault("sha", fake_sha("file", number, file["filename"]))
+			file.setdefault("changes", file["additions"] + file["deletions"])
+
+		return files
+
+	def build_profile(self, login):
+		index = login[4:] if login.startswith("user") else login
+
+		return {
+			"login": login,
+			"id": int(fake_sha("user", login)[0:8], 16),
+			"name": "Fake User%s" % index,
+			"email": "fake.user%s@liferay.com" % index if int(fake_sha(login), 16) % 2 else None,
+			"company": "Liferay",
+			"bio": None,
+			"public_repos": 10,
+			"followers": 0,
+			"following": 0,
+			"created_at": "2011-01-01T00:00:00Z",
+		}
+
+	def count(self, endpoint):
+		with self.lock:
+			self.stats[endpoint] = self.stats.get(endpoint, 0) + 1
+
+	def handler_class(self):
+		fake = self
+
+		class Handler(FakeGitHubHandler):
+			github = fake
+
+		return Handler
+
+	def start(self):
+		self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+		self.thread.start()
+
+		return self
+
+	def stop(self):
+		self.server.shutdown()
+		self.server.server_close()
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+	protocol_version = "HTTP/1.1"
+
+	# the headers and the body are separate writes, which would otherwise wait
+	# for delayed ACKs on kept alive connections
+
+	disable_nagle_algorithm = True
+
+	github = None
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		self.dispatch("GET")
+
+	def do_PATCH(self):
+		self.dispatch("PATCH")
+
+	def do_POST(self):
+		self.dispatch("POST")
+
+	def dispatch(self, method):
+		github = self.github
+		url = urllib.parse.urlparse(self.path)
+		query = dict(urllib.parse.parse_qsl(url.query))
+		path = url.path.strip("/")
+
+		if path == "_stats":
+			with github.lock:
+				stats = dict(github.stats)
+
+			return self.send_json(200, {"requests": sum(stats.values()), "endpoints": stats})
+		elif path == "_reset":
+			with github.lock:
+				github.stats = {}
+				github.rate_remaining = github.rate_limit
+
+			return self.send_json(200, {})
+
+		body = None
+		length = int(self.headers.get("Content-Length") or 0)
+
+		if length:
+			body = json.loads(self.rfile.read(length).decode("utf-8"))
+
+		if github.latency:
+			time.sleep(github.latency / 1000.0)
+
+		with github.lock:
+			github.received += 1
+
+			failed = github.fail_every and github.received % github.fail_every == 0
+
+		if failed:
+			github.count("failed")
+
+			return self.send_json(502, {"message": "Server Error"})
+
+		if github.token and self.headers.get("Authorization") != "Bearer %s" % github.token:
+			github.count("unauthorized")
+
+			return self.send_json(401, {"message": "Bad credentials"})
+
+		with github.lock:
+			if github.rate_remaining <= 0:
+				limited = True
+			else:
+				limited = False
+				github.rate_remaining -= 1
+
+		if limited:
+			github.count("rate-limited")
+
+			return self.send_json(403, {"message": "API rate limit exceeded"})
+
+		for pattern, endpoint in ROUTES:
+			m = re.match(pattern, path)
+
+			if m:
+				github.count("%s %s" % (method, endpoint.__name__[6:]))
+
+				return endpoint(self, method, query, body, *m.groups())
+
+		github.count("not-found")
+
+		self.send_json(404, {"message": "Not Found"})
+
+	def send_json(self, status, data, headers=None):
+		payload = json.dumps(data).encode("utf-8")
+		etag = '"%s"' % hashlib.sha1(payload).hexdigest()
+
+		if status == 200 and self.command == "GET" and self.headers.get("If-None-Match") == etag:
+			status = 304
+			payload = b""
+
+		github = self.github
+
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json; charset=utf-8")
+		self.send_header("Content-Length", str(len(payload)))
+		self.send_header("ETag", etag)
+		self.send_header("X-RateLimit-Limit", str(github.rate_limit))
+		self.send_header("X-RateLimit-Remaining", str(max(github.rate_remaining, 0)))
+		self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+		self.send_header("X-RateLimit-Used", str(github.rate_limit - github.rate_remaining))
+
+		for key, value in (headers or {}).items():
+			self.send_header(key, value)
+
+		self.end_headers()
+		self.wfile.write(payload)
+
+	def send_page(self, query, items):
+		"""Sends one page of the items along with GitHub's Link header"""
+
+		per_page = min(int(query.get("per_page", self.github.per_page)), 100)
+		page = max(int(query.get("page", 1)), 1)
+		last_page = max((len(items) + per_page - 1) // per_page, 1)
+
+		links = []
+
+		def page_url(number):
+			page_query = dict(query)
+			page_query["page"] = str(number)
+
+			return "<%s/%s?%s>" % (
+				self.github.url,
+				urllib.parse.urlparse(self.path).path.strip("/"),
+				urllib.parse.urlencode(page_query),
+			)
+
+		if page < last_page:
+			links.append('%s; rel="next"' % page_url(page + 1))
+			links.append('%s; rel="last"' % page_url(last_page))
+
+		if page > 1:
+			links.append('%s; rel="first"' % page_url(1))
+			links.append('%s; rel="prev"' % page_url(page - 1))
+
+		headers = {}
+
+		if links:
+			headers["Link"] = ", ".join(links)
+
+		self.send_json(200, items[(page - 1) * per_page:page * per_page], headers)
+
+
+def route_comments(handler, method, query, body, repo, number):
+	github = handler.github
+	comments = github.comments.setdefault((repo, int(number)), [])
+
+	if method == "POST":
+		comment = {
+			"id": len(comments) + 1,
+			"body": body.get("body", ""),
+			"user": build_user("user1", github.html_base),
+		}
+
+		with github.lock:
+			comments.append(comment)
+
+		return handler.send_json(201, comment)
+
+	handler.send_page(query, comments)
+
+
+def route_members(handler, method, query, body, org):
+	github = handler.github
+
+	handler.send_page(
+		query, [build_user(login, github.html_base) for login in github.members]
+	)
+
+
+def route_pull(handler, method, query, body, repo, number):
+	github = handler.github
+	pull = github.pulls.get(int(number))
+
+	if pull is None:
+		return handler.send_json(404, {"message": "Not Found"})
+
+	if method in ("PATCH", "POST"):
+		with github.lock:
+			for key in ("state", "title", "body", "base"):
+				if key in body:
+					if key == "base":
+						pull["base"]["ref"] = body["base"]
+					else:
+						pull[key] = body[key]
+
+			if pull["state"] == "closed" and not pull["closed_at"]:
+				pull["closed_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+			pull["updated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+	handler.send_json(200, pull)
+
+
+def route_pull_files(handler, method, query, body, repo, number):
+	files = handler.github.files.get(int(number))
+
+	if files is None:
+		return handler.send_json(404, {"message": "Not Found"})
+
+	handler.send_page(query, files)
+
+
+def route_pulls(handler, method, query, body, repo):
+	github = handler.github
+
+	if method == "POST":
+		head = body.get("head", "")
+		login, _, head_ref = head.partition(":")
+
+		for pull in github.pulls.values():
+			if pull["state"] == "open" and pull["head"]["label"] == head:
+				return handler.send_json(422, {
+					"message": "Validation Failed",
+					"errors": [{"message": "A pull request already exists for %s." % head}],
+				})
+
+		with github.lock:
+			number = max(list(github.pulls) + [0]) + 1
+
+			pull = github.build_pull(
+				{
+					"number": number,
+					"user": login,
+					"head_ref": head_ref,
+					"base_ref": body.get("base", "master"),
+					"title": body.get("title", ""),
+					"body": body.get("body", ""),
+				},
+				"",
+			)
+
+			github.pulls[number] = pull
+
+		return handler.send_json(201, pull)
+
+	state = query.get("state", "open")
+
+	pulls = [
+		pull for pull in github.pulls.values()
+		if state == "all" or pull["state"] == state
+	]
+
+	if "head" in query:
+		pulls = [pull for pull in pulls if pull["head"]["label"] == query["head"]]
+
+	if "base" in query:
+		pulls = [pull for pull in pulls if pull["base"]["ref"] == query["base"]]
+
+	sort_key = query.get("sort", "created")
+
+	if sort_key not in ("created", "updated"):
+		sort_key = "created"
+
+	pulls.sort(
+		key=lambda pull: (pull["%s_at" % sort_key], pull["number"]),
+		reverse=query.get("direction", "desc") == "desc",
+	)
+
+	handler.send_page(query, pulls)
+
+
+def route_repos(handler, method, query, body, login=None):
+	github = handler.github
+	owner, name = github.repo.split("/")
+
+	if login is None:
+		login = github.members[0] if github.members else owner
+
+	repo = build_repo(login, name, github.html_base)
+	repo["open_issues"] = repo["open_issues_count"] = len(github.pulls)
+
+	handler.send_page(query, [repo])
+
+
+def route_forks(handler, method, query, body, repo):
+	github = handler.github
+	name = repo.split("/")[1]
+
+	handler.send_page(
+		query,
+		[build_repo(login, name, github.html_base) for login in github.members],
+	)
+
+
+def route_user(handler, method, query, body, login):
+	handler.send_json(200, handler.github.build_profile(login))
+
+
+ROUTES = (
+	(r"^repos/([^/]+/[^/]+)/pulls$", route_pulls),
+	(r"^repos/([^/]+/[^/]+)/pulls/(\d+)$", route_pull),
+	(r"^repos/([^/]+/[^/]+)/pulls/(\d+)/files$", route_pull_files),
+	(r"^repos/([^/]+/[^/]+)/issues/(\d+)/comments$", route_comments),
+	(r"^repos/([^/]+/[^/]+)/forks$", route_forks),
+	(r"^orgs/([^/]+)/members$", route_members),
+	(r"^users/([^/]+)/repos$", route_repos),
+	(r"^users/([^/]+)$", route_user),
+	(r"^user/repos$", route_repos),
+)
+
+
+def main():
+	try:
+		opts, args = getopt.gnu_getopt(
+			sys.argv[1:],
+			"h",
+			[
+				"help",
+				"port=",
+				"repo=",
+				"pulls=",
+				"pulls-file=",
+				"members=",
+				"body-size=",
+				"per-page=",
+				"latency=",
+				"fail-every=",
+				"rate-limit=",
+				"token=",
+			],
+		)
+	except getopt.GetoptError as e:
+		print("%s\nFor help use --help" % e)
+		sys.exit(1)
+
+	kwargs = {}
+
+	for o, a in opts:
+		if o in ("-h", "--help"):
+			print(__doc__)
+			sys.exit(0)
+		elif o in ("--repo", "--token"):
+			kwargs[o[2:]] = a
+		elif o == "--pulls-file":
+			kwargs["pulls_file"] = a
+		else:
+			kwargs[o[2:].replace("-", "_")] = int(a)
+
+	github = FakeGitHub(**kwargs)
+
+	print("Serving %s pull requests for %s on %s" % (
+		len(github.pulls), github.repo, github.url
+	))
+	sys.stdout.flush()
+
+	try:
+		github.server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
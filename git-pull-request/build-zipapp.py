@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Packages git-pull-request.py as a zipapp with precompiled bytecode, which
+git-pull-request.sh runs instead of the script for as long as it is newer than
+the script.
+
+Usage:
+
+	build-zipapp.py [<output>]
+
+The zipapp is written to gitpr.pyz next to this script by default. It holds the
+bytecode compiled by the running python3, and the source as a fallback for other
+Python versions.
+"""
+
+import os
+import py_compile
+import shutil
+import sys
+import tempfile
+import zipapp
+
+SCRIPT_PATH = os.path.join(
+	os.path.dirname(os.path.abspath(__file__)), "git-pull-request.py"
+)
+
+MAIN = """import gitpr
+
+gitpr.run()
+"""
+
+
+def build(output_path):
+	build_path = tempfile.mkdtemp(prefix="gitpr-zipapp-")
+
+	try:
+		shutil.copyfile(SCRIPT_PATH, os.path.join(build_path, "gitpr.py"))
+
+		# zipimport loads gitpr.pyc before gitpr.py, and an unchecked hash
+		# pyc is used without comparing it to the timestamp of the source
+
+		py_compile.compile(
+			os.path.join(build_path, "gitpr.py"),
+			cfile=os.path.join(build_path, "gitpr.pyc"),
+			dfile="gitpr.py",
+			doraise=True,
+			invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+		)
+
+		with open(os.path.join(build_path, "__main__.py"), "w") as f:
+			f.write(MAIN)
+
+		zipapp.create_archive(
+			build_path, output_path, interpreter="/usr/bin/env python3"
+		)
+	finally:
+		shutil.rmtree(build_path)
+
+
+def main():
+	output_path = os.path.join(os.path.dirname(SCRIPT_PATH), "gitpr.pyz")
+
+	if len(sys.argv) > 1:
+		output_path = sys.argv[1]
+
+	build(output_path)
+
+	print("Built %s" % output_path)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,121 @@
+#!/bin/bash
+
+# Bash completion for gitpr. Add the following line to your bash profile, after
+# the gitpr alias:
+# source YOUR_DIRECTORY/git-pull-request/git-pull-request-completion.bash
+#
+# The commands, open pull requests, branches and user aliases are read from the
+# gitpr-completion file of the git directory, which "gitpr" (show) and
+# "gitpr sync" write, so that completing never runs gitpr or asks github.
+
+_gitpr() {
+	local cur=${COMP_WORDS[COMP_CWORD]}
+	local prev=${COMP_WORDS[COMP_CWORD-1]}
+
+	COMPREPLY=()
+
+	local git_dir
+	git_dir=`git rev-parse --git-common-dir 2>/dev/null` || return
+
+	local cache="$git_dir/gitpr-completion"
+
+	if [ ! -f "$cache" ]; then
+		return
+	fi
+
+	# The command is the first word that is neither an option nor its value
+	local command=
+	local i=1
+
+	while [ $i -lt $COMP_CWORD ]; do
+		case ${COMP_WORDS[i]} in
+			-r|-u|-b|-l|--repo|--reviewer|--update-branch|--fetch-filter|--older-than|--profile-trace)
+				i=$((i+1))
+				;;
+			-*)
+				;;
+			*)
+				command=${COMP_WORDS[i]}
+				break
+				;;
+		esac
+
+		i=$((i+1))
+	done
+
+	local kinds
+
+	case $prev in
+		-u|--reviewer)
+			kinds=alias
+			;;
+		-r|--repo|-b|-l|--update-branch|--fetch-filter|--older-than|--profile-trace)
+			return
+			;;
+		*)
+			case $command in
+				"")
+					# "gitpr <pull request ID>" fetches the pull request
+					if [[ $cur == [0-9]* ]]; then
+						kinds=pull
+					else
+						kinds=command
+					fi
+					;;
+				close|comment|fetch|forward|merge-train|open|review-queue|stats)
+					kinds=pull
+					;;
+				update)
+					kinds="pull branch"
+					;;
+				sync-origin)
+					kinds=sync-branch
+					;;
+				alias|show-alias)
+					kinds=alias
+					;;
+				server)
+					COMPREPLY=(`compgen -W "start stop status run" -- "$cur"`)
+					return
+					;;
+				*)
+					return
+					;;
+			esac
+			;;
+	esac
+
+	local kind word title
+	local words=()
+	local pulls=()
+
+	while IFS=$'\t' read -r kind word title; do
+		case " $kinds " in
+			*" $kind "*)
+				;;
+			*)
+				continue
+				;;
+		esac
+
+		if [[ $word != "$cur"* ]]; then
+			continue
+		fi
+
+		words+=("$word")
+
+		if [ "$kind" = pull ]; then
+			pulls+=("$word  $title")
+		fi
+	done < "$cache"
+
+	# Pull requests are listed with their titles, and only the number is
+	# inserted once a single one is left
+	if [ ${#words[@]} -gt 1 ] && [ ${#pulls[@]} -eq ${#words[@]} ]; then
+		COMPREPLY=("${pulls[@]}")
+	else
+		COMPREPLY=("${words[@]}")
+	fi
+}
+
+complete -F _gitpr gitpr
@@ -26,6 +26,27 @@ Options:
 	-b <branch>, --update-branch <branch>
 		Specify the target branch on the reviewer github repository to submit the pull request.
 
+	--fetch-filter <filter>
+		Fetch the pull requests for conflicts, fetch-all, review-queue and stats
+		with this object filter (blob:none or tree:0), see the fetch-filter setting.
+
+	--older-than <days>
+		Make close and comment act on the open pull requests that have not been
+		updated in that many days, after listing them and asking for
+		confirmation.
+
+	--dry-run
+		Print the git commands that would change the repository instead of
+		running them. Requests to github are still sent.
+
+	--profile
+		Time every git process and github request and print a summary grouped by
+		command when done.
+
+	--profile-trace <file>
+		Same as --profile, and also write the timings to the file in the Chrome
+		trace format (open it with chrome://tracing or https://ui.perfetto.dev).
+
 Commands:
 
 	#no command#
@@ -42,6 +63,18 @@ Commands:
 		Closes the current pull request on github and deletes the pull request
 		branch.
 
+	close <pull request ID>... [<comment>]
+		Closes the pull requests on github at the same time, without touching
+		the local branches, and reports the ones that could not be closed.
+
+	comment <comment> [<pull request ID>...]
+		Posts the comment on the current pull request, or on the pull requests
+		at the same time.
+
+	conflicts
+		Fetches all open pull requests and reports which pairs of them touch
+		the same files and which of those would conflict when merged together.
+
 	continue-update, cu
 		Continues the current update after conflicts have been fixed.
 
@@ -52,6 +85,10 @@ Commands:
 	fetch-all
 		Fetches all open pull requests into local branches.
 
+	find <JIRA ticket>
+		Lists the pull requests, open or closed, that mention the JIRA ticket
+		in their title, body or branch, from the search index (see sync).
+
 	forward <pull request ID>
 		Forwards the specified pull request, set -u or --reviewer to specify a different reviewer.
 
@@ -69,26 +106,83 @@ Commands:
 		Merges the current pull request branch into the update-branch and deletes the
 		branch.
 
+	merge-train <pull request ID>... [<comment>]
+		Merges the pull requests, in order, into the update-branch without
+		checking anything out: each one is trial merged onto the result of the
+		previous ones, the ones that conflict are skipped and reported, and the
+		update-branch is moved once at the end. The merged branches are then
+		deleted and the pull requests closed at the same time (with
+		merge-auto-close).
+
+	of-interest [<commit or range>] [<file types>]
+		Lists the commits in the range (HEAD^..HEAD by default) that change
+		files matching the 'of-interest-file-types' globs, followed by the number
+		of changed files per extension. Paths under 'of-interest-ignore-paths'
+		are skipped.
+
 	open [<pull request ID>]
 		Opens either the current pull request or the specified request on
 		github.
 
+	prune
+		Deletes the local pull request branches of the pull requests that are
+		closed, along with their metadata, in a single ref transaction. Each
+		pull request is looked up in the search index of the repository it was
+		fetched from, which prune syncs first (see sync). Branches with commits that the pull request does not have, and branches
+		checked out in a worktree or the work-dir, are kept.
+
 	pull
 		Pulls remote changes from the other user's remote branch into the local
 		pull request branch.
 
+	review-queue [<pull request ID>...]
+		Fetches the pull requests (all the open ones by default) in a single
+		fetch and checks out each of them in its own worktree, in a
+		<work tree>-review directory next to the main work tree by default
+		(see the review-dir setting). The worktrees of pull requests that are
+		no longer open are reused, so only the files that differ are written.
+		close and merge work from inside the worktrees, and remove them, before
+		anything is changed on github.
+
+	search <terms>
+		Lists the pull requests, open or closed, whose title, body, author or
+		branch contain all the words, from the search index (see sync). Nothing
+		is sent to github.
+
+	server [start|stop|status|run]
+		Starts a server that keeps running in the background, so that
+		git-pull-request.sh can send it the commands instead of starting
+		Python every time. It reuses the github connections, the git config,
+		the alias map and the github responses between commands. run keeps it
+		in the foreground. The server stops by itself when this script changes.
+		The commands that may open an editor (continue-update, merge, pull,
+		update, and fetch when it updates the branch) are run by the client.
+
 	show-alias <alias>
 		Shows the github username pointed by the indicated alias.
 
-	stats
+	stats [--name-only] [<pull request ID>]
 		Fetches all open pull requests on this repository and displays them along
 		with statistics about the pull requests and how many changes (along with how many
-		changes by type).
+		changes by type). With --name-only, lists the changed files instead of
+		counting the changed lines, which needs no file contents.
 
 	submit [<pull body>] [<pull title>]
 		Pushes a branch and sends a pull request to the user's reviewer on
 		github.
 
+	sync
+		Updates the search index used by search and find with the pull requests
+		updated on github since the last sync, open and closed ones. The first
+		sync reads all of them. Each repository has its own index. show also
+		updates the open pull requests in the index. Both refresh the words completed by
+		git-pull-request-completion.bash.
+
+	sync-origin [<branch>...]
+		Fetches the branches (the update-branch by default) from upstream in a
+		single fetch, fast-forwards the local branches without checking them out
+		and pushes all of them to origin at once.
+
 	update [<pull request ID or branch name>]
 		Updates the current pull request or the specified request with the local
 		changes in the update-branch, using either a rebase or merge.
@@ -110,29 +204,48 @@ Miguel Pastor<miguel.pastor@liferay.com>
 Released under the MIT License.
 """
 
-import base64
 import codecs
+import fnmatch
+import functools
 import getopt
-import getpass
-import io
+import itertools
 import json
 import os
 import re
+import shlex
+import shutil
+import subprocess
 import sys
-import sys
-import tempfile
-import urllib
-import urllib3
-import webbrowser
+import threading
+import time
+import urllib.parse
 
 from string import Template
-from textwrap import fill
 
-UTF8Writer = codecs.getwriter("utf8")
-sys.stdout = io.TextIOWrapper(sys.stdout.detach(), encoding='utf-8')
+# concurrent.futures, getpass, tempfile, textwrap, urllib3 and webbrowser are
+# imported by the functions that use them, so that commands like help and
+# show-alias start without loading them
+
+sys.stdout.reconfigure(encoding="utf-8")
 
 options = {
+	# Seconds to wait for github to accept a connection, and for each read of a
+	# response.
+	"api-connect-timeout": 10,
+	"api-read-timeout": 60,
+	# Number of times a github request is retried after a connection error, a
+	# server error or a secondary rate limit, waiting longer each time.
+	"api-retries": 3,
+	# Seconds that each attempt of a github request may take in total, to
+	# connect and to read the answer.
+	"api-timeout": 60,
+	# Base URL of the GitHub API. Change it for GitHub Enterprise or to point at a
+	# local stand-in such as bench/fake_github.py.
+	"api-url": "https://api.github.com",
 	"debug-mode": False,
+	# Print the git commands that would change the repository instead of running
+	# them.
+	"dry-run": False,
 	# Color Scheme
 	"color-success": "green",
 	"color-status": "blue",
@@ -146,6 +259,10 @@ options = {
 	"color-display-info-repo-count": "magenta",
 	"color-display-info-total-title": "green",
 	"color-display-info-total-count": "magenta",
+	"color-of-interest-author": "cyan",
+	"color-of-interest-date": "green",
+	"color-of-interest-refs": "yellow",
+	"color-of-interest-sha": "red",
 	"color-stats-added": "yellow",
 	"color-stats-average-change": "magenta",
 	"color-stats-deleted": "red",
@@ -163,6 +280,13 @@ options = {
 	# Set to true to remove the newlines from the description of the pull
 	# (this will format it as it used to)
 	"description-strip-newlines": False,
+	# Object filter, such as blob:none or tree:0, used to fetch the pull requests
+	# for conflicts, fetch-all, review-queue and stats.
+	# The repository becomes a partial clone, with a 'pull-requests-<hash>'
+	# remote for every repository the pull requests come from, which git
+	# downloads the missing objects from when they are needed, so update and
+	# merge keep working on the branches.
+	"fetch-filter": None,
 	# Determines whether fetch will automatically checkout the new branch.
 	"fetch-auto-checkout": False,
 	# Determines whether to automatically update a fetched pull request branch.
@@ -171,6 +295,10 @@ options = {
 	"fetch-auto-update": False,
 	# Whether to show pull requests for the entire repo or just the update-branch.
 	"filter-by-update-branch": True,
+	# Space separated globs of the files listed by the of-interest command.
+	"of-interest-file-types": "*.js *.css *.jsp* *.vm *.ftl",
+	# Space separated paths that the of-interest command skips entirely.
+	"of-interest-ignore-paths": "portal-web/test/",
 	# Determines whether to automatically close pull requests after merging
 	# them.
 	"merge-auto-close": True,
@@ -184,6 +312,11 @@ options = {
 	# are still substituted in, allowing you to send them to another script in any order
 	# Example: '`git log --oneline ${merge_base}..${branch_name} && echo "${committers}"'
 	"stats-footer": None,
+	# Where the stats command reads the changes of a pull request from: 'local'
+	# fetches it and diffs it, 'remote' asks the github API, and 'auto' diffs
+	# the pull requests whose objects are present and asks the API for the
+	# others.
+	"stats-source": "auto",
 	# A string to be used to format the message sent with a submitted pull.
 	# Available variables:
 	# ${merge_base}: SHA of the merge base of this branch
@@ -209,31 +342,185 @@ options = {
 	"user-organization": "liferay",
 	# Determines whether to open newly submitted pull requests on github
 	"submit-open-github": True,
+	# Directory where review-queue creates the worktrees of the pull requests
+	# (a <work tree>-review directory next to the main work tree by default).
+	"review-dir": None,
 	# Sets a directory to be used for performing updates to prevent
 	# excessive rebuilding by IDE's. Warning: This directory will be hard reset
 	# every time an update is performed, so do not do any work other than
 	# conflict merges in the work directory.
 	"work-dir": None,
+	# Maximum number of git processes or API requests to run at the same time
+	# for commands that work on many pull requests at once.
+	"workers": 8,
 }
 
 URL_BASE = "https://api.github.com/%s"
 SCRIPT_NOTE = "GitPullRequest Script (by Liferay)"
-TMP_PATH = tempfile.gettempdir() + "/%s"
+TMP_PATH = None
 
 MAP_RESPONSE = {}
 
+EXECUTOR_HOOKS = []
+EXECUTOR_SEMAPHORE = None
+
+HTTP = None
+
+CHDIR_PATH = None
+
+# after this many github requests in a row fail, the next requests fail right
+# away until the cooldown is over
+
+CIRCUIT_COOLDOWN = 30
+CIRCUIT_FAILURES = 0
+CIRCUIT_LOCK = threading.Lock()
+CIRCUIT_OPEN_UNTIL = 0
+CIRCUIT_THRESHOLD = 5
+
+CONFIG_SNAPSHOTS = {}
+
+GIT_BATCH = None
+GIT_BATCH_LOCK = threading.Lock()
+GIT_CACHE = {}
+GIT_DIRS = {}
+
+PULL_REQUEST_BRANCHES = {}
+
+REQUEST_MEMO = {}
+REQUEST_MEMO_LOCK = threading.Lock()
+
+
+PROFILE_RECORDS = None
+PROFILE_START = None
+PROFILE_TRACE_PATH = None
+
+# github responses kept by the server to revalidate them with their ETags
+
+RESPONSE_CACHE = None
+
+SERVER_FALLBACK = 75
+SERVING = False
+SERVING_COMMAND = False
+
+USERS_CACHE = {}
+
+
+class PullRequest(object):
+	"""The fields of a github pull request that are read by gitpr, which are
+	kept instead of the complete API payload"""
+
+	__slots__ = (
+		"base_ref",
+		"base_repo_name",
+		"base_sha",
+		"body",
+		"head_ref",
+		"head_repo_html_url",
+		"head_repo_private",
+		"head_repo_ssh_url",
+		"head_sha",
+		"html_url",
+		"number",
+		"state",
+		"title",
+		"updated_at",
+		"user_login",
+	)
+
+	def __init__(self, data):
+		base = data["base"]
+		head = data["head"]
+
+		# the head repository is null when the fork has been deleted
+
+		head_repo = head.get("repo") or {}
+
+		self.base_ref = base.get("ref")
+		self.base_repo_name = (base.get("repo") or {}).get("full_name")
+		self.base_sha = base.get("sha")
+		self.body = data.get("body")
+		self.head_ref = head.get("ref")
+		self.head_repo_html_url = head_repo.get("html_url")
+		self.head_repo_private = head_repo.get("private", False)
+		self.head_repo_ssh_url = head_repo.get("ssh_url")
+		self.head_sha = head.get("sha")
+		self.html_url = data.get("html_url")
+		self.number = data["number"]
+		self.state = data.get("state")
+		self.title = data.get("title")
+		self.updated_at = data.get("updated_at")
+		self.user_login = (data.get("user") or {}).get("login")
+
+	def as_dict(self):
+		"""Returns the fields, along with the keys of the github API that they
+		come from, which the stats-footer templates use"""
+
+		data = dict((name, getattr(self, name)) for name in self.__slots__)
+
+		data.update({
+			"base": {
+				"ref": self.base_ref,
+				"repo": {"full_name": self.base_repo_name},
+				"sha": self.base_sha,
+			},
+			"head": {
+				"ref": self.head_ref,
+				"repo": {
+					"html_url": self.head_repo_html_url,
+					"private": self.head_repo_private,
+					"ssh_url": self.head_repo_ssh_url,
+				},
+				"sha": self.head_sha,
+			},
+			"user": {"login": self.user_login},
+		})
+
+		return data
+
+	@staticmethod
+	def object_hook(data):
+		"""Used as the json object_hook of pull request responses, so that each
+		pull request is reduced to its fields as soon as it is decoded"""
+
+		if "number" in data and "base" in data and "head" in data:
+			return PullRequest(data)
+
+		return data
+
+
+def branch_exists(branch_name):
+	"""Returns whether a local branch exists. Pull request branches are looked
+	up in a snapshot of refs/heads/pull-request-* that is taken once and kept
+	up to date by fetch_branch and delete_branch"""
+
+	if branch_name[0:13] != "pull-request-":
+		return bool(git_rev_parse("refs/heads/%s" % branch_name))
+
+	git_common_dir = get_git_dirs()[1]
+
+	if git_common_dir not in PULL_REQUEST_BRANCHES:
+		PULL_REQUEST_BRANCHES[git_common_dir] = set(
+			git_output(
+				"for-each-ref", "--format=%(refname:strip=2)",
+				"refs/heads/pull-request-*"
+			).splitlines()
+		)
+
+	return branch_name in PULL_REQUEST_BRANCHES[git_common_dir]
+
+
 def build_branch_name(pull_request):
 	"""Returns the local branch name that a pull request should be fetched into"""
-	ref = pull_request["head"]["ref"]
+	ref = pull_request.head_ref
 
-	request_id = pull_request["number"]
+	request_id = pull_request.number
 
 	branch_name = "pull-request-%s" % request_id
 
 	jira_ticket = get_jira_ticket(ref)
 
 	if not jira_ticket:
-		jira_ticket = get_jira_ticket(pull_request["title"])
+		jira_ticket = get_jira_ticket(pull_request.title)
 
 	if jira_ticket:
 		branch_name = "%s-%s" % (branch_name, jira_ticket)
@@ -253,120 +540,94 @@ def build_pull_request_title(branch_name):
 	return branch_name
 
 
+def cache_response(url, etag, link_header, data):
+	"""Keeps the body of a github response, so that the next request for the
+	same URL is sent with If-None-Match and can be answered with a 304"""
+
+	key = (url, auth_token)
+
+	RESPONSE_CACHE.pop(key, None)
+
+	if not etag:
+		return
+
+	# the oldest responses are dropped first
+
+	while len(RESPONSE_CACHE) >= 256:
+		RESPONSE_CACHE.pop(next(iter(RESPONSE_CACHE)))
+
+	RESPONSE_CACHE[key] = (etag, link_header, data)
+
+
 def chdir(dir):
-	f = open(get_tmp_path("git-pull-request-chdir"), "wb")
-	f.write(dir)
-	f.close()
+	"""Makes git-pull-request.sh change into the directory once the command
+	finishes"""
 
+	global CHDIR_PATH
 
-def close_pull_request(repo_name, pull_request_ID, comment=None):
-	default_comment = options["close-default-comment"]
+	CHDIR_PATH = dir
 
-	if comment is None:
-		comment = default_comment
+	f = open(get_tmp_path("git-pull-request-chdir"), "w")
+	f.write(dir)
+	f.close()
 
-	if comment is None or comment == default_comment:
-		try:
-			f = open(get_tmp_path("git-pull-request-treeish-%s" % pull_request_ID), "r")
-			branch_info = json.load(f)
-			f.close()
 
-			username = branch_info["username"]
+def check_circuit(succeeded=None):
+	"""Raises an error while github is considered down, after recording the
+	outcome of the last request when succeeded is not None"""
 
-			updated_parent_commit = ""
-			updated_head_commit = ""
-			original_parent_commit = ""
-			original_head_commit = ""
+	global CIRCUIT_FAILURES, CIRCUIT_OPEN_UNTIL
 
-			if "original" in branch_info:
-				original = branch_info["original"]
-				original_parent_commit = original["parent_commit"]
-				original_head_commit = original["head_commit"]
+	with CIRCUIT_LOCK:
+		if succeeded:
+			CIRCUIT_FAILURES = 0
+		elif succeeded is not None:
+			CIRCUIT_FAILURES += 1
 
-			if "updated" in branch_info:
-				updated = branch_info["updated"]
-				updated_parent_commit = updated["parent_commit"]
-				updated_head_commit = updated["head_commit"]
+			if CIRCUIT_FAILURES >= CIRCUIT_THRESHOLD:
+				CIRCUIT_OPEN_UNTIL = time.monotonic() + CIRCUIT_COOLDOWN
 
-			current_head_commit = os.popen("git rev-parse HEAD").read().strip()[0:10]
+			return
 
-			my_diff_comment = ""
+		wait = CIRCUIT_OPEN_UNTIL - time.monotonic()
 
-			diff_commit = False
+	if wait > 0:
+		raise UserWarning(
+			"Github failed %s requests in a row, try again in %d seconds"
+			% (CIRCUIT_FAILURES, wait + 1)
+		)
 
-			if original_head_commit != current_head_commit:
-				current_diff_tree = (
-					os.popen("git diff-tree -r -c -M -C --no-commit-id HEAD")
-					.read()
-					.strip()
-				)
-				original_diff_tree = (
-					os.popen(
-						"git diff-tree -r -c -M -C --no-commit-id %s"
-						% original_head_commit
-					)
-					.read()
-					.strip()
-				)
 
-				current_tree_commits = current_diff_tree.split("\n")
-				original_tree_commits = original_diff_tree.split("\n")
-
-				if len(current_tree_commits) == len(original_tree_commits):
-					for index, commit in enumerate(current_tree_commits):
-						current_commits = commit.split(" ")
-						original_commits = original_tree_commits[index].split(" ")
-
-						if (
-							len(current_commits) >= 4
-							and len(original_commits) >= 4
-							and current_commits[3] != original_commits[3]
-						):
-							diff_commit = True
-							break
-				else:
-					diff_commit = True
+def close_git_batch():
+	"""Stops the git cat-file process started by git_rev_parse"""
 
-			if (updated_head_commit or original_head_commit) == current_head_commit:
-				diff_commit = False
+	global GIT_BATCH
 
-			if diff_commit:
-				my_diff_comment = (
-					"\n\nView just my changes: https://github.com/%s/compare/%s:%s...%s"
-					% (
-						repo_name,
-						username,
-						updated_head_commit or original_head_commit,
-						current_head_commit,
-					)
-				)
+	with GIT_BATCH_LOCK:
+		if GIT_BATCH is None:
+			return
 
-			if comment is None:
-				comment = ""
+		cwd, process, start, size = GIT_BATCH
+		GIT_BATCH = None
 
-			new_pr_url = meta("new_pr_url")
+	process.stdin.close()
+	process.stdout.close()
+	process.wait()
 
-			if new_pr_url and new_pr_url != "":
-				comment += "\nPull request submitted at: %s" % new_pr_url
+	for hook in EXECUTOR_HOOKS:
+		hook(process.args, start, process.returncode, size, process.returncode != 0)
 
-			comment += my_diff_comment
 
-			comment += "\nView total diff: https://github.com/%s/compare/%s...%s" % (
-				repo_name,
-				(updated_parent_commit or original_parent_commit),
-				current_head_commit,
-			)
-		except Exception:
-			pass
+def close_pull_request(repo_name, pull_request_ID, comment=None):
+	comment = get_close_comment(repo_name, pull_request_ID, comment)
+
+	# the comment is posted first, so that it comes before the close on the
+	# pull request
 
 	if comment is not None and comment != "":
 		post_comment(repo_name, pull_request_ID, comment)
 
-	url = get_api_url("repos/%s/pulls/%s" % (repo_name, pull_request_ID))
-
-	params = {"state": "closed"}
-
-	github_json_request(url, params)
+	mark_pull_request_closed(repo_name, pull_request_ID)
 
 
 def color_text(text, token, bold=False):
@@ -417,16 +678,20 @@ def command_close(repo_name, comment=None):
 
 	display_pull_request(pull_request)
 
+	# a review worktree that cannot be removed leaves the pull request open
+
+	leave_review_worktree(branch_name)
+
 	close_pull_request(repo_name, pull_request_ID, comment)
 
 	update_branch_option = options["update-branch"]
 
-	ret = os.system("git checkout %s" % update_branch_option)
+	ret = git_run("checkout", update_branch_option)
 	if ret != 0:
 		raise UserWarning("Could not checkout %s" % update_branch_option)
 
 	print(color_text("Deleting branch %s" % branch_name, "status"))
-	ret = os.system("git branch -D %s" % branch_name)
+	ret = delete_branch(branch_name)
 	if ret != 0:
 		raise UserWarning("Could not delete branch")
 
@@ -436,6 +701,72 @@ def command_close(repo_name, comment=None):
 	display_status()
 
 
+def command_close_pull_requests(repo_name, pull_request_IDs, comment=None):
+	"""Closes the pull requests on github at the same time, leaving the local
+	branches alone"""
+
+	print(color_text("Closing %s pull requests" % len(pull_request_IDs), "status"))
+	print("")
+
+	if options["dry-run"]:
+		print("Would close %s" % ", ".join(map(str, pull_request_IDs)))
+		return
+
+	# the comments are all posted before the pull requests are closed, and
+	# the two are reported separately, since a pull request whose comment
+	# failed is still closed
+
+	comments = dict(
+		(pull_request_ID, get_close_comment(repo_name, pull_request_ID, comment))
+		for pull_request_ID in pull_request_IDs
+	)
+
+	commented_IDs = [
+		pull_request_ID for pull_request_ID in pull_request_IDs if comments[pull_request_ID]
+	]
+
+	comment_failures = 0
+
+	if commented_IDs:
+		results = github_gather(
+			[
+				functools.partial(
+					post_comment, repo_name, pull_request_ID, comments[pull_request_ID]
+				)
+				for pull_request_ID in commented_IDs
+			],
+			return_exceptions=True,
+		)
+
+		comment_failures = report_pull_requests(
+			commented_IDs, results, "Commented on", "comment on", False
+		)
+
+	results = github_gather(
+		[
+			functools.partial(mark_pull_request_closed, repo_name, pull_request_ID)
+			for pull_request_ID in pull_request_IDs
+		],
+		return_exceptions=True,
+	)
+
+	close_failures = report_pull_requests(
+		pull_request_IDs, results, "Closed", "close", False
+	)
+
+	if close_failures:
+		raise UserWarning(
+			"Could not close %s of %s pull requests"
+			% (close_failures, len(pull_request_IDs))
+		)
+
+	if comment_failures:
+		raise UserWarning(
+			"Closed the pull requests, but could not comment on %s of them"
+			% comment_failures
+		)
+
+
 def command_comment(repo_name, comment=None, pull_request_ID=None):
 	if pull_request_ID is None:
 		branch_name = get_current_branch_name()
@@ -447,6 +778,151 @@ def command_comment(repo_name, comment=None, pull_request_ID=None):
 		raise UserWarning("Please include a comment")
 
 
+def command_comment_pull_requests(repo_name, pull_request_IDs, comment):
+	"""Posts the comment on the pull requests at the same time"""
+
+	if not comment:
+		raise UserWarning("Please include a comment")
+
+	print(color_text(
+		"Commenting on %s pull requests" % len(pull_request_IDs), "status"
+	))
+	print("")
+
+	if options["dry-run"]:
+		print("Would comment on %s" % ", ".join(map(str, pull_request_IDs)))
+		return
+
+	results = github_gather(
+		[
+			functools.partial(post_comment, repo_name, pull_request_ID, comment)
+			for pull_request_ID in pull_request_IDs
+		],
+		return_exceptions=True,
+	)
+
+	report_pull_requests(pull_request_IDs, results, "Commented on", "comment on")
+
+
+def command_conflicts(repo_name):
+	"""Fetches all open pull requests and trial merges every pair of them that
+	changes the same files"""
+
+	print(color_text("Checking open pull requests for conflicts", "status"))
+	print("")
+
+	pull_requests = get_pull_requests(repo_name, options["filter-by-update-branch"])
+
+	branch_names = {}
+	path_index = {}
+
+	for pull_request in pull_requests:
+		pull_request_ID = pull_request.number
+
+		try:
+			branch_name = fetch_pull_request(
+				pull_request, repo_name, options["fetch-filter"]
+			)
+		except UserWarning as e:
+			print(color_text(
+				"Skipping pull request %s: %s" % (pull_request_ID, e), "warning"
+			))
+			continue
+
+		branch_names[pull_request_ID] = branch_name
+
+		merge_base = git_output(
+			"merge-base", options["update-branch"], branch_name, cache=True
+		)
+
+		paths = git_output(
+			"diff", "--name-only", "--no-renames", merge_base, branch_name
+		).splitlines()
+
+		for path in paths:
+			path_index.setdefault(path, set()).add(pull_request_ID)
+
+	overlaps = {}
+
+	for path, pull_request_IDs in path_index.items():
+		for pair in itertools.combinations(sorted(pull_request_IDs), 2):
+			overlaps.setdefault(pair, []).append(path)
+
+	def trial_merge(pair):
+		ret, output = run_command(
+			[
+				"git",
+				"merge-tree",
+				"--write-tree",
+				"--name-only",
+				"--no-messages",
+				branch_names[pair[0]],
+				branch_names[pair[1]],
+			],
+			read_only=True,
+			exit_codes=(0, 1),
+		)
+
+		output = output.decode("utf-8").splitlines()
+
+		if ret not in (0, 1):
+			raise UserWarning(
+				"Trial merge of %s and %s failed (git 2.38 or newer is required)"
+				% (branch_names[pair[0]], branch_names[pair[1]])
+			)
+
+		# The first line is the merged tree, the rest are the conflicting paths
+		return output[1:]
+
+	from concurrent.futures import ThreadPoolExecutor
+
+	pairs = sorted(overlaps)
+
+	with ThreadPoolExecutor(max_workers=int(options["workers"])) as executor:
+		conflicts = dict(zip(pairs, executor.map(trial_merge, pairs)))
+
+	for pull_request in pull_requests:
+		pull_request_ID = pull_request.number
+
+		related_pairs = [pair for pair in pairs if pull_request_ID in pair]
+
+		if not related_pairs:
+			continue
+
+		display_pull_request_minimal(pull_request)
+
+		for pair in related_pairs:
+			other_ID = pair[1] if pair[0] == pull_request_ID else pair[0]
+
+			if conflicts[pair]:
+				print("	%s %s: %s" % (
+					color_text("Conflicts with", "error"),
+					other_ID,
+					", ".join(conflicts[pair]),
+				))
+			else:
+				print("	%s %s: %s" % (
+					color_text("Merges cleanly with", "success"),
+					other_ID,
+					", ".join(overlaps[pair]),
+				))
+
+		print("")
+
+	conflict_count = len([pair for pair in pairs if conflicts[pair]])
+
+	print(color_text(
+		"%s of %s pull requests overlap, %s pair(s) conflict" % (
+			len(set(itertools.chain.from_iterable(pairs))),
+			len(branch_names),
+			conflict_count,
+		),
+		"status",
+	))
+	print("")
+	display_status()
+
+
 def command_continue_update():
 	print(color_text("Continuing update from %s" % options["update-branch"], "status"))
 
@@ -465,26 +941,12 @@ def command_fetch(repo_name, pull_request_ID, auto_update=False):
 	display_pull_request(pull_request)
 	branch_name = fetch_pull_request(pull_request, repo_name)
 
-	parent_commit = pull_request["base"]["sha"]
-	head_commit = pull_request["head"]["sha"]
-	username = pull_request["user"]["login"]
-
-	branch_info = {
-		"username": username,
-		"original": {
-			"parent_commit": parent_commit[0:10],
-			"head_commit": head_commit[0:10],
-		},
-	}
-
-	f = open(get_tmp_path("git-pull-request-treeish-%s" % pull_request_ID), "w")
-	branch_treeish = json.dump(branch_info, f)
-	f.close()
+	write_branch_info(pull_request)
 
 	if auto_update:
 		update_branch(branch_name)
 	elif options["fetch-auto-checkout"]:
-		ret = os.system("git checkout %s" % branch_name)
+		ret = git_run("checkout", branch_name)
 		if ret != 0:
 			raise UserWarning("Could not checkout %s" % branch_name)
 
@@ -505,13 +967,21 @@ def command_fetch_all(repo_name):
 	pull_requests = get_pull_requests(repo_name, options["filter-by-update-branch"])
 
 	for pull_request in pull_requests:
-		fetch_pull_request(pull_request, repo_name)
+		fetch_pull_request(pull_request, repo_name, options["fetch-filter"])
 		display_pull_request_minimal(pull_request)
 		print
 
 	display_status()
 
 
+def command_find(repo_name, jira_ticket):
+	"""Lists the indexed pull requests that mention the JIRA ticket"""
+
+	index = load_search_index(repo_name, True)
+
+	display_indexed_pull_requests(index, index["tickets"].get(jira_ticket.upper(), []))
+
+
 def command_forward(repo_name, pull_request_ID, username, reviewer_repo_name):
 	branch_name = get_current_branch_name(False)
 
@@ -524,24 +994,24 @@ def command_forward(repo_name, pull_request_ID, username, reviewer_repo_name):
 	else:
 		old_pull_request = get_pull_request(repo_name, pull_request_ID)
 
-	quoted_body = '' if old_pull_request['body'] is None else '> ' + '\n> '.join(old_pull_request['body'].split('\n'))
+	quoted_body = '' if old_pull_request.body is None else '> ' + '\n> '.join(old_pull_request.body.split('\n'))
 
-	forwarded_body = '/cc @%s\n\nForwarded from %s\n\n%s' % (old_pull_request['user']['login'], old_pull_request['html_url'], quoted_body)
+	forwarded_body = '/cc @%s\n\nForwarded from %s\n\n%s' % (old_pull_request.user_login, old_pull_request.html_url, quoted_body)
 
 	update_branch_name = options['update-branch']
 
-	options['update-branch'] = old_pull_request['base']['ref']
+	options['update-branch'] = old_pull_request.base_ref
 
 	new_pull_request = command_submit(
 		repo_name,
 		username,
 		reviewer_repo_name=reviewer_repo_name,
 		pull_body=forwarded_body,
-		pull_title=old_pull_request['title'],
+		pull_title=old_pull_request.title,
 		submitOpenGitHub=False
 	)
 
-	command_close(repo_name, 'Forwarded to %s' % new_pull_request['html_url'])
+	command_close(repo_name, 'Forwarded to %s' % new_pull_request.html_url)
 
 	options['update-branch'] = update_branch_name
 
@@ -566,6 +1036,20 @@ def command_info(username, detailed=False):
 
 	repos = github_json_request(url)
 
+	repo_pull_requests = {}
+
+	if detailed:
+		repo_names = [
+			"%s/%s" % (repo["owner"]["login"], repo["name"])
+			for repo in repos
+			if repo["open_issues"] > 0
+		]
+
+		repo_pull_requests = dict(zip(repo_names, github_gather([
+			functools.partial(get_pull_requests, repo_name, False)
+			for repo_name in repo_names
+		])))
+
 	total = 0
 
 	current_base_name = ""
@@ -591,12 +1075,12 @@ def command_info(username, detailed=False):
 			))
 
 			if detailed:
-				pull_requests = get_pull_requests(repo_name, False)
+				pull_requests = repo_pull_requests[repo_name]
 
 				current_branch_name = ""
 
 				for pull_request in pull_requests:
-					branch_name = pull_request["base"]["ref"]
+					branch_name = pull_request.base_ref
 					if branch_name != current_branch_name:
 						current_branch_name = branch_name
 						print("")
@@ -629,16 +1113,18 @@ def command_merge(repo_name, comment=None):
 
 	update_branch_option = options["update-branch"]
 
+	leave_review_worktree(branch_name)
+
 	print(color_text(
 		"Merging %s into %s" % (branch_name, update_branch_option), "status"
 	))
 	print
 
-	ret = os.system("git checkout %s" % update_branch_option)
+	ret = git_run("checkout", update_branch_option)
 	if ret != 0:
 		raise UserWarning("Could not checkout %s" % update_branch_option)
 
-	ret = os.system("git merge %s" % branch_name)
+	ret = git_run("merge", branch_name)
 	if ret != 0:
 		raise UserWarning(
 			"Merge with %s failed. Resolve conflicts, switch back into the pull request branch, and merge again"
@@ -646,7 +1132,7 @@ def command_merge(repo_name, comment=None):
 		)
 
 	print(color_text("Deleting branch %s" % branch_name, "status"))
-	ret = os.system("git branch -D %s" % branch_name)
+	ret = delete_branch(branch_name)
 	if ret != 0:
 		raise UserWarning("Could not delete branch")
 
@@ -660,884 +1146,3645 @@ def command_merge(repo_name, comment=None):
 	display_status()
 
 
-def command_open(repo_name, pull_request_ID=None):
-	"""Open a pull request in the browser"""
+def command_merge_train(repo_name, pull_request_IDs, comment=None):
+	"""Merges the pull requests into the update-branch one after the other with
+	git merge-tree and git commit-tree, then moves the update-branch once"""
 
-	if pull_request_ID is None:
-		branch_name = get_current_branch_name()
-		pull_request_ID = get_pull_request_ID(branch_name)
+	update_branch_option = options["update-branch"]
 
-	pull_request = get_pull_request(repo_name, pull_request_ID)
+	print(color_text(
+		"Merging %s pull requests into %s" % (len(pull_request_IDs), update_branch_option),
+		"status",
+	))
+	print("")
 
-	open_URL(pull_request.get("html_url"))
+	pull_requests = github_gather([
+		functools.partial(get_pull_request, repo_name, pull_request_ID)
+		for pull_request_ID in pull_request_IDs
+	])
 
+	branch_names = fetch_pull_requests(pull_requests, repo_name)
 
-def command_pull(repo_name):
-	"""Pulls changes from the remote branch into the local branch of the pull
-	request"""
+	update_ref_name = "refs/heads/%s" % update_branch_option
 
-	branch_name = get_current_branch_name()
+	old_tip = git_rev_parse(update_ref_name)
 
-	print(color_text("Pulling remote changes into %s" % branch_name, "status"))
+	if not old_tip:
+		raise UserWarning("Could not find %s" % update_branch_option)
 
-	pull_request_ID = get_pull_request_ID(branch_name)
+	tip = old_tip
 
-	pull_request = get_pull_request(repo_name, pull_request_ID)
-	repo_url = get_repo_url(pull_request, repo_name)
+	suffix = ""
 
-	branch_name = build_branch_name(pull_request)
-	remote_branch_name = "refs/pull/%s/head" % pull_request["number"]
+	if update_branch_option not in ("master", "main"):
+		suffix = " into %s" % update_branch_option
 
-	print(color_text(
-		"Pulling from %s (%s)" % (repo_url, pull_request["head"]["ref"]), "status"
-	))
+	merged = []
 
-	ret = os.system("git pull %s %s" % (repo_url, remote_branch_name))
+	for pull_request in pull_requests:
+		branch_name = branch_names[pull_request.number]
 
-	if ret != 0:
-		raise UserWarning("Pull failed, resolve conflicts")
+		if pull_request.state != "open":
+			print("%s %s: %s" % (
+				color_text("Skipped", "error"),
+				display_pull_request_minimal(pull_request, True),
+				"the pull request is %s" % pull_request.state,
+			))
+			continue
 
-	print
-	print(color_text("Updating %s from remote completed" % branch_name, "success"))
-	print
-	display_status()
+		# like git merge, a branch that is already in the tip is not merged
+		# again, and the tip is fast-forwarded to a branch that contains it
 
+		head = git_rev_parse("refs/heads/%s" % branch_name)
 
-def command_show(repo_name):
-	"""List open pull requests
+		if git_run(
+			"merge-base", "--is-ancestor", head, tip, read_only=True, exit_codes=(0, 1)
+		) == 0:
+			merged.append(pull_request)
 
-	Queries the github API for open pull requests in the current repo.
-	"""
+			print("%s %s" % (
+				color_text("Already merged", "success"),
+				display_pull_request_minimal(pull_request, True),
+			))
+			continue
 
-	update_branch_name = options["update-branch"]
-	filter_by_update_branch = options["filter-by-update-branch"]
+		if git_run(
+			"merge-base", "--is-ancestor", tip, head, read_only=True, exit_codes=(0, 1)
+		) == 0:
+			tip = head
 
-	if not filter_by_update_branch:
-		update_branch_name = "across all branches"
-	else:
-		update_branch_name = "on branch '%s'" % update_branch_name
+			merged.append(pull_request)
 
-	print(color_text(
-		"Loading open pull requests for %s %s" % (repo_name, update_branch_name),
-		"status",
-	))
-	print
-
-	pull_requests = get_pull_requests(repo_name, filter_by_update_branch)
-
-	if len(pull_requests) == 0:
-		print("No open pull requests found")
-
-	for pull_request in pull_requests:
-		display_pull_request(pull_request)
+			print("%s %s" % (
+				color_text("Fast-forwarded", "success"),
+				display_pull_request_minimal(pull_request, True),
+			))
+			continue
 
-	display_status()
+		ret, output = run_command(
+			[
+				"git",
+				"merge-tree",
+				"--write-tree",
+				"--name-only",
+				"--no-messages",
+				tip,
+				branch_name,
+			],
+			read_only=True,
+			exit_codes=(0, 1),
+		)
 
+		output = output.decode("utf-8").splitlines()
 
-def command_show_alias(alias):
-	"""Shows the username where the alias points to"""
+		if ret not in (0, 1):
+			raise UserWarning(
+				"Trial merge of %s failed (git 2.38 or newer is required)" % branch_name
+			)
 
-	user_item = next(
-		(user for user in users.items() if user[0] == alias or user[1] == alias),
-		None,
-	)
+		if ret == 1:
+			print("%s %s: %s" % (
+				color_text("Skipped", "error"),
+				display_pull_request_minimal(pull_request, True),
+				"conflicts in %s" % ", ".join(output[1:]),
+			))
+			continue
 
-	if user_item:
-		print("The user alias %s points to %s " % user_item)
-	else:
-		print("There is no user alias or github name matching %s in the current mapping file" % alias)
+		# merge-tree and commit-tree only add objects, so the train is built
+		# in dry-run mode as well
 
+		tip = git_output(
+			"commit-tree",
+			output[0],
+			"-p", tip,
+			"-p", head,
+			"-m", "Merge branch '%s'%s" % (branch_name, suffix),
+		)
 
-def command_submit(
-	repo_name,
-	username,
-	reviewer_repo_name=None,
-	pull_body=None,
-	pull_title=None,
-	submitOpenGitHub=True,
-):
-	"""Push the current branch and create a pull request to your github reviewer
-	(or upstream)"""
+		if not tip:
+			raise UserWarning("Could not create the merge of %s" % branch_name)
 
-	branch_name = get_current_branch_name(False)
+		merged.append(pull_request)
 
-	print(color_text("Submitting pull request for %s" % branch_name, "status"))
+		print("%s %s" % (
+			color_text("Merged", "success"),
+			display_pull_request_minimal(pull_request, True),
+		))
 
-	if reviewer_repo_name is None or reviewer_repo_name == "":
-		reviewer_repo_name = get_repo_name_for_remote("upstream")
+	print("")
 
-	if reviewer_repo_name is None or reviewer_repo_name == "":
-		raise UserWarning("Could not determine a repo to submit this pull request to")
+	if not merged:
+		raise UserWarning("None of the pull requests could be merged")
 
-	if "/" not in reviewer_repo_name:
-		reviewer_repo_name = repo_name.replace(username, reviewer_repo_name)
+	checked_out = set(
+		git_output(
+			"for-each-ref", "--format=%(if)%(worktreepath)%(then)%(refname)%(end)",
+			update_ref_name, "refs/heads/pull-request-*",
+		).split()
+	)
 
-	print(color_text("Pushing local branch %s to origin" % branch_name, "status"))
+	# the checked out update-branch is fast-forwarded, so that the working tree
+	# follows, and is left alone when another worktree has it
 
-	ret = os.system("git push origin %s" % branch_name)
+	if tip == old_tip:
+		ret = 0
+	elif get_current_branch_name(False) == update_branch_option:
+		ret = git_run("merge", "--ff-only", "-q", tip)
+	elif update_ref_name in checked_out:
+		raise UserWarning(
+			"%s is checked out in another worktree, the merges are at %s"
+			% (update_branch_option, tip)
+		)
+	else:
+		ret = git_run("update-ref", update_ref_name, tip, old_tip)
 
 	if ret != 0:
-		raise UserWarning("Could not push this branch to your origin")
+		raise UserWarning("Could not move %s to the merges" % update_branch_option)
 
-	url = get_api_url("repos/%s/pulls" % reviewer_repo_name)
+	if tip == old_tip:
+		print(color_text("%s already has all of them" % update_branch_option, "status"))
+	else:
+		print(color_text(
+			"Moved %s from %s to %s" % (update_branch_option, old_tip[0:10], tip[0:10]),
+			"status",
+		))
 
-	if pull_title == None or pull_title == "":
-		pull_title = build_pull_request_title(branch_name)
+	# the merged branches that are not checked out anywhere are deleted in a
+	# single transaction
 
-	format_submit_body = options["format-submit-body"]
+	transaction = "".join(
+		"delete refs/heads/%s\n" % branch_names[pull_request.number]
+		for pull_request in merged
+		if "refs/heads/%s" % branch_names[pull_request.number] not in checked_out
+	)
 
-	if format_submit_body:
-		merge_base = (
-			os.popen("git merge-base %s %s" % (options["update-branch"], branch_name))
-			.read()
-			.strip()
-		)
-		committers = (
-			os.popen(
-				"git log {0}..{1} --pretty='%an' --reverse | awk ' !x[$0]++'".format(
-					merge_base, branch_name
-				)
+	if transaction and git_run(
+		"update-ref", "--stdin", input=transaction.encode("utf-8")
+	) == 0:
+		for pull_request in merged:
+			PULL_REQUEST_BRANCHES.get(get_git_dirs()[1], set()).discard(
+				branch_names[pull_request.number]
 			)
-			.read()
-			.strip()
-		)
-		committers = committers.split(os.linesep)
-		committers = ", ".join(committers)
 
-		fn = False
+	print(color_text(
+		"Merged %s of %s pull requests" % (len(merged), len(pull_requests)),
+		"success",
+	))
+	print("")
 
-		if format_submit_body.startswith("`"):
-			format_submit_body = format_submit_body[1:]
-			fn = True
+	if options["merge-auto-close"] and not options["dry-run"]:
+		command_close_pull_requests(
+			repo_name, [pull_request.number for pull_request in merged], comment
+		)
 
-		pull_body_tpl = Template(format_submit_body)
+	display_status()
 
-		committers = committers.decode("utf-8")
 
-		reviewer_repo_pieces = reviewer_repo_name.split("/")
-		reviewer = reviewer_repo_pieces[0]
+def command_of_interest(ref_spec=None, file_types=None):
+	"""Lists the commits in the range that change the file types of interest,
+	in a single pass over git log, and counts the files that the range changes
+	per extension, leaving out the ignored paths"""
 
-		variables = {
-			"merge_base": merge_base[0:8],
-			"branch_name": branch_name,
-			"committers": committers,
-			"pull_body": pull_body or "",
-			"reviewer": reviewer,
-			"repo_name": reviewer_repo_pieces[1],
-			"NEWLINE": os.linesep,
-		}
+	ref_spec = get_ref_spec(ref_spec)
 
-		pull_body_result = pull_body_tpl.safe_substitute(**variables)
+	if file_types is None:
+		file_types = options["of-interest-file-types"] or ""
 
-		if fn:
-			pull_body_result = (
-				os.popen(pull_body_result.encode("utf-8"))
-				.read()
-				.strip()
-				.decode("utf-8")
-			)
+	globs = file_types.split()
+	ignore_paths = (options["of-interest-ignore-paths"] or "").split()
 
-		if pull_body_result:
-			pull_body = pull_body_result
+	chunks = git_stream(
+		"log",
+		"--numstat",
+		"-z",
+		"--no-renames",
+		"--abbrev-commit",
+		"--format=%x01%h%x00%d%x00%s%x00%cr%x00%an",
+		ref_spec,
+	)
 
-	if pull_body == None:
-		pull_body = ""
+	entries = []
+	header = None
 
-	params = {
-		"base": options["update-branch"],
-		"head": "%s:%s" % (username, branch_name),
-		"title": pull_title,
-		"body": pull_body,
-	}
+	for token in split_stream(chunks, b"\0"):
+		token = token.decode("utf-8", "replace")
 
-	print(color_text("Sending pull request to %s" % reviewer_repo_name, "status"))
+		if token.startswith("\x01"):
+			header = [token[1:]]
+			continue
 
-	pull_request = None
+		if header is not None and len(header) < 5:
+			header.append(token)
 
-	try:
-		pull_request = github_json_request(url, params)
-	except Exception as e:
-		msg = e
+			if len(header) == 5:
+				entries.append((header, []))
 
-	if not pull_request:
-		print("Couldn't get a response from github, going to check if the pull was submitted anyways...")
+			continue
 
-		reviewer_pulls = get_pull_requests(reviewer_repo_name, True)
+		token = token.lstrip("\n")
 
-		for pr in reviewer_pulls:
-			if (
-				pr.get("user").get("login") == DEFAULT_USERNAME
-				and pr.get("head").get("ref") == branch_name
-			):
-				pull_request = pr
+		if not token:
+			continue
 
-	if not pull_request:
-		raise msg
+		path = token.split("\t", 2)[2]
 
-	new_pr_url = pull_request.get("html_url")
+		if any(fnmatch.fnmatch(path, glob) for glob in globs):
+			entries[-1][1].append(path)
 
-	if new_pr_url and new_pr_url != "":
-		meta("new_pr_url", new_pr_url)
+	entries = [entry for entry in entries if entry[1]]
 
-	print
-	display_pull_request(pull_request)
-	print
+	if not entries:
+		print("There are no changes in %s across %s" % (", ".join(globs), ref_spec))
+		return
 
-	print(color_text("Pull request submitted", "success"))
-	print
-	display_status()
+	# The totals are those of the range as a whole, so a file that a later
+	# commit reverts is not counted
 
-	if submitOpenGitHub:
-		open_URL(new_pr_url)
+	extensions = {}
 
-	return pull_request
+	for token in split_stream(
+		git_stream("diff", "--numstat", "-z", "--no-renames", ref_spec), b"\0"):
 
+		token = token.decode("utf-8", "replace").lstrip("\n")
 
-def command_update(repo_name, target=None):
-	if target == None:
-		branch_name = get_current_branch_name()
-	else:
-		try:
-			pull_request_ID = int(target)
-			pull_request = get_pull_request(repo_name, pull_request_ID)
-			branch_name = build_branch_name(pull_request)
-		except ValueError:
-			branch_name = target
+		if not token:
+			continue
 
-	print(color_text(
-		"Updating %s from %s" % (branch_name, options["update-branch"]), "status"
-	))
+		path = token.split("\t", 2)[2]
 
-	update_branch(branch_name)
-	print
-	display_status()
+		if any(("/" + path).find("/" + ignore_path) != -1 for ignore_path in ignore_paths):
+			continue
 
+		extension = path.rsplit(".", 1)[-1]
+		extensions[extension] = extensions.get(extension, 0) + 1
 
-def command_update_meta():
-	update_meta()
+	print("Changes in these file types: %s that you might be interested in:" % ", ".join(globs))
 
+	for header, entry_paths in entries:
+		sha, refs, subject, date, author = header
 
-def command_update_users(
-	filename, url=None, github_users=None, total_pages=0, all_pages=True
-):
-	if url is None:
-		user_organization = options["user-organization"]
+		print("  %s -%s %s (%s) <%s>" % (
+			color_text(sha, "of-interest-sha"),
+			color_text(refs, "of-interest-refs"),
+			subject,
+			color_text(date, "of-interest-date"),
+			color_text(author, "of-interest-author"),
+		))
 
-		if user_organization:
-			url = get_api_url("orgs/%s/members" % user_organization)
-		else:
-			url = get_api_url("repos/%s/forks" % get_repo_name_for_remote("upstream"))
+		for path in entry_paths:
+			print("  %s" % path)
 
-			params = {"per_page": "100", "sort": "oldest"}
+	print("---")
+	print(", ".join(
+		"%s %s" % (extensions[extension], extension)
+		for extension in sorted(extensions)
+	))
 
-			url_parts = list(urllib.parse.urlparse(url))
-			query = dict(urllib.parse.parse_qsl(url_parts[4]))
-			query.update(params)
 
-			url_parts[4] = urllib.parse.urlencode(query)
+def command_open(repo_name, pull_request_ID=None):
+	"""Open a pull request in the browser"""
 
-			url = urllib.parse.urlunparse(url_parts)
+	if pull_request_ID is None:
+		branch_name = get_current_branch_name()
+		pull_request_ID = get_pull_request_ID(branch_name)
 
-	if github_users is None:
-		github_users = {}
+	pull_request = get_pull_request(repo_name, pull_request_ID)
 
-	items = github_json_request(url)
+	open_URL(pull_request.html_url)
 
-	m = re.search(r"[?&]page=(\d+)", url)
 
-	if m is not None and m.group(1) != "":
-		print("Doing another request for page: %s of %s" % (m.group(1), total_pages))
-	else:
-		print("There are more than %s users, this could take a few minutes..." % len(
-			items
-		))
+def command_prune(repo_name):
+	"""Deletes the local branches of the pull requests that github reports as
+	closed with a single git update-ref transaction. Each pull request is looked
+	up in the search index of the repository it was fetched from, which is
+	synced first, and branches that have commits its head does not have are
+	kept."""
 
-	user_api_url = get_api_url("users")
+	print(color_text("Pruning the branches of closed pull requests", "status"))
+	print("")
 
-	for item in items:
-		user_info = item
+	branches = [
+		line.split("\0")
+		for line in git_output(
+			"for-each-ref",
+			"--format=%(refname)%00%(objectname)%00%(worktreepath)",
+			"refs/heads/pull-request-*",
+		).splitlines()
+	]
 
-		if "owner" in item:
-			user_info = item["owner"]
+	# the work dir of git-new-workdir shares the refs without being a linked
+	# worktree, so for-each-ref does not know what it has checked out
 
-		login = user_info["login"]
+	work_dir = get_work_dir()
+	work_dir_ref_name = None
 
-		github_user_info = github_json_request("%s/%s" % (user_api_url, login))
-		email = login
+	if work_dir:
+		work_dir_ref_name = git_output(
+			"symbolic-ref", "-q", "HEAD", cwd=work_dir, exit_codes=(0, 1)
+		)
 
-		email = get_user_email(github_user_info)
+	lookups = []
 
-		if email != None:
-			github_users[email] = login
+	for ref_name, object_name, worktree_path in branches:
+		branch_name = ref_name[11:]
 
-	if all_pages:
-		link_header = MAP_RESPONSE[url].headers.get("Link")
+		if worktree_path or ref_name == work_dir_ref_name:
+			print(color_text(
+				"Keeping %s, which is checked out in %s" % (
+					branch_name, worktree_path or work_dir
+				),
+				"warning",
+			))
+			continue
 
-		if link_header is not None:
-			m = re.search(r'<([^>]+)>; rel="next",', link_header)
+		pull_request_repo_name = repo_name
 
-			if m is not None and m.group(1) != "":
-				url = m.group(1)
+		try:
+			with open(get_tmp_path(
+				"git-pull-request-treeish-%s" % get_pull_request_ID(branch_name)
+			)) as f:
+				pull_request_repo_name = json.load(f).get("repo") or repo_name
+		except (IOError, ValueError):
+			pass
 
-				if total_pages == 0:
-					m1 = re.search(
-						r'<[^>]+[&?]page=(\d+)[^>]*>; rel="last"', link_header
-					)
+		lookups.append((ref_name, object_name, pull_request_repo_name))
 
-					if m1 is not None and m1.group(1) != "":
-						total_pages = m1.group(1)
+	# the search index of each repository is brought up to date with a single
+	# listing of the pull requests updated since its last sync, rather than
+	# asking github about each branch
 
-				command_update_users(filename, url, github_users, total_pages)
+	pull_request_repo_names = sorted(set(
+		pull_request_repo_name for ref_name, object_name, pull_request_repo_name in lookups
+	))
 
-	github_users_file = open(filename, "w")
-	json.dump(github_users, github_users_file)
+	indexes = dict(zip(
+		pull_request_repo_names,
+		github_gather(
+			[
+				functools.partial(sync_search_index, pull_request_repo_name)
+				for pull_request_repo_name in pull_request_repo_names
+			],
+			return_exceptions=True,
+		),
+	))
 
-	github_users_file.close()
+	stale_branches = []
 
-	return github_users
+	for ref_name, object_name, pull_request_repo_name in lookups:
+		branch_name = ref_name[11:]
+		pull_request_ID = get_pull_request_ID(branch_name)
 
+		index = indexes[pull_request_repo_name]
 
-def complete_update(branch_name):
-	update_branch_option = options["update-branch"]
+		if isinstance(index, Exception):
+			print(color_text(
+				"Keeping %s, which could not be looked up in %s: %s" % (
+					branch_name, pull_request_repo_name, index
+				),
+				"warning",
+			))
+			continue
 
-	if in_work_dir():
-		ret = os.system("git checkout %s" % update_branch_option)
-		if ret != 0:
-			raise UserWarning(
-				"Could not checkout %s branch in work directory" % update_branch_option
-			)
+		document = index[0]["pull_requests"].get(str(pull_request_ID))
 
-		original_dir_path = get_original_dir_path()
+		if document is None:
+			print(color_text(
+				"Keeping %s, pull request %s is not in %s" % (
+					branch_name, pull_request_ID, pull_request_repo_name
+				),
+				"warning",
+			))
+			continue
 
-		print(color_text(
-			"Switching to original directory: '%s'" % original_dir_path, "status"
-		))
+		if document["state"] == "open":
+			continue
 
-		os.chdir(original_dir_path)
-		chdir(original_dir_path)
+		# a head that is missing locally cannot be compared either
 
-		if get_current_branch_name(False) == branch_name:
-			ret = os.system("git reset --hard && git clean -f")
-			if ret != 0:
-				raise UserWarning(
-					"Syncing branch %s with work directory failed" % branch_name
-				)
-		else:
-			ret = os.system("git checkout %s" % branch_name)
-			if ret != 0:
-				raise UserWarning("Could not checkout %s" % branch_name)
+		ret, output = run_command(
+			[
+				"git",
+				"merge-base",
+				"--is-ancestor",
+				object_name,
+				document["head_sha"],
+			],
+			read_only=True,
+			quiet=True,
+			exit_codes=(0, 1),
+		)
 
-	update_branch_option = options["update-branch"]
+		if ret != 0:
+			print(color_text(
+				"Keeping %s, which has commits that pull request %s does not have"
+				% (branch_name, pull_request_ID),
+				"warning",
+			))
+			continue
 
-	branch_treeish = update_meta()
+		stale_branches.append((ref_name, object_name))
 
-	print
-	print(color_text(
-		"Updating %s from %s complete" % (branch_name, update_branch_option), "success"
-	))
+	if not stale_branches:
+		print(color_text("No branches to prune", "success"))
+		return
 
+	# the old values make the transaction fail if a branch moved meanwhile
 
-def continue_update():
-	if options["update-method"] == "merge":
-		ret = os.system("git commit")
-	elif options["update-method"] == "rebase":
-		ret = os.system("git rebase --continue")
+	transaction = "".join(
+		"delete %s %s\n" % (ref_name, object_name)
+		for ref_name, object_name in stale_branches
+	)
+
+	ret = git_run("update-ref", "--stdin", input=transaction.encode("utf-8"))
 
 	if ret != 0:
-		raise UserWarning(
-			"Updating from %s failed\nResolve conflicts and 'git add' files, then run 'gitpr continue-update'"
-			% options["update-branch"]
-		)
+		raise UserWarning("Could not delete the branches")
 
-	# The branch name will not be correct until the merge/rebase is complete
-	branch_name = get_current_branch_name()
+	git_common_dir = get_git_dirs()[1]
 
-	complete_update(branch_name)
+	for ref_name, object_name in stale_branches:
+		branch_name = ref_name[11:]
 
+		if options["dry-run"]:
+			print("Would delete %s" % branch_name)
+			continue
 
-def display_pull_request(pull_request):
-	"""Nicely display_pull_request info about a given pull request"""
+		print("%s %s" % (color_text("Deleted", "status"), branch_name))
 
-	display_pull_request_minimal(pull_request)
+		PULL_REQUEST_BRANCHES.get(git_common_dir, set()).discard(branch_name)
 
-	description_indent = options["description-indent"]
+		try:
+			os.remove(get_tmp_path(
+				"git-pull-request-treeish-%s" % get_pull_request_ID(branch_name)
+			))
+		except OSError:
+			pass
 
-	print("%s%s" % (
-		description_indent,
-		color_text(pull_request.get("html_url"), "display-title-url"),
-	))
+		remove_patch_ids(get_pull_request_ID(branch_name))
 
-	pr_body = pull_request.get("body")
+	print("")
+	print(color_text(
+		"Pruned %s of %s pull request branches" % (len(stale_branches), len(branches)),
+		"success",
+	))
 
-	if pr_body and pr_body.strip():
-		pr_body = strip_html_tags(pr_body)
 
-		pr_body = re.sub(r"(<br\s?/?>)", "\n", pr_body.strip())
+def command_pull(repo_name):
+	"""Pulls changes from the remote branch into the local branch of the pull
+	request"""
 
-		if options["description-strip-newlines"]:
-			pr_body = fill(
-				pr_body,
-				initial_indent=description_indent,
-				subsequent_indent=description_indent,
-				width=80,
-			)
-		else:
-			# Normalize newlines
-			pr_body = re.sub("\r?\n", "\n", pr_body)
+	branch_name = get_current_branch_name()
 
-			pr_body = pr_body.splitlines()
+	print(color_text("Pulling remote changes into %s" % branch_name, "status"))
 
-			pr_body = [
-				fill(
-					line.strip(),
-					initial_indent=description_indent,
-					subsequent_indent=description_indent,
-					width=80,
-				)
-				for line in pr_body
-			]
+	pull_request_ID = get_pull_request_ID(branch_name)
 
-			pr_body = "\n".join(pr_body)
+	pull_request = get_pull_request(repo_name, pull_request_ID)
+	repo_url = get_repo_url(pull_request, repo_name)
 
-		pr_body = strip_empty_lines(pr_body)
+	branch_name = build_branch_name(pull_request)
+	remote_branch_name = "refs/pull/%s/head" % pull_request.number
 
-		if ((options["description-line-limit"] >= 0) and (len(pr_body.splitlines()) > options["description-line-limit"])):
-			pr_body = pr_body.splitlines()
-			pr_body = pr_body[:options["description-line-limit"]]
-			pr_body = "\n".join(pr_body)
-			#pr_body += "..."
+	print(color_text(
+		"Pulling from %s (%s)" % (repo_url, pull_request.head_ref), "status"
+	))
 
-		if ((options["description-char-limit"] >= 0) and (len(pr_body) > options["description-char-limit"])):
-			pr_body = pr_body[:options["description-char-limit"]] # + '...'
+	ret = git_run("pull", repo_url, remote_branch_name)
 
-		print(pr_body)
+	if ret != 0:
+		raise UserWarning("Pull failed, resolve conflicts")
 
 	print
+	print(color_text("Updating %s from remote completed" % branch_name, "success"))
+	print
+	display_status()
 
 
-def display_pull_request_minimal(pull_request, return_text=False):
-	"""Display minimal info about a given pull request"""
+def command_review_queue(repo_name, pull_request_IDs=None):
+	"""Fetches the pull requests in a single fetch and prepares a worktree for
+	each of them at the same time"""
 
-	text = "%s - %s (%s)" % (
-		color_text(
-			"REQUEST %s" % pull_request.get("number"), "display-title-number", True
-		),
-		color_text(pull_request.get("title"), "display-title-text", True),
-		color_text(pull_request["user"].get("login"), "display-title-user"),
+	print(color_text("Preparing the review queue", "status"))
+	print("")
+
+	queue = load_review_queue()
+
+	if pull_request_IDs:
+		pull_request_IDs = [int(pull_request_ID) for pull_request_ID in pull_request_IDs]
+		listed = {}
+	else:
+		listed = dict(
+			(pull_request.number, pull_request)
+			for pull_request in get_pull_requests(
+				repo_name, options["filter-by-update-branch"]
+			)
+		)
+
+		pull_request_IDs = list(listed)
+
+	# the pull requests of the queued worktrees are looked up as well, to find
+	# out which worktrees can be reused. A worktree is only reused when github
+	# says that its pull request is no longer open, not when the lookup fails
+	# or the pull request targets another branch.
+
+	looked_up_IDs = sorted(
+		(set(pull_request_IDs) | set(map(int, queue))) - set(listed)
 	)
 
-	if return_text:
-		return text
+	looked_up = dict(zip(looked_up_IDs, github_gather(
+		[
+			functools.partial(get_pull_request, repo_name, pull_request_ID)
+			for pull_request_ID in looked_up_IDs
+		],
+		return_exceptions=True,
+	)))
 
-	print(text)
+	looked_up.update(listed)
 
+	for pull_request_ID in pull_request_IDs:
+		if isinstance(looked_up[pull_request_ID], Exception):
+			raise looked_up[pull_request_ID]
 
-def display_status():
-	"""Displays the current branch name"""
+	pull_requests = [looked_up[pull_request_ID] for pull_request_ID in pull_request_IDs]
 
-	branch_name = get_current_branch_name(False)
-	out = "Current branch: %s" % branch_name
-	print(out)
-	return out
+	closed_pull_request_IDs = set(
+		pull_request_ID
+		for pull_request_ID, pull_request in looked_up.items()
+		if not isinstance(pull_request, Exception) and pull_request.state != "open"
+	)
 
+	branch_names = fetch_pull_requests(
+		pull_requests, repo_name, options["fetch-filter"]
+	)
 
-def fetch_pull_request(pull_request, repo_name):
-	"""Fetches a pull request into a local branch, and returns the name of the
-	local branch"""
+	recyclable_paths = [
+		path
+		for pull_request_ID, path in sorted(queue.items())
+		if int(pull_request_ID) in closed_pull_request_IDs and os.path.isdir(path)
+	]
 
-	branch_name = build_branch_name(pull_request)
-	repo_url = get_repo_url(pull_request, repo_name)
+	jobs = []
 
-	remote_branch_name = "refs/pull/%s/head" % pull_request["number"]
+	for pull_request in pull_requests:
+		pull_request_ID = pull_request.number
 
-	ret = os.system("git show-ref --verify -q refs/heads/%s" % branch_name)
-	# sha = os.popen('git rev-parse --abbrev-ref refs/heads/%s' % branch_name).read().strip()
+		if os.path.isdir(queue.get(str(pull_request_ID), "")):
+			continue
 
-	# log(pull_request)
+		path = os.path.join(get_review_path(), str(pull_request_ID))
+		old_path = recyclable_paths.pop() if recyclable_paths else None
 
-	if ret != 0:
-		ret = os.system(
-			'git fetch %s "%s":%s' % (repo_url, remote_branch_name, branch_name)
-		)
+		jobs.append((pull_request_ID, branch_names[pull_request_ID], path, old_path))
 
-	if ret != 0:
-		ret = os.system("git show-ref --verify refs/heads/%s" % branch_name)
+	def prepare(job):
+		"""Returns the path of the worktree that was reused, None when one was
+		added, or the error"""
 
-	if ret != 0:
-		print("Could not get from refs/pull/%s/head, trying to brute force the fetch" % pull_request[
-			"number"
-		])
+		pull_request_ID, branch_name, path, old_path = job
 
-		repo_url = get_repo_url(pull_request, repo_name, True)
-		remote_branch_name = pull_request["head"]["ref"]
+		if old_path is not None:
+			ret, output = run_command(
+				["git", "-C", old_path, "status", "--porcelain", "--untracked-files=no"],
+				read_only=True,
+			)
 
-		ret = os.system(
-			'git fetch %s "%s":%s' % (repo_url, remote_branch_name, branch_name)
-		)
+			# switching branches only writes the files that differ
 
-		if ret != 0:
-			ret = os.system("git show-ref --verify refs/heads/%s" % branch_name)
+			if (
+				ret == 0
+				and not output.strip()
+				and run_command(["git", "-C", old_path, "checkout", "-q", branch_name])[0] == 0
+				and run_command(["git", "worktree", "move", old_path, path])[0] == 0
+			):
+				return old_path
+
+		ret, output = run_command(["git", "worktree", "add", "-q", path, branch_name])
 
 		if ret != 0:
-			raise UserWarning("Fetch failed")
+			return UserWarning("Could not create the worktree %s" % path)
 
-	try:
-		os.remove(get_tmp_path("git-pull-request-treeish-%s" % pull_request["number"]))
-	except OSError:
-		pass
+	# git worktree add creates the review directory, but git worktree move
+	# needs it to exist
 
-	return branch_name
+	if not options["dry-run"] and any(job[3] is not None for job in jobs):
+		os.makedirs(get_review_path(), exist_ok=True)
 
+	from concurrent.futures import ThreadPoolExecutor
 
-def get_api_url(command):
-	return URL_BASE % command
+	with ThreadPoolExecutor(max_workers=int(options["workers"])) as executor:
+		results = list(executor.map(prepare, jobs))
 
+	# the worktrees that were prepared are queued before any error is raised,
+	# so that none of them is left out of the queue
 
-def get_current_branch_name(ensure_pull_request=True):
-	"""Returns the name of the current pull request branch"""
-	branch_name = os.popen("git rev-parse --abbrev-ref HEAD").read().strip()
+	errors = []
 
-	if ensure_pull_request and branch_name[0:13] != "pull-request-":
-		raise UserWarning("Invalid branch: not a pull request")
+	for (pull_request_ID, branch_name, path, old_path), result in zip(jobs, results):
+		if isinstance(result, Exception):
+			errors.append(result)
+			continue
 
-	return branch_name
+		if result is not None:
+			for queued_ID, queued_path in list(queue.items()):
+				if queued_path == result:
+					del queue[queued_ID]
 
+		queue[str(pull_request_ID)] = path
 
-def get_default_repo_name():
-	repo_name = os.popen("git config github.repo").read().strip()
+	if not options["dry-run"]:
+		save_review_queue(queue)
 
-	# get repo name from origin
-	if repo_name is None or repo_name == "":
-		repo_name = get_repo_name_for_remote("origin")
+	if errors:
+		raise UserWarning("\n".join(str(error) for error in errors))
 
-	if repo_name is None or repo_name == "":
-		raise UserWarning("Failed to determine github repository name")
+	for pull_request in pull_requests:
+		display_pull_request_minimal(pull_request)
+		print("	%s" % queue.get(str(pull_request.number)))
 
-	return repo_name
+	print("")
 
+	if len(pull_requests) == 1:
+		chdir(queue[str(pull_requests[0].number)])
 
-def get_git_base_path():
-	return os.popen("git rev-parse --show-toplevel").read().strip()
+	display_status()
 
 
-def get_jira_ticket(text):
-	"""Returns a JIRA ticket id from the passed text, or a blank string otherwise"""
-	m = re.search(r"[A-Z]{3,}-\d+", text)
+def command_search(repo_name, query):
+	"""Lists the indexed pull requests that contain all the words of the query"""
 
-	jira_ticket = ""
+	index = load_search_index(repo_name, True)
 
-	if m != None and m.group(0) != "":
-		jira_ticket = m.group(0)
+	terms = get_search_terms(query)
 
-	return jira_ticket
+	if not terms:
+		raise UserWarning("Please include the words to search for")
 
+	postings = [set(index["terms"].get(term, [])) for term in terms]
 
-def get_original_dir_path():
-	git_base_path = get_git_base_path()
+	display_indexed_pull_requests(index, set.intersection(*postings))
 
-	f = open(os.path.join(get_work_dir(), ".git", "original_dir_path"), "rb")
-	original_dir_path = f.read()
-	f.close()
 
-	if original_dir_path == None or original_dir_path == "":
-		config_path = os.readlink(os.path.join(git_base_path, ".git", "config"))
-		original_dir_path = os.path.dirname(os.path.dirname(config_path))
+def command_server(action="status"):
+	"""Starts, stops or runs the server that runs the commands sent by
+	gitpr-client.py"""
 
-	return original_dir_path
+	import socket
 
+	if not hasattr(socket, "send_fds"):
+		raise UserWarning("The server needs Unix domain sockets and Python 3.9")
+
+	socket_path = get_server_path()
+
+	def running():
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-def get_pr_stats(repo_name, pull_request_ID):
-	if pull_request_ID != None:
 		try:
-			pull_request_ID = int(pull_request_ID)
-			pull_request = get_pull_request(repo_name, pull_request_ID)
-		except Exception:
-			pull_request = pull_request_ID
+			client.connect(socket_path)
+		except OSError:
+			return False
+		finally:
+			client.close()
+
+		return True
+
+	if action == "run":
+		if running():
+			raise UserWarning("The server is already running on %s" % socket_path)
+
+		print(color_text("Serving on %s" % socket_path, "status"))
+		sys.stdout.flush()
+
+		serve(socket_path)
+	elif action == "start":
+		if running():
+			print(color_text("The server is already running on %s" % socket_path, "status"))
+			return
+
+		subprocess.Popen(
+			[sys.executable, os.path.abspath(sys.argv[0]), "server", "run"],
+			cwd="/",
+			stdin=subprocess.DEVNULL,
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL,
+			start_new_session=True,
+		)
 
-		display_pull_request_minimal(pull_request)
+		for i in range(50):
+			if running():
+				print(color_text("Server started on %s" % socket_path, "success"))
+				return
 
-		branch_name = build_branch_name(pull_request)
-		ret = os.system("git show-ref --verify -q refs/heads/%s" % branch_name)
+			time.sleep(0.1)
 
-		if ret != 0:
-			branch_name = fetch_pull_request(pull_request, repo_name)
+		raise UserWarning("Could not start the server")
+	elif action == "status":
+		if running():
+			print(color_text("The server is running on %s" % socket_path, "status"))
+		else:
+			print(color_text("The server is not running", "status"))
+	elif action == "stop":
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
 
-			ret = os.system("git show-ref --verify -q refs/heads/%s" % branch_name)
+		try:
+			client.connect(socket_path)
+			client.sendall(b'{"stop": true}\n')
+			client.recv(4096)
+		except OSError:
+			print(color_text("The server is not running", "status"))
+			return
+		finally:
+			client.close()
+
+		print(color_text("Server stopped", "success"))
+	else:
+		raise UserWarning("Unknown server action %s, use start, stop, status or run" % action)
 
-			if ret != 0:
-				raise UserWarning("Fetch failed")
 
-		merge_base = (
-			os.popen("git merge-base %s %s" % (options["update-branch"], branch_name))
-			.read()
-			.strip()
-		)
+def command_show(repo_name):
+	"""List open pull requests
 
-		shortstat = (
-			os.popen(
-				"git --no-pager diff --shortstat {0}..{1}".format(
-					merge_base, branch_name
-				)
-			)
-			.read()
-			.strip()
-		)
-		stat_fragments = shortstat.split(", ")
-		stats_arr = shortstat.split(" ")
-
-		has_color = False
-		for index, frag in enumerate(stat_fragments):
-			color_type = None
-			if "changed" in frag:
-				color_type = "total"
-			elif "insertions" in frag:
-				color_type = "added"
-			elif "deletions" in frag:
-				color_type = "deleted"
-
-			if color_type:
-				has_color = True
-				stat_fragments[index] = color_text(frag, "stats-%s" % color_type)
-
-		if has_color:
-			shortstat = ", ".join(stat_fragments)
-
-		dels = 0
-		if len(stats_arr) > 5:
-			dels = int(stats_arr[5])
-
-		stats = (int(stats_arr[3]) + dels) / int(stats_arr[0])
-
-		stats = color_text(
-			"Average %d change(s) per file" % stats, "stats-average-change"
+	Queries the github API for open pull requests in the current repo.
+	"""
+
+	update_branch_name = options["update-branch"]
+	filter_by_update_branch = options["filter-by-update-branch"]
+
+	if not filter_by_update_branch:
+		update_branch_name = "across all branches"
+	else:
+		update_branch_name = "on branch '%s'" % update_branch_name
+
+	print(color_text(
+		"Loading open pull requests for %s %s" % (repo_name, update_branch_name),
+		"status",
+	))
+	print
+
+	pull_requests = get_pull_requests(repo_name, filter_by_update_branch)
+
+	# the open pull requests are refreshed in the search index for free, but
+	# only sync moves its cursor, since the closed ones are not read here
+
+	if os.path.exists(get_search_index_path(repo_name)):
+		index = load_search_index(repo_name)
+
+		if index["synced_at"]:
+			index_pull_requests(index, pull_requests)
+			save_search_index(index)
+
+	write_completion_cache(pull_requests)
+
+	if len(pull_requests) == 0:
+		print("No open pull requests found")
+
+	for pull_request in pull_requests:
+		display_pull_request(pull_request)
+
+	display_status()
+
+
+def command_show_alias(alias):
+	"""Shows the username where the alias points to"""
+
+	user_item = next(
+		(user for user in users.items() if user[0] == alias or user[1] == alias),
+		None,
+	)
+
+	if user_item:
+		print("The user alias %s points to %s " % user_item)
+	else:
+		print("There is no user alias or github name matching %s in the current mapping file" % alias)
+
+
+def command_submit(
+	repo_name,
+	username,
+	reviewer_repo_name=None,
+	pull_body=None,
+	pull_title=None,
+	submitOpenGitHub=True,
+):
+	"""Push the current branch and create a pull request to your github reviewer
+	(or upstream)"""
+
+	branch_name = get_current_branch_name(False)
+
+	print(color_text("Submitting pull request for %s" % branch_name, "status"))
+
+	if reviewer_repo_name is None or reviewer_repo_name == "":
+		reviewer_repo_name = get_repo_name_for_remote("upstream")
+
+	if reviewer_repo_name is None or reviewer_repo_name == "":
+		raise UserWarning("Could not determine a repo to submit this pull request to")
+
+	if "/" not in reviewer_repo_name:
+		reviewer_repo_name = repo_name.replace(username, reviewer_repo_name)
+
+	print(color_text("Pushing local branch %s to origin" % branch_name, "status"))
+
+	# The pull body is formatted while the branch is being pushed
+
+	from concurrent.futures import ThreadPoolExecutor
+
+	push_executor = ThreadPoolExecutor(max_workers=1)
+	push = push_executor.submit(git_run, "push", "origin", branch_name)
+
+	url = get_api_url("repos/%s/pulls" % reviewer_repo_name)
+
+	if pull_title == None or pull_title == "":
+		pull_title = build_pull_request_title(branch_name)
+
+	format_submit_body = options["format-submit-body"]
+
+	if format_submit_body:
+		merge_base = git_output(
+			"merge-base", options["update-branch"], branch_name, cache=True
 		)
+		committers = get_committers(merge_base, branch_name)
+
+		fn = False
+
+		if format_submit_body.startswith("`"):
+			format_submit_body = format_submit_body[1:]
+			fn = True
+
+		pull_body_tpl = Template(format_submit_body)
+
+		reviewer_repo_pieces = reviewer_repo_name.split("/")
+		reviewer = reviewer_repo_pieces[0]
+
+		variables = {
+			"merge_base": merge_base[0:8],
+			"branch_name": branch_name,
+			"committers": committers,
+			"pull_body": pull_body or "",
+			"reviewer": reviewer,
+			"repo_name": reviewer_repo_pieces[1],
+			"NEWLINE": os.linesep,
+		}
+
+		pull_body_result = pull_body_tpl.safe_substitute(**variables)
+
+		if fn:
+			pull_body_result = shell_output(pull_body_result)
+
+		if pull_body_result:
+			pull_body = pull_body_result
+
+	ret = push.result()
+	push_executor.shutdown()
+
+	if ret != 0:
+		raise UserWarning("Could not push this branch to your origin")
+
+	if pull_body == None:
+		pull_body = ""
+
+	params = {
+		"base": options["update-branch"],
+		"head": "%s:%s" % (username, branch_name),
+		"title": pull_title,
+		"body": pull_body,
+	}
+
+	print(color_text("Sending pull request to %s" % reviewer_repo_name, "status"))
+
+	pull_request = None
+	msg = UserWarning("Could not send the pull request to %s" % reviewer_repo_name)
+
+	try:
+		pull_request = github_json_request(url, params, PullRequest.object_hook)
+	except Exception as e:
+		msg = e
+
+	if not isinstance(pull_request, PullRequest):
+		print("Couldn't get a response from github, going to check if the pull was submitted anyways...")
+
+		url = get_api_url(
+			"repos/%s/pulls?head=%s&state=open" % (
+				reviewer_repo_name,
+				urllib.parse.quote("%s:%s" % (username, branch_name)),
+			)
+		)
+
+		reviewer_pulls = github_json_request(url, object_hook=PullRequest.object_hook)
+
+		if reviewer_pulls:
+			pull_request = reviewer_pulls[0]
+
+	if not isinstance(pull_request, PullRequest):
+		raise msg
+
+	new_pr_url = pull_request.html_url
+
+	if new_pr_url and new_pr_url != "":
+		meta("new_pr_url", new_pr_url)
+
+	print
+	display_pull_request(pull_request)
+	print
+
+	print(color_text("Pull request submitted", "success"))
+	print
+	display_status()
+
+	if submitOpenGitHub:
+		open_URL(new_pr_url)
+
+	return pull_request
+
+
+def command_sync(repo_name):
+	"""Adds the pull requests updated since the last sync to the search index"""
+
+	print(color_text("Syncing the search index of %s" % repo_name, "status"))
+
+	index, pull_requests = sync_search_index(repo_name)
+
+	write_completion_cache(
+		[
+			(int(number), document["title"])
+			for number, document in index["pull_requests"].items()
+			if document["state"] == "open"
+		]
+	)
+
+	print(color_text(
+		"Indexed %s updated pull requests, %s in total" % (
+			len(pull_requests), len(index["pull_requests"])
+		),
+		"success",
+	))
+
+
+def command_sync_origin(branch_names=None):
+	"""Fast-forwards local branches to their upstream counterparts and pushes
+	them to origin, using one fetch and one push for all of them"""
+
+	if not branch_names:
+		branch_names = [options["update-branch"]]
+
+	print(color_text(
+		"Fetching %s from upstream" % ", ".join(branch_names), "status"
+	))
+
+	ret = git_run("fetch", "upstream", *[
+		"+refs/heads/%s:refs/remotes/upstream/%s" % (branch_name, branch_name)
+		for branch_name in branch_names
+	])
+
+	if ret != 0:
+		raise UserWarning("Could not fetch from upstream")
+
+	current_branch_name = get_current_branch_name(False)
+
+	ref_updates = []
+	synced_branch_names = []
+	updated_ranges = []
+
+	for branch_name in branch_names:
+		old_head = git_rev_parse("refs/heads/%s" % branch_name)
+		new_head = git_rev_parse("refs/remotes/upstream/%s" % branch_name)
+
+		if old_head == new_head:
+			print("%s is up to date" % branch_name)
+			synced_branch_names.append(branch_name)
+			continue
+
+		if old_head and git_run(
+			"merge-base",
+			"--is-ancestor",
+			old_head,
+			new_head,
+			read_only=True,
+			exit_codes=(0, 1),
+		) != 0:
+			print(color_text(
+				"Skipping %s: it cannot be fast-forwarded to upstream/%s"
+				% (branch_name, branch_name),
+				"warning",
+			))
+			continue
+
+		if branch_name == current_branch_name:
+			ret = git_run("merge", "--ff-only", "-q", "upstream/%s" % branch_name)
+
+			if ret != 0:
+				print(color_text(
+					"Skipping %s: fast-forwarding the checked out branch failed"
+					% branch_name,
+					"warning",
+				))
+				continue
+		else:
+			ref_updates.append(
+				"update refs/heads/%s %s %s\n" % (branch_name, new_head, old_head)
+			)
+
+		synced_branch_names.append(branch_name)
+
+		if old_head:
+			updated_ranges.append((branch_name, old_head[0:10], new_head[0:10]))
+
+	if ref_updates:
+		ret, output = run_command(
+			["git", "update-ref", "--stdin"],
+			input="".join(ref_updates).encode("utf-8"),
+		)
+
+		if ret != 0:
+			raise UserWarning("Could not update the local branches")
+
+	# the skipped branches are not pushed, since they are not what upstream has
+
+	if not synced_branch_names:
+		raise UserWarning("None of the branches could be synced")
+
+	print(color_text(
+		"Pushing %s to origin" % ", ".join(synced_branch_names), "status"
+	))
+
+	ret = git_run("push", "origin", *synced_branch_names)
+
+	if ret != 0:
+		raise UserWarning("Could not push to origin")
+
+	for branch_name, old_head, new_head in updated_ranges:
+		ref_spec = "%s..%s" % (old_head, new_head)
+
+		print("")
+		print("Updated %s from %s to %s (%s)" % (
+			branch_name, old_head, new_head, ref_spec
+		))
+		print("---------------------------------------------------")
+
+		command_of_interest(ref_spec)
+
+	print("")
+	print(color_text("Sync completed", "success"))
+
+
+def command_update(repo_name, target=None):
+	if target == None:
+		branch_name = get_current_branch_name()
+	else:
+		try:
+			pull_request_ID = int(target)
+			pull_request = get_pull_request(repo_name, pull_request_ID)
+			branch_name = build_branch_name(pull_request)
+		except ValueError:
+			branch_name = target
+
+	print(color_text(
+		"Updating %s from %s" % (branch_name, options["update-branch"]), "status"
+	))
+
+	update_branch(branch_name)
+	print
+	display_status()
+
+
+def command_update_meta():
+	update_meta()
+
+
+def command_update_users(
+	filename, url=None, github_users=None, total_pages=0, all_pages=True
+):
+	if url is None:
+		user_organization = options["user-organization"]
+
+		if user_organization:
+			url = get_api_url("orgs/%s/members?per_page=100" % user_organization)
+		else:
+			url = get_api_url("repos/%s/forks" % get_repo_name_for_remote("upstream"))
+
+			params = {"per_page": "100", "sort": "oldest"}
+
+			url_parts = list(urllib.parse.urlparse(url))
+			query = dict(urllib.parse.parse_qsl(url_parts[4]))
+			query.update(params)
+
+			url_parts[4] = urllib.parse.urlencode(query)
+
+			url = urllib.parse.urlunparse(url_parts)
+
+	if github_users is None:
+		github_users = {}
+
+	# forks are listed with their owner, members are listed as users
+
+	logins = [
+		item["owner"]["login"] if "owner" in item else item["login"]
+		for item in github_json_stream(url, all_pages=False)
+	]
+
+	m = re.search(r"[?&]page=(\d+)", url)
+
+	if m is not None and m.group(1) != "":
+		print("Doing another request for page: %s of %s" % (m.group(1), total_pages))
+	else:
+		print("There are more than %s users, this could take a few minutes..." % len(
+			logins
+		))
+
+	user_api_url = get_api_url("users")
+
+	github_users_info = github_gather(
+		[
+			functools.partial(github_json_request, "%s/%s" % (user_api_url, login))
+			for login in logins
+		],
+		return_exceptions=True,
+	)
+
+	failed_logins = set()
+
+	for login, github_user_info in zip(logins, github_users_info):
+		if isinstance(github_user_info, Exception):
+			failed_logins.add(login)
+			continue
+
+		email = get_user_email(github_user_info)
+
+		if email != None:
+			github_users[email] = login
+
+	# the users that could not be looked up keep the aliases they had, instead
+	# of failing the whole update
+
+	if failed_logins:
+		print(color_text(
+			"Could not look up %s users, keeping their previous aliases"
+			% len(failed_logins),
+			"warning",
+		))
+
+		for email, login in load_users(filename).items():
+			if login in failed_logins:
+				github_users.setdefault(email, login)
+
+	if all_pages:
+		link_header = get_link_header(url)
+
+		if link_header is not None:
+			m = re.search(r'<([^>]+)>; rel="next",', link_header)
+
+			if m is not None and m.group(1) != "":
+				url = m.group(1)
+
+				if total_pages == 0:
+					m1 = re.search(
+						r'<[^>]+[&?]page=(\d+)[^>]*>; rel="last"', link_header
+					)
+
+					if m1 is not None and m1.group(1) != "":
+						total_pages = m1.group(1)
+
+				command_update_users(filename, url, github_users, total_pages)
+
+	github_users_file = open(filename, "w")
+	json.dump(github_users, github_users_file)
+
+	github_users_file.close()
+
+	return github_users
+
+
+def complete_update(branch_name):
+	update_branch_option = options["update-branch"]
+
+	if in_work_dir():
+		ret = git_run("checkout", update_branch_option)
+		if ret != 0:
+			raise UserWarning(
+				"Could not checkout %s branch in work directory" % update_branch_option
+			)
+
+		original_dir_path = get_original_dir_path()
+
+		print(color_text(
+			"Switching to original directory: '%s'" % original_dir_path, "status"
+		))
+
+		os.chdir(original_dir_path)
+		chdir(original_dir_path)
+
+		if get_current_branch_name(False) == branch_name:
+			ret = git_run("reset", "--hard") or git_run("clean", "-f")
+			if ret != 0:
+				raise UserWarning(
+					"Syncing branch %s with work directory failed" % branch_name
+				)
+		else:
+			ret = git_run("checkout", branch_name)
+			if ret != 0:
+				raise UserWarning("Could not checkout %s" % branch_name)
+
+	update_branch_option = options["update-branch"]
+
+	branch_treeish = update_meta()
+
+	print
+	print(color_text(
+		"Updating %s from %s complete" % (branch_name, update_branch_option), "success"
+	))
+
+
+def continue_update():
+	if options["update-method"] == "merge":
+		ret = git_run("commit")
+	elif options["update-method"] == "rebase":
+		ret = git_run("rebase", "--continue")
+
+	if ret != 0:
+		raise UserWarning(
+			"Updating from %s failed\nResolve conflicts and 'git add' files, then run 'gitpr continue-update'"
+			% options["update-branch"]
+		)
+
+	# The branch name will not be correct until the merge/rebase is complete
+	branch_name = get_current_branch_name()
+
+	complete_update(branch_name)
+
+
+def delete_branch(branch_name):
+	"""Deletes a local branch and returns the exit code of git branch"""
+
+	ret = git_run("branch", "-D", branch_name)
+
+	if ret == 0:
+		PULL_REQUEST_BRANCHES.get(get_git_dirs()[1], set()).discard(branch_name)
+
+	return ret
+
+
+def display_pull_request(pull_request):
+	"""Nicely display_pull_request info about a given pull request"""
+
+	from textwrap import fill
+
+	display_pull_request_minimal(pull_request)
+
+	description_indent = options["description-indent"]
+
+	print("%s%s" % (
+		description_indent,
+		color_text(pull_request.html_url, "display-title-url"),
+	))
+
+	pr_body = pull_request.body
+
+	if pr_body and pr_body.strip():
+		pr_body = strip_html_tags(pr_body)
+
+		pr_body = re.sub(r"(<br\s?/?>)", "\n", pr_body.strip())
+
+		if options["description-strip-newlines"]:
+			pr_body = fill(
+				pr_body,
+				initial_indent=description_indent,
+				subsequent_indent=description_indent,
+				width=80,
+			)
+		else:
+			# Normalize newlines
+			pr_body = re.sub("\r?\n", "\n", pr_body)
+
+			pr_body = pr_body.splitlines()
+
+			pr_body = [
+				fill(
+					line.strip(),
+					initial_indent=description_indent,
+					subsequent_indent=description_indent,
+					width=80,
+				)
+				for line in pr_body
+			]
+
+			pr_body = "\n".join(pr_body)
+
+		pr_body = strip_empty_lines(pr_body)
+
+		if ((options["description-line-limit"] >= 0) and (len(pr_body.splitlines()) > options["description-line-limit"])):
+			pr_body = pr_body.splitlines()
+			pr_body = pr_body[:options["description-line-limit"]]
+			pr_body = "\n".join(pr_body)
+			#pr_body += "..."
+
+		if ((options["description-char-limit"] >= 0) and (len(pr_body) > options["description-char-limit"])):
+			pr_body = pr_body[:options["description-char-limit"]] # + '...'
+
+		print(pr_body)
+
+	print
+
+
+def display_pull_request_minimal(pull_request, return_text=False):
+	"""Display minimal info about a given pull request"""
+
+	text = "%s - %s (%s)" % (
+		color_text(
+			"REQUEST %s" % pull_request.number, "display-title-number", True
+		),
+		color_text(pull_request.title, "display-title-text", True),
+		color_text(pull_request.user_login, "display-title-user"),
+	)
+
+	if return_text:
+		return text
+
+	print(text)
+
+
+def display_indexed_pull_requests(index, pull_request_IDs):
+	"""Displays the pull requests of the search index, the most recent first"""
+
+	if not pull_request_IDs:
+		print("No pull requests found")
+		return
+
+	for pull_request_ID in sorted(pull_request_IDs, reverse=True):
+		document = index["pull_requests"][str(pull_request_ID)]
+
+		text = "%s - %s (%s)" % (
+			color_text("REQUEST %s" % pull_request_ID, "display-title-number", True),
+			color_text(document["title"], "display-title-text", True),
+			color_text(document["user"], "display-title-user"),
+		)
+
+		if document["state"] != "open":
+			text = "%s [%s]" % (text, document["state"])
+
+		print(text)
+
+
+def display_status():
+	"""Displays the current branch name"""
+
+	branch_name = get_current_branch_name(False)
+	out = "Current branch: %s" % branch_name
+	print(out)
+	return out
+
+
+def fetch_branch(repo_url, remote_branch_name, branch_name, fetch_filter=None):
+	"""Fetches a remote branch into a local branch, and returns whether the
+	local branch exists afterwards.
+
+	With a filter, the objects it leaves out are fetched later, when they are
+	needed, from the promisor remote of the repository (see
+	get_promisor_remote)."""
+
+	filter_args = []
+
+	if fetch_filter:
+		filter_args = ["--filter=%s" % fetch_filter]
+
+		repo_url = get_promisor_remote(repo_url)
+
+	ret = git_run(
+		"fetch", *filter_args, repo_url, "%s:%s" % (remote_branch_name, branch_name)
+	)
+
+	if ret != 0 and not git_rev_parse("refs/heads/%s" % branch_name):
+		return False
+
+	if branch_name[0:13] == "pull-request-":
+		PULL_REQUEST_BRANCHES.get(get_git_dirs()[1], set()).add(branch_name)
+
+	return True
+
+
+def fetch_pull_request(pull_request, repo_name, fetch_filter=None):
+	"""Fetches a pull request into a local branch, and returns the name of the
+	local branch. The filter, if any, applies to the fetch from the repository
+	the pull request was sent to."""
+
+	branch_name = build_branch_name(pull_request)
+	repo_url = get_repo_url(pull_request, repo_name)
+
+	remote_branch_name = "refs/pull/%s/head" % pull_request.number
+
+	if not branch_exists(branch_name) and not fetch_branch(
+		repo_url, remote_branch_name, branch_name, fetch_filter
+	):
+		print("Could not get from refs/pull/%s/head, trying to brute force the fetch" % pull_request.number)
+
+		repo_url = get_repo_url(pull_request, repo_name, True)
+		remote_branch_name = pull_request.head_ref
+
+		if not fetch_branch(repo_url, remote_branch_name, branch_name):
+			raise UserWarning("Fetch failed")
+
+	try:
+		os.remove(get_tmp_path("git-pull-request-treeish-%s" % pull_request.number))
+	except OSError:
+		pass
+
+	return branch_name
+
+
+def fetch_pull_requests(pull_requests, repo_name, fetch_filter=None):
+	"""Fetches the pull requests that have no local branch yet with a single
+	git fetch, falling back to fetching them one by one, and returns their
+	branch names by pull request number. The filter works as in fetch_branch."""
+
+	branch_names = dict(
+		(pull_request.number, build_branch_name(pull_request))
+		for pull_request in pull_requests
+	)
+
+	missing = [
+		pull_request
+		for pull_request in pull_requests
+		if not branch_exists(branch_names[pull_request.number])
+	]
+
+	if not missing:
+		return branch_names
+
+	repo_url = get_repo_url(missing[0], repo_name)
+	filter_args = []
+
+	if fetch_filter:
+		filter_args = ["--filter=%s" % fetch_filter]
+
+		repo_url = get_promisor_remote(repo_url)
+
+	ret = git_run(
+		"fetch",
+		*filter_args,
+		repo_url,
+		*[
+			"refs/pull/%s/head:%s" % (pull_request.number, branch_names[pull_request.number])
+			for pull_request in missing
+		]
+	)
+
+	for pull_request in missing:
+		if ret == 0:
+			PULL_REQUEST_BRANCHES.get(get_git_dirs()[1], set()).add(
+				branch_names[pull_request.number]
+			)
+		else:
+			fetch_pull_request(pull_request, repo_name, fetch_filter)
+
+		write_branch_info(pull_request)
+
+	return branch_names
+
+
+def forget_requests(url):
+	"""Drops the memoized responses that a request changing the resource at the
+	URL may have made stale: those of the resource and of the resources that
+	contain it (a pull request is also an issue)"""
+
+	path = url.split("?")[0]
+
+	paths = set([
+		path,
+		re.sub(r"/issues/(\d+)", r"/pulls/\1", path),
+		re.sub(r"/pulls/(\d+)", r"/issues/\1", path),
+	])
+
+	with REQUEST_MEMO_LOCK:
+		for key in list(REQUEST_MEMO):
+			key_path = key.split("?")[0]
+
+			if any(
+				path == key_path or path.startswith(key_path + "/") for path in paths
+			):
+				del REQUEST_MEMO[key]
+
+
+def get_api_url(command):
+	return URL_BASE % command
+
+
+def get_close_comment(repo_name, pull_request_ID, comment=None):
+	"""Returns the comment to post when closing the pull request: the
+	'close-default-comment' setting, followed by links to the changes made
+	since the pull request was fetched, when no comment is given"""
+
+	default_comment = options["close-default-comment"]
+
+	if comment is None:
+		comment = default_comment
+
+	if comment is None or comment == default_comment:
+		try:
+			f = open(get_tmp_path("git-pull-request-treeish-%s" % pull_request_ID), "r")
+			branch_info = json.load(f)
+			f.close()
+
+			username = branch_info["username"]
+
+			updated_parent_commit = ""
+			updated_head_commit = ""
+			original_parent_commit = ""
+			original_head_commit = ""
+
+			if "original" in branch_info:
+				original = branch_info["original"]
+				original_parent_commit = original["parent_commit"]
+				original_head_commit = original["head_commit"]
+
+			if "updated" in branch_info:
+				updated = branch_info["updated"]
+				updated_parent_commit = updated["parent_commit"]
+				updated_head_commit = updated["head_commit"]
+
+			current_head_commit = git_rev_parse("HEAD")[0:10]
+
+			my_diff_comment = ""
+
+			diff_commit = False
+
+			if original_head_commit != current_head_commit:
+				original_patch_ids = get_patch_ids(
+					pull_request_ID, original_parent_commit, original_head_commit
+				)
+				current_patch_ids = get_patch_ids(
+					pull_request_ID,
+					updated_parent_commit or original_parent_commit,
+					current_head_commit,
+				)
+
+				diff_commit = original_patch_ids != current_patch_ids
+
+			if (updated_head_commit or original_head_commit) == current_head_commit:
+				diff_commit = False
+
+			if diff_commit:
+				my_diff_comment = (
+					"\n\nView just my changes: https://github.com/%s/compare/%s:%s...%s"
+					% (
+						repo_name,
+						username,
+						updated_head_commit or original_head_commit,
+						current_head_commit,
+					)
+				)
+
+			if comment is None:
+				comment = ""
+
+			new_pr_url = meta("new_pr_url")
+
+			if new_pr_url and new_pr_url != "":
+				comment += "\nPull request submitted at: %s" % new_pr_url
+
+			comment += my_diff_comment
+
+			comment += "\nView total diff: https://github.com/%s/compare/%s...%s" % (
+				repo_name,
+				(updated_parent_commit or original_parent_commit),
+				current_head_commit,
+			)
+		except Exception:
+			pass
+
+	return comment
+
+
+def get_committers(merge_base, branch_name):
+	"""Returns the comma separated names of the authors of the commits in the
+	range, in the order of their first commit"""
+
+	authors = git_output(
+		"log", "%s..%s" % (merge_base, branch_name), "--pretty=%an", "--reverse"
+	).splitlines()
+
+	return ", ".join(dict.fromkeys(authors))
+
+
+def get_config(key):
+	"""Returns the value of a git config key (the last one if it is set more
+	than once), or a blank string if it is not set"""
+
+	# section and variable names are case insensitive, and listed in lower case
+
+	parts = key.split(".")
+	parts[0] = parts[0].lower()
+	parts[-1] = parts[-1].lower()
+
+	return get_config_snapshot().get(".".join(parts), "")
+
+
+def get_config_snapshot():
+	"""Returns every git config value that applies to the current directory,
+	read by a single git config -l. The snapshot is read again when one of the
+	files it was read from, the global config files or the GIT_* environment
+	variables change"""
+
+	cwd = os.getcwd()
+	snapshot = CONFIG_SNAPSHOTS.get(cwd)
+
+	if snapshot is not None and snapshot[0] == get_config_stamp(snapshot[1]):
+		return snapshot[2]
+
+	xdg_config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser(
+		"~/.config"
+	)
+
+	paths = set([
+		os.path.expanduser("~/.gitconfig"),
+		os.path.join(xdg_config_home, "git", "config"),
+		"/etc/gitconfig",
+	])
+
+	values = {}
+
+	ret, output = run_command(
+		["git", "config", "-l", "--show-origin", "-z"], read_only=True
+	)
+
+	# each entry is its origin and its key, followed by a newline and its value
+	# unless it has none
+
+	tokens = output.decode("utf-8", "replace").split("\0")
+
+	for origin, entry in zip(tokens[0::2], tokens[1::2]):
+		key, _, value = entry.partition("\n")
+		values[key] = value
+
+		if origin.startswith("file:"):
+			paths.add(os.path.abspath(origin[5:]))
+
+	paths = tuple(sorted(paths))
+
+	CONFIG_SNAPSHOTS[cwd] = (get_config_stamp(paths), paths, values)
+
+	return values
+
+
+def get_config_stamp(paths):
+	"""Returns what a config snapshot depends on: the modification times of the
+	config files and the environment variables git reads its config from"""
+
+	stamp = [
+		(key, value) for key, value in sorted(os.environ.items())
+		if key.startswith("GIT_") or key in ("HOME", "XDG_CONFIG_HOME")
+	]
+
+	for path in paths:
+		try:
+			stamp.append((path, os.stat(path).st_mtime_ns))
+		except OSError:
+			stamp.append((path, None))
+
+	return stamp
+
+
+def get_current_branch_name(ensure_pull_request=True):
+	"""Returns the name of the current pull request branch, read from the HEAD
+	file of the repository (or HEAD when it is detached)"""
+	with open(os.path.join(get_git_dirs()[0], "HEAD")) as f:
+		head = f.read().strip()
+
+	if head.startswith("ref: refs/heads/"):
+		branch_name = head[16:]
+	else:
+		branch_name = "HEAD"
+
+	if ensure_pull_request and branch_name[0:13] != "pull-request-":
+		raise UserWarning("Invalid branch: not a pull request")
+
+	return branch_name
+
+
+def get_default_repo_name():
+	repo_name = get_config("github.repo")
+
+	# get repo name from origin
+	if repo_name is None or repo_name == "":
+		repo_name = get_repo_name_for_remote("origin")
+
+	if repo_name is None or repo_name == "":
+		raise UserWarning("Failed to determine github repository name")
+
+	return repo_name
+
+
+def get_git_base_path():
+	return git_output("rev-parse", "--show-toplevel", cache=True)
+
+
+def get_git_dirs():
+	"""Returns the absolute paths of the git directory and of the common git
+	directory (which differ in linked worktrees) of the current directory"""
+
+	cwd = os.getcwd()
+
+	if cwd not in GIT_DIRS:
+		output = git_output("rev-parse", "--absolute-git-dir", "--git-common-dir")
+
+		if not output:
+			raise UserWarning("Not a git repository")
+
+		git_dir, git_common_dir = output.splitlines()
+
+		GIT_DIRS[cwd] = (git_dir, os.path.abspath(git_common_dir))
+
+	return GIT_DIRS[cwd]
+
+
+def get_http():
+	"""Returns the connection pool shared by all github requests"""
+
+	global HTTP
+
+	if HTTP is None:
+		import urllib3
+
+		# github_request retries the requests itself, and only redirects are
+		# followed here
+
+		HTTP = urllib3.PoolManager(
+			maxsize=int(options["workers"]),
+			retries=urllib3.Retry(
+				total=None, connect=0, read=0, other=0, status=0, redirect=5
+			),
+			timeout=urllib3.Timeout(
+				total=float(options["api-timeout"]) if options["api-timeout"] else None,
+				connect=float(options["api-connect-timeout"]),
+				read=float(options["api-read-timeout"]),
+			),
+		)
+
+	return HTTP
+
+
+def get_jira_ticket(text):
+	"""Returns a JIRA ticket id from the passed text, or a blank string otherwise"""
+	m = re.search(r"[A-Z]{3,}-\d+", text)
+
+	jira_ticket = ""
+
+	if m != None and m.group(0) != "":
+		jira_ticket = m.group(0)
+
+	return jira_ticket
+
+
+def get_link_header(url):
+	"""Returns the Link header of the last response to the URL. A 304 may not
+	repeat it, so it is then read from the cached response that the 304
+	confirmed."""
+
+	response = MAP_RESPONSE[url]
+
+	link_header = response.headers.get("Link")
+
+	if link_header is None and response.status == 304:
+		cached = RESPONSE_CACHE.get((url, auth_token))
+
+		if cached is not None:
+			link_header = cached[1]
+
+	return link_header
+
+
+def get_local_changes(merge_base, branch_name, name_only=False):
+	"""Returns the (path, insertions, deletions) of every file changed on the
+	branch since the merge base, from a local diff. The line counts are None
+	for binary files, and with name_only, which reads no file contents."""
+
+	if name_only:
+		paths = git_output(
+			"diff", "--name-only", "-z", "%s..%s" % (merge_base, branch_name)
+		).split("\0")
+
+		return [(path, None, None) for path in paths if path]
+
+	changes = []
+
+	numstat = iter(git_output(
+		"diff", "--numstat", "-z", "%s..%s" % (merge_base, branch_name)
+	).split("\0"))
+
+	for line in numstat:
+		if not line:
+			continue
+
+		added, deleted, path = line.split("\t", 2)
+
+		# renames are followed by the source and destination paths
+
+		if not path:
+			next(numstat)
+			path = next(numstat)
+
+		# binary files are reported as "-" lines
+
+		if added == "-":
+			changes.append((path, None, None))
+		else:
+			changes.append((path, int(added), int(deleted)))
+
+	return changes
+
+
+def get_original_dir_path():
+	git_base_path = get_git_base_path()
+
+	f = open(os.path.join(get_work_dir(), ".git", "original_dir_path"), "r")
+	original_dir_path = f.read()
+	f.close()
+
+	if original_dir_path == None or original_dir_path == "":
+		config_path = os.readlink(os.path.join(git_base_path, ".git", "config"))
+		original_dir_path = os.path.dirname(os.path.dirname(config_path))
+
+	return original_dir_path
+
+
+def get_patch_ids(pull_request_ID, parent_commit, head_commit):
+	"""Returns the sorted stable patch ids of the commits between the parent
+	and head commits, which are cached by the SHA of the head commit until the
+	pull request is closed (see remove_patch_ids)"""
+
+	head_sha = git_rev_parse(head_commit)
+
+	cache_path = get_tmp_path(
+		"git-pull-request-patch-ids-%s-%s" % (pull_request_ID, head_sha)
+	)
+
+	try:
+		f = open(cache_path, "r")
+		cache = json.load(f)
+		f.close()
+
+		if cache["parent_commit"] == parent_commit:
+			return cache["patch_ids"]
+	except (IOError, ValueError, KeyError):
+		pass
+
+	ret, log = run_command(
+		[
+			"git",
+			"log",
+			"-p",
+			"--no-merges",
+			"--no-color",
+			"%s..%s" % (parent_commit, head_sha),
+		],
+		read_only=True,
+	)
+	ret, output = run_command(
+		["git", "patch-id", "--stable"], input=log, read_only=True
+	)
+
+	patch_ids = sorted(
+		line.split(b" ")[0].decode("utf-8") for line in output.splitlines()
+	)
+
+	f = open(cache_path, "w")
+	json.dump({"parent_commit": parent_commit, "patch_ids": patch_ids}, f)
+	f.close()
+
+	return patch_ids
+
+
+def get_pr_stats(
+	repo_name, pull_request_ID, name_only=False, changes=None, remote=None
+):
+	"""Displays the pull request with the number of changed files and lines.
+
+	The changes are read from a local diff when the pull request's objects are
+	present (or with a stats-footer, which needs the commits), and listed by
+	the github API otherwise, so that nothing has to be fetched. The
+	'stats-source' setting forces either one, and so does remote."""
+
+	if pull_request_ID != None:
+		# the listing passes the pull requests themselves
+
+		if isinstance(pull_request_ID, PullRequest):
+			pull_request = pull_request_ID
+		else:
+			try:
+				pull_request_ID = int(pull_request_ID)
+			except (TypeError, ValueError):
+				raise UserWarning("Invalid pull request ID: %s" % pull_request_ID)
+
+			pull_request = get_pull_request(repo_name, pull_request_ID)
+
+		display_pull_request_minimal(pull_request)
+
+		merge_base = None
+
+		if remote is None:
+			remote = use_remote_stats(pull_request)
+
+		if changes is None and remote:
+			changes = get_remote_changes(repo_name, pull_request)
+		elif changes is None:
+			branch_name = build_branch_name(pull_request)
+
+			if not branch_exists(branch_name):
+				branch_name = fetch_pull_request(
+					pull_request, repo_name, options["fetch-filter"]
+				)
+
+			merge_base = git_output(
+				"merge-base", options["update-branch"], branch_name, cache=True
+			)
+
+			changes = get_local_changes(merge_base, branch_name, name_only)
+
+		files = len(changes)
+		insertions = 0
+		deletions = 0
+		extensions = {}
+
+		for path, added, deleted in changes:
+			if name_only:
+				print("	%s" % path)
+
+			# binary files have no line counts
+
+			if added is not None:
+				insertions += added
+				deletions += deleted
+
+			extension = path.rsplit(".", 1)[-1]
+			extensions[extension] = extensions.get(extension, 0) + 1
+
+		# formatted the same way as git diff --shortstat
+
+		shortstat = color_text(
+			"%d file%s changed" % (files, "" if files == 1 else "s"), "stats-total"
+		)
+
+		if name_only:
+			print(shortstat)
+		else:
+			if insertions or not deletions:
+				shortstat += ", " + color_text(
+					"%d insertion%s(+)" % (insertions, "" if insertions == 1 else "s"),
+					"stats-added",
+				)
+
+			if deletions or not insertions:
+				shortstat += ", " + color_text(
+					"%d deletion%s(-)" % (deletions, "" if deletions == 1 else "s"),
+					"stats-deleted",
+				)
+
+			stats = (insertions + deletions) / max(files, 1)
+
+			stats = color_text(
+				"Average %d change(s) per file" % stats, "stats-average-change"
+			)
+
+			print("%s, %s" % (shortstat, stats))
+
+		print(",".join(
+			"%7d %s" % (extensions[extension], extension)
+			for extension in sorted(extensions)
+		))
+
+		stats_footer = options["stats-footer"]
+
+		if stats_footer and merge_base is not None:
+			committers = get_committers(merge_base, branch_name)
+
+			fn = False
+
+			if stats_footer.startswith("`"):
+				stats_footer = stats_footer[1:]
+				fn = True
+
+			footer_tpl = Template(stats_footer)
+
+			pr_obj = pull_request.as_dict()
+			pr_obj.update(
+				{
+					"merge_base": merge_base[0:8],
+					"branch_name": branch_name,
+					"committers": committers,
+					"NEWLINE": os.linesep,
+				}
+			)
+
+			footer_result = footer_tpl.safe_substitute(**pr_obj)
+
+			if fn:
+				footer_result = shell_output(footer_result)
+
+			print(footer_result)
+		elif stats_footer and pull_request is not pull_request_ID:
+			print(color_text(
+				"The stats-footer needs the commits, and is not shown with "
+				"stats-source=remote",
+				"warning",
+			))
+	else:
+		pull_requests = get_pull_requests(repo_name, options["filter-by-update-branch"])
+
+		# the changes of the pull requests that are not available locally are
+		# listed at the same time
+
+		remote_pull_requests = [
+			pull_request
+			for pull_request in pull_requests
+			if use_remote_stats(pull_request)
+		]
+
+		remote_changes = dict(zip(
+			[pull_request.number for pull_request in remote_pull_requests],
+			github_gather(
+				[
+					functools.partial(get_remote_changes, repo_name, pull_request)
+					for pull_request in remote_pull_requests
+				],
+				return_exceptions=True,
+			),
+		))
+
+		if options["stats-footer"] and remote_pull_requests:
+			print(color_text(
+				"The stats-footer needs the commits, and is not shown with "
+				"stats-source=remote",
+				"warning",
+			))
+
+		for pull_request in pull_requests:
+			changes = remote_changes.get(pull_request.number)
+			remote = None
+
+			# the pull requests whose changes github could not list are diffed
+			# locally instead
+
+			if isinstance(changes, Exception):
+				print(color_text(
+					"Could not list the changes of pull request %s on github, "
+					"fetching it: %s" % (pull_request.number, changes),
+					"warning",
+				))
+
+				changes = None
+				remote = False
+
+			get_pr_stats(repo_name, pull_request, name_only, changes, remote)
+
+
+def get_profile_phase():
+	"""Returns the name of the command_* function (or the function called by
+	main) that the current git process or request belongs to"""
+
+	frames = [sys._getframe()]
+
+	main_frame = sys._current_frames().get(threading.main_thread().ident)
+
+	if threading.current_thread() is not threading.main_thread() and main_frame:
+		frames.append(main_frame)
+
+	for frame in frames:
+		phase = None
+
+		while frame is not None:
+			name = frame.f_code.co_name
+
+			# the server runs main from command_server
+
+			if name == "main":
+				break
+
+			if name.startswith("command_"):
+				return name
+
+			if (
+				frame.f_back is not None
+				and frame.f_back.f_code.co_name == "main"
+				and frame.f_code not in EXECUTOR_CODE
+			):
+				phase = name
+
+			frame = frame.f_back
+
+		if phase:
+			return phase
+
+	return "main"
+
+
+def get_promisor_remote(repo_url):
+	"""Returns the name of the remote that filtered fetches from the repository
+	go through, adding it if needed. Every repository has its own remote, named
+	after a hash of its URL, since git fetches the objects that a filter left
+	out from the promisor remote they came from."""
+
+	import hashlib
+
+	remote_name = "pull-requests-%s" % hashlib.sha1(
+		repo_url.encode("utf-8")
+	).hexdigest()[0:10]
+
+	if get_config("remote.%s.url" % remote_name) != repo_url:
+		git_run("config", "remote.%s.url" % remote_name, repo_url)
+		git_run("config", "remote.%s.skipFetchAll" % remote_name, "true")
+
+	return remote_name
+
+
+def get_pull_request(repo_name, pull_request_ID):
+	"""Returns information retrieved from github about the pull request"""
+
+	url = get_api_url("repos/%s/pulls/%s" % (repo_name, pull_request_ID))
+
+	data = github_json_request(url, object_hook=PullRequest.object_hook)
+
+	if not isinstance(data, PullRequest):
+		raise UserWarning(
+			"Could not find pull request %s: %s" % (pull_request_ID, data.get("message"))
+		)
+
+	return data
+
+
+def get_pull_request_ID(branch_name):
+	"""Returns the pull request number of the branch with the name"""
+
+	m = re.search(r"^pull-request-(\d+)", branch_name)
+
+	pull_request_ID = None
+
+	if m and m.group(1) != "":
+		pull_request_ID = int(m.group(1))
+
+	return pull_request_ID
+
+
+def get_pull_request_IDs_older_than(repo_name, days, action):
+	"""Returns the numbers of the open pull requests that were last updated
+	more than the number of days ago, once they have been listed and the user
+	confirmed the action on them (which dry-run does not ask for)"""
+
+	import calendar
+
+	limit = time.time() - float(days) * 86400
+
+	pull_requests = [
+		pull_request
+		for pull_request in get_pull_requests(
+			repo_name, options["filter-by-update-branch"]
+		)
+		if calendar.timegm(time.strptime(pull_request.updated_at, "%Y-%m-%dT%H:%M:%SZ"))
+		< limit
+	]
+
+	for pull_request in pull_requests:
+		display_pull_request_minimal(pull_request)
+
+	print("")
+
+	if pull_requests and not options["dry-run"]:
+		answer = input(
+			"%s these %s pull requests? [y/N] " % (action, len(pull_requests))
+		)
+
+		if answer.strip().lower() not in ("y", "yes"):
+			raise UserWarning("Cancelled")
+
+	return [pull_request.number for pull_request in pull_requests]
+
+
+def get_pull_requests(repo_name, filter_by_update_branch=False):
+	"""Returns information retrieved from github about the open pull requests on
+	the repository"""
+
+	url = get_api_url("repos/%s/pulls?per_page=100" % repo_name)
+
+	pulls = github_json_stream(url, PullRequest.object_hook)
+
+	if filter_by_update_branch:
+		update_branch = options["update-branch"]
+
+		pull_requests = [pull for pull in pulls if pull.base_ref == update_branch]
+	else:
+		pull_requests = list(pulls)
+
+	return pull_requests
+
+
+def get_ref_spec(rev=None):
+	"""Returns a commit range for the passed revision, the same way the
+	get-custom-refspec git alias does"""
+
+	if rev is None or rev == "":
+		rev = "HEAD"
+
+	if rev == "^":
+		rev = "HEAD^.."
+
+	if ".." in rev:
+		return rev
+
+	return "%s^..%s" % (rev, rev)
+
+
+def get_repo_name_for_remote(remote_name):
+	"""Returns the repository name for the remote with the name"""
+
+	remotes = git_output("remote", "-v", cache=True)
+
+	m = re.search(
+		r"^%s[^\n]+?github\.com[^\n]*?[:/]([^\n]+?)\.git" % remote_name,
+		remotes,
+		re.MULTILINE,
+	)
+
+	if m is not None and m.group(1) != "":
+		return m.group(1)
+
+
+def get_repo_url(pull_request, repo_name, force=False):
+	"""Returns the git URL of the repository the pull request originated from"""
+
+	if force is False:
+		repo_url = "git@github.com:%s.git" % repo_name
+	else:
+		repo_url = pull_request.head_repo_html_url.replace("https", "git")
+
+		if pull_request.head_repo_private:
+			repo_url = pull_request.head_repo_ssh_url
+
+	return repo_url
+
+
+def get_remote_changes(repo_name, pull_request):
+	"""Returns the (path, insertions, deletions) of every file changed by the
+	pull request, as listed by the github API"""
+
+	url = get_api_url(
+		"repos/%s/pulls/%s/files?per_page=100" % (repo_name, pull_request.number)
+	)
+
+	return [
+		(item["filename"], item["additions"], item["deletions"])
+		for item in github_json_stream(url)
+	]
+
+
+def get_retry_after(status, headers, body=None, changes=False):
+	"""Returns the number of seconds github asks to wait before a request that
+	got the status is sent again (0 when it does not say), or None when it
+	should not be retried.
+
+	Requests that change something are only retried after a secondary rate
+	limit, which github answers before doing anything."""
+
+	retry_after = headers.get("Retry-After")
+
+	if status in (403, 429):
+		limited = status == 429 or retry_after is not None
+
+		if not limited and body:
+			limited = b"secondary rate limit" in body
+
+		if not limited:
+			return None
+	elif status not in (500, 502, 503, 504) or changes:
+		return None
+
+	try:
+		return max(float(retry_after or 0), 0)
+	except ValueError:
+		return 0
+
+
+def get_retry_delay(attempt, retry_after=None):
+	"""Returns the seconds to wait before retrying a request: an exponential
+	backoff with full jitter, and at least what github asked for"""
+
+	import random
+
+	delay = random.uniform(0, min(2 ** attempt, 30))
+
+	return max(delay, retry_after or 0)
+
+
+def get_review_path():
+	"""Returns the directory of the worktrees created by review-queue, which is
+	next to the main worktree by default, so that tools run in the main
+	worktree do not walk into them"""
+
+	if options["review-dir"]:
+		return options["review-dir"]
+
+	# the first worktree listed is the main one
+
+	main_path = git_output("worktree", "list", "--porcelain").splitlines()[0][9:]
+
+	return "%s-review" % main_path.rstrip("/")
+
+
+def get_search_index_path(repo_name):
+	"""Returns the path of the search index of the repository, each repository
+	having its own, so that syncing one leaves the others alone"""
+
+	return os.path.join(
+		get_git_dirs()[1], "gitpr-search", "%s.json" % repo_name
+	)
+
+
+def get_search_terms(text):
+	"""Returns the lowercase words of the text, as they are indexed"""
+
+	return set(re.findall(r"[a-z0-9]+", (text or "").lower()))
+
+
+def get_server_path():
+	"""Returns the path of the server socket, in a directory that only the
+	user can access, which gitpr-client.py and git-pull-request.sh compute the
+	same way"""
+
+	return os.path.join(
+		os.environ.get("TMPDIR") or "/tmp",
+		"git-pull-request-%d" % os.getuid(),
+		"server.sock",
+	)
+
+
+def get_tmp_path(filename):
+	global TMP_PATH
+
+	if TMP_PATH is None:
+		import tempfile
+
+		TMP_PATH = tempfile.gettempdir() + "/%s"
+
+	return TMP_PATH % filename
+
+
+def get_user_email(github_user_info):
+	email = None
+
+	if "email" in github_user_info:
+		email = github_user_info["email"]
+
+		if email != None and email.endswith("@liferay.com"):
+			email = email[:-12]
+
+			if email.isdigit():
+				email = None
+		else:
+			email = None
+
+	if email == None:
+		if (
+			"name" in github_user_info
+			and github_user_info["name"] != None
+			and " " in github_user_info["name"]
+		):
+			email = github_user_info["name"].lower()
+			email = email.replace(" ", ".")
+			email = email.replace("(", ".")
+			email = email.replace(")", ".")
+
+			email = re.sub(r"\.+", ".", email)
+
+			# Unicode characters usually do not appear in Liferay emails, so
+			# we'll replace them with the closest ASCII equivalent
+
+			email = email.replace(u"\u00e1", "a")
+			email = email.replace(u"\u00e3", "a")
+			email = email.replace(u"\u00e9", "e")
+			email = email.replace(u"\u00f3", "o")
+			email = email.replace(u"\u00fd", "y")
+			email = email.replace(u"\u0107", "c")
+			email = email.replace(u"\u010d", "c")
+			email = email.replace(u"\u0151", "o")
+			email = email.replace(u"\u0161", "s")
+
+	return email
+
+
+def get_work_dir():
+	global _work_dir
+
+	if _work_dir == None:
+		symbolic_ref = get_current_branch_name(False)
+
+		if symbolic_ref == "HEAD":
+			symbolic_ref = ""
+
+		work_dir_global = options["work-dir"]
+
+		work_dir_option = None
+
+		if symbolic_ref:
+			work_dir_option = "work-dir-%s" % symbolic_ref
+
+		if work_dir_option:
+			_work_dir = get_config("git-pull-request.%s" % work_dir_option)
+			options[work_dir_option] = _work_dir
+
+		if not _work_dir or not os.path.exists(_work_dir):
+			_work_dir = False
+
+		if not _work_dir:
+			if work_dir_global and os.path.exists(work_dir_global):
+				_work_dir = work_dir_global
+			else:
+				_work_dir = False
+
+	return _work_dir
+
+
+def git_output(*args, **kwargs):
+	"""Runs a read only git command and returns its output as a stripped
+	string"""
+
+	kwargs.setdefault("read_only", True)
+
+	ret, output = run_command(("git",) + args, **kwargs)
+
+	return output.decode("utf-8", "replace").strip()
+
+
+def git_rev_parse(rev):
+	"""Returns the SHA of an object name, or a blank string if it does not
+	exist. Names are looked up by a git cat-file process that is kept running
+	until the command finishes, so that no process is started per lookup"""
+
+	global GIT_BATCH
+
+	cwd = os.getcwd()
+
+	if GIT_BATCH is not None and GIT_BATCH[0] != cwd:
+		close_git_batch()
+
+	with GIT_BATCH_LOCK:
+		if GIT_BATCH is None:
+			process = subprocess.Popen(
+				["git", "cat-file", "--batch-check=%(objectname)"],
+				stdin=subprocess.PIPE,
+				stdout=subprocess.PIPE,
+				stderr=subprocess.DEVNULL,
+			)
+
+			GIT_BATCH = [cwd, process, time.perf_counter(), 0]
+
+		process = GIT_BATCH[1]
+
+		try:
+			process.stdin.write(rev.encode("utf-8") + b"\n")
+			process.stdin.flush()
+			line = process.stdout.readline()
+		except OSError:
+			line = b""
+
+		GIT_BATCH[3] += len(line)
+
+	line = line.decode("utf-8", "replace").strip()
+
+	# missing and ambiguous names are echoed back followed by the reason
+
+	if not re.match(r"^[0-9a-f]{40,64}$", line):
+		return ""
+
+	return line
+
+
+def git_run(*args, **kwargs):
+	"""Runs a git command with its output going to the terminal and returns its
+	exit code"""
+
+	ret, output = run_command(("git",) + args, capture=False, **kwargs)
+
+	return ret
+
+
+def git_stream(*args, chunk_size=65536):
+	"""Runs a read only git command and yields its output in chunks of bytes as
+	it is produced"""
+
+	args = ("git",) + args
+	size = 0
+	start = time.perf_counter()
+
+	process = subprocess.Popen(args, stdout=subprocess.PIPE)
+
+	try:
+		while True:
+			chunk = process.stdout.read(chunk_size)
+
+			if not chunk:
+				break
+
+			size += len(chunk)
+
+			yield chunk
+	finally:
+		process.stdout.close()
+		process.wait()
+
+		for hook in EXECUTOR_HOOKS:
+			hook(args, start, process.returncode, size, process.returncode != 0)
+
+
+def github_gather(calls, return_exceptions=False):
+	"""Runs the functions, which send requests to github, at the same time on
+	'workers' threads and returns their results in the same order.
+
+	When one of them fails, the ones that have not started yet are cancelled
+	and its exception is raised once the running ones are done, which the
+	timeouts of the github requests bound. With return_exceptions, all of them
+	run and the exceptions are returned in place of the results."""
+
+	from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+	executor = ThreadPoolExecutor(max_workers=int(options["workers"]))
+
+	try:
+		futures = [executor.submit(function) for function in calls]
+
+		if not return_exceptions:
+			done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+
+			for future in pending:
+				future.cancel()
+	finally:
+		executor.shutdown(cancel_futures=True)
+
+	results = []
+
+	for future in futures:
+		if not future.cancelled() and future.exception() is not None:
+			if not return_exceptions:
+				raise future.exception()
+
+			results.append(future.exception())
+		elif not future.cancelled():
+			results.append(future.result())
+
+	return results
+
+
+def github_json_request(url, params=None, object_hook=None):
+	data = json.loads(github_request(url, params), object_hook=object_hook)
+
+	return data
+
+
+def github_json_stream(url, object_hook=None, all_pages=True):
+	"""Yields the elements of the JSON array returned by github one at a time.
+	Elements are decoded while the response is read, so that no page is ever
+	held in memory as a whole, and the Link header is followed to the next
+	pages unless all_pages is False"""
+
+	decoder = json.JSONDecoder(object_hook=object_hook)
+	separators = re.compile(r"[\s,]*")
+
+	while url:
+		start = time.perf_counter()
+
+		response = github_request(url, preload_content=False)
+
+		link_header = response.headers.get("Link")
+		chunks = response.stream(65536)
+		cached_chunks = None
+
+		if response.status == 304:
+			etag, link_header, data = RESPONSE_CACHE[(url, auth_token)]
+			chunks = [data]
+		elif RESPONSE_CACHE is not None and response.headers.get("ETag"):
+			cached_chunks = []
+
+		# a caller that stops iterating closes the generator, and the rest of
+		# the response is then discarded rather than left on the connection
+
+		complete = False
+
+		try:
+			utf8 = codecs.getincrementaldecoder("utf-8")()
+			buffer = ""
+			opened = False
+			size = 0
+
+			# a None chunk marks the end of the response
+
+			for chunk in itertools.chain(chunks, [None]):
+				if chunk is None:
+					buffer += utf8.decode(b"", True)
+				else:
+					size += len(chunk)
+					buffer += utf8.decode(chunk)
+
+					if cached_chunks is not None:
+						cached_chunks.append(chunk)
+
+				pos = separators.match(buffer).end()
+
+				if not opened:
+					if pos == len(buffer) and chunk is not None:
+						continue
+
+					if buffer[pos:pos + 1] != "[":
+						if chunk is not None:
+							continue
+
+						try:
+							message = json.loads(buffer).get("message")
+						except (AttributeError, ValueError):
+							message = None
+
+						raise UserWarning(message or "Invalid response from github")
+
+					opened = True
+					pos = separators.match(buffer, pos + 1).end()
+
+				while pos < len(buffer) and buffer[pos] != "]":
+					try:
+						element, end = decoder.raw_decode(buffer, pos)
+					except ValueError:
+						end = None
+
+					# an element that is not followed by a delimiter yet, such as a
+					# number cut by the end of the chunk, may continue in the next
+					# chunk
+
+					if end is None or (
+						chunk is not None
+						and buffer[end:end + 1] not in ("]", ",", " ", "\n", "\r", "\t")
+					):
+						if chunk is None:
+							raise UserWarning("Invalid response from github")
+
+						break
+
+					yield element
+
+					pos = separators.match(buffer, end).end()
+
+				buffer = buffer[pos:]
+
+			complete = True
+		finally:
+			if not complete:
+				response.close()
+
+			response.release_conn()
+
+		if not buffer.startswith("]"):
+			raise UserWarning("Invalid response from github")
+
+		if cached_chunks is not None:
+			cache_response(
+				url, response.headers["ETag"], link_header, b"".join(cached_chunks)
+			)
+
+		MAP_RESPONSE[url] = response
+
+		if PROFILE_RECORDS is not None:
+			profile_record(
+				"http", "GET %s" % url, start, response.status, size, response.status >= 400
+			)
+
+		url = None
+
+		if all_pages and link_header:
+			m = re.search(r'<([^>]+)>;\s*rel="next"', link_header)
+
+			if m is not None:
+				url = m.group(1)
+
+
+def github_request(url, params=None, token=None, preload_content=True):
+	"""Returns the body of the github response to the request, like
+	send_github_request.
+
+	The responses to GET requests are memoized for the rest of the command,
+	and threads asking for a URL that is being requested wait for that
+	response instead of sending another request. Requests that change
+	something drop the memoized responses of their repository."""
+
+	if params or token or not preload_content:
+		if params:
+			forget_requests(url)
+
+		return send_github_request(url, params, token, preload_content)
+
+	with REQUEST_MEMO_LOCK:
+		flight = REQUEST_MEMO.get(url)
+
+		leader = flight is None
+
+		if leader:
+			flight = REQUEST_MEMO[url] = [threading.Event(), None, None]
+
+	if not leader:
+		flight[0].wait()
+
+		if flight[2] is not None:
+			raise flight[2]
+
+		return flight[1]
+
+	try:
+		flight[1] = send_github_request(url)
+	except BaseException as e:
+		# failed requests are sent again by the next caller
+
+		flight[2] = e
+
+		with REQUEST_MEMO_LOCK:
+			if REQUEST_MEMO.get(url) is flight:
+				del REQUEST_MEMO[url]
+
+		raise
+	finally:
+		flight[0].set()
+
+	return flight[1]
+
+
+def in_work_dir():
+	git_base_path = get_git_base_path()
+
+	work_dir = get_work_dir()
+
+	return (
+		isinstance(work_dir, str)
+		and git_base_path.lower() == work_dir.lower()
+		and os.path.islink(os.path.join(git_base_path, ".git", "config"))
+	)
+
+
+def index_pull_requests(index, pull_requests):
+	"""Adds the pull requests to the search index, replacing the terms of the
+	ones that were indexed before unless the indexed version is newer"""
+
+	documents = index["pull_requests"]
+
+	postings = dict(
+		(name, dict((key, set(numbers)) for key, numbers in index[name].items()))
+		for name in ("terms", "tickets")
+	)
+
+	for pull_request in pull_requests:
+		number = pull_request.number
+		document = documents.get(str(number))
+
+		if document is not None:
+			if document["updated_at"] > (pull_request.updated_at or ""):
+				continue
+
+			for name in ("terms", "tickets"):
+				for key in document[name]:
+					postings[name][key].discard(number)
+
+					if not postings[name][key]:
+						del postings[name][key]
+
+		text = "\n".join(
+			field or ""
+			for field in (
+				pull_request.title,
+				pull_request.body,
+				pull_request.user_login,
+				pull_request.head_ref,
+			)
+		)
+
+		document = {
+			"head_sha": pull_request.head_sha,
+			"state": pull_request.state,
+			"terms": sorted(get_search_terms(text)),
+			"tickets": sorted(set(re.findall(r"[A-Z]{3,}-\d+", text))),
+			"title": pull_request.title,
+			"updated_at": pull_request.updated_at or "",
+			"user": pull_request.user_login,
+		}
+
+		for name in ("terms", "tickets"):
+			for key in document[name]:
+				postings[name].setdefault(key, set()).add(number)
+
+		documents[str(number)] = document
+
+	for name in ("terms", "tickets"):
+		index[name] = dict(
+			(key, sorted(numbers)) for key, numbers in postings[name].items()
+		)
+
+
+def leave_review_worktree(branch_name):
+	"""Removes the review worktree of the branch, when it is the current
+	directory, and moves to the main worktree, so that the branch can be
+	checked out or deleted there"""
+
+	queue = load_review_queue()
+
+	pull_request_ID = str(get_pull_request_ID(branch_name))
+
+	path = queue.get(pull_request_ID)
+
+	if path is None or os.path.realpath(path) != os.path.realpath(get_git_base_path()):
+		return
+
+	# the first worktree listed is the main one
+
+	main_path = git_output("worktree", "list", "--porcelain").splitlines()[0][9:]
+
+	print(color_text("Removing the worktree %s" % path, "status"))
+
+	os.chdir(main_path)
+
+	ret = git_run("worktree", "remove", path)
+
+	# the worktree is kept in the queue, and left as the current directory
+
+	if ret != 0:
+		os.chdir(path)
+		raise UserWarning("Could not remove the worktree %s" % path)
+
+	del queue[pull_request_ID]
+
+	if not options["dry-run"]:
+		save_review_queue(queue)
+
+	chdir(main_path)
+
+
+def load_options():
+	config = get_config_snapshot()
+	git_base_path = get_git_base_path()
+
+	path_prefix = "%s." % git_base_path
+
+	overrides = {}
+
+	for key, value in config.items():
+		if not key.startswith("git-pull-request."):
+			continue
+
+		key = key[17:]
+
+		if value.lower() in ("f", "false", "no"):
+			value = False
+		elif value.lower() in ("t", "true", "yes"):
+			value = True
+		elif value.lower() in ("", "none", "null", "nil"):
+			value = None
+
+		if key.find(path_prefix) == -1:
+			options[key] = value
+		else:
+			key = key.replace(path_prefix, "")
+			overrides[key] = value
+
+	options.update(overrides)
+
+
+def load_review_queue():
+	"""Returns the paths of the review worktrees by pull request number"""
+
+	try:
+		with open(os.path.join(get_git_dirs()[1], "gitpr-review.json")) as f:
+			return json.load(f)
+	except IOError:
+		return {}
+
+
+def load_search_index(repo_name, synced=False):
+	"""Returns the search index of the repository, an empty one if it was never
+	synced. With synced, raises an error instead of returning an empty one."""
+
+	try:
+		with open(get_search_index_path(repo_name)) as f:
+			index = json.load(f)
+	except (IOError, ValueError):
+		index = None
+
+	if index is None or index.get("repo") != repo_name:
+		if synced:
+			raise UserWarning(
+				"The pull requests of %s are not indexed yet, run gitpr sync first"
+				% repo_name
+			)
+
+		index = {
+			"pull_requests": {},
+			"repo": repo_name,
+			"synced_at": None,
+			"terms": {},
+			"tickets": {},
+		}
+
+	return index
+
+
+def load_users(filename):
+	"""Returns the alias map, which is only read again when the file changes"""
+
+	try:
+		github_users_file = open(filename, "r")
+	except IOError:
+		print("File %s could not be found. Using email names will not be available. Run the update-users command to enable this functionality" % filename)
+		return {}
+
+	with github_users_file:
+		key = os.path.abspath(filename)
+		stamp = os.fstat(github_users_file.fileno()).st_mtime_ns
+
+		if key in USERS_CACHE and USERS_CACHE[key][0] == stamp:
+			return USERS_CACHE[key][1]
+
+		github_users = json.load(github_users_file)
+
+	USERS_CACHE[key] = (stamp, github_users)
+
+	return github_users
+
+
+def log(*args):
+	for arg in args:
+		print(json.dumps(arg, sort_keys=True, indent=4))
+		print("/---")
+
+
+def lookup_alias(key):
+	user_alias = key
+
+	try:
+		if users and (key in users) and users[key]:
+			user_alias = users[key]
+	except Exception as e:
+		pass
+
+	return user_alias
+
+
+def main():
+	global DEBUG
+	global FORCE_COLOR
+
+	FORCE_COLOR = False
+
+	# parse command line options
+	try:
+		opts, args = getopt.gnu_getopt(
+			sys.argv[1:],
+			"hqar:u:l:b:",
+			[
+				"help",
+				"quiet",
+				"all",
+				"repo=",
+				"reviewer=",
+				"update",
+				"no-update",
+				"user=",
+				"update-branch=",
+				"authenticate",
+				"debug",
+				"force-color",
+				"dry-run",
+				"profile",
+				"profile-trace=",
+				"older-than=",
+				"fetch-filter=",
+				"name-only",
+			],
+		)
+	except getopt.GetoptError as e:
+		raise UserWarning("%s\nFor help use --help" % e)
+
+	for o, a in opts:
+		if o == "--profile":
+			start_profile()
+		elif o == "--profile-trace":
+			start_profile(a)
+		elif o == "--dry-run":
+			options["dry-run"] = True
+
+	arg_length = len(args)
+	command = "show"
+
+	if arg_length > 0:
+		command = args[0]
+
+	if command == "help":
+		command_help()
+		sys.exit(0)
+	elif command == "server":
+		command_server(*args[1:2])
+		return
+
+	# load git options
+	load_options()
+
+	global users, DEFAULT_USERNAME
+	global _work_dir
+	global auth_token
+	global URL_BASE
+
+	DEBUG = options["debug-mode"]
+
+	URL_BASE = "%s/%%s" % options["api-url"].rstrip("/")
+
+	_work_dir = None
+
+	repo_name = None
+	reviewer_repo_name = None
+
+	username = get_config("github.user")
+
+	auth_token = get_config("github.oauth-token")
+
+	fetch_auto_update = options["fetch-auto-update"]
+	older_than = None
+	name_only = False
+
+	info_user = username
+	submitOpenGitHub = options["submit-open-github"]
+
+	# manage github usernames
+	users_alias_file = get_config("git-pull-request.users-alias-file")
+
+	if len(users_alias_file) == 0:
+		users_alias_file = "git-pull-request.users"
+
+	if command != "update-users":
+		users = load_users(users_alias_file)
+
+	# process options
+	for o, a in opts:
+		if o in ("-h", "--help"):
+			command_help()
+			sys.exit(0)
+		elif o in ("-q", "--quiet"):
+			submitOpenGitHub = False
+		elif o in ("-a", "--all"):
+			options["filter-by-update-branch"] = False
+		elif o in ("-r", "--repo"):
+			if re.search("/", a):
+				repo_name = a
+			else:
+				repo_name = get_repo_name_for_remote(a)
+		elif o in ("-b", "--update-branch"):
+			options["update-branch"] = a
+		elif o in ("-u", "--user", "--reviewer"):
+			reviewer_repo_name = a
+			info_user = lookup_alias(a)
+		elif o == "--update":
+			fetch_auto_update = True
+		elif o == "--no-update":
+			fetch_auto_update = False
+		elif o == "--authenticate":
+			username = ""
+			auth_token = ""
+		elif o == "--debug":
+			DEBUG = True
+		elif o == "--force-color":
+			FORCE_COLOR = True
+		elif o == "--older-than":
+			try:
+				older_than = float(a)
+			except ValueError:
+				raise UserWarning("--older-than takes a number of days, not %s" % a)
+		elif o == "--fetch-filter":
+			options["fetch-filter"] = a
+		elif o == "--name-only":
+			name_only = True
+
+	# git may open an editor for the merges and commits of these commands, which
+	# needs a terminal that the server does not have, so the client runs them
+
+	if SERVING and (
+		command in ("continue-update", "cu", "merge", "pull", "update")
+		or (command == "fetch" and fetch_auto_update)
+	):
+		sys.exit(SERVER_FALLBACK)
+
+	# commands that only read the local repository
+	if command == "show-alias":
+		if arg_length >= 2:
+			command_show_alias(args[1])
+		return
+	elif command == "of-interest":
+		command_of_interest(*args[1:3])
+		return
+	elif command == "sync-origin":
+		command_sync_origin(args[1:])
+		return
+
+	if len(auth_token) == 0:
+		# the server has no terminal to ask for the token on
+
+		if SERVING:
+			sys.exit(SERVER_FALLBACK)
+
+		import getpass
+
+		token = getpass.getpass("Github token: ").strip()
+
+		# check if the token is valid
+		github_request(get_api_url("user/repos"), None, token)
+
+		auth_token = token
+
+		git_run("config", "--global", "github.oauth-token", auth_token)
+
+		# get repo name from git config
+	if repo_name is None or repo_name == "":
+		repo_name = get_default_repo_name()
+
+	if (not reviewer_repo_name) and (command == "submit"):
+		reviewer_repo_name = get_config("github.reviewer")
+
+	if reviewer_repo_name:
+		reviewer_repo_name = lookup_alias(reviewer_repo_name)
+
+		if command != 'forward' and command != "submit":
+			repo_name = reviewer_repo_name + "/" + repo_name.split("/")[1]
+
+	DEFAULT_USERNAME = username
+
+	# process arguments
+	if command == "show":
+		command_show(repo_name)
+	elif arg_length > 0:
+		if command == "alias":
+			if arg_length >= 2:
+				command_alias(args[1], args[2], users_alias_file)
+		elif command == "close":
+			pull_request_IDs = list(
+				itertools.takewhile(lambda arg: arg.isdigit(), args[1:])
+			)
+
+			comment = args[len(pull_request_IDs) + 1:][0:1]
+
+			if older_than is not None:
+				pull_request_IDs = get_pull_request_IDs_older_than(
+					repo_name, older_than, "Close"
+				)
+
+			if pull_request_IDs or older_than is not None:
+				command_close_pull_requests(repo_name, pull_request_IDs, *comment)
+			else:
+				command_close(repo_name, *comment)
+		elif command == "conflicts":
+			command_conflicts(repo_name)
+		elif command in ("continue-update", "cu"):
+			command_continue_update()
+		elif command == "fetch":
+			command_fetch(repo_name, args[1], fetch_auto_update)
+		elif command == "fetch-all":
+			command_fetch_all(repo_name)
+		elif command == "find":
+			command_find(repo_name, args[1])
+		elif command == "forward":
+			command_forward(repo_name, args[1], username, reviewer_repo_name)
+		elif command == "help":
+			command_help()
+		elif command == "info":
+			command_info(info_user)
+		elif command == "info-detailed":
+			command_info(info_user, True)
+		elif command == "merge":
+			if arg_length >= 2:
+				command_merge(repo_name, args[1])
+			else:
+				command_merge(repo_name)
+		elif command == "merge-train":
+			pull_request_IDs = list(
+				itertools.takewhile(lambda arg: arg.isdigit(), args[1:])
+			)
+
+			if not pull_request_IDs:
+				raise UserWarning("Please include the pull requests to merge")
+
+			comment = args[len(pull_request_IDs) + 1:]
+
+			if len(comment) > 1:
+				raise UserWarning(
+					"Please quote the comment, or put the pull request IDs before it"
+				)
+
+			command_merge_train(repo_name, pull_request_IDs, *comment)
+		elif command == "open":
+			if arg_length >= 2:
+				command_open(repo_name, args[1])
+			else:
+				command_open(repo_name)
+		elif command == "prune":
+			command_prune(repo_name)
+		elif command == "pull":
+			command_pull(repo_name)
+		elif command == "review-queue":
+			command_review_queue(repo_name, args[1:])
+		elif command == "search":
+			command_search(repo_name, " ".join(args[1:]))
+		elif command == "update-meta":
+			command_update_meta()
+		elif command == "sync":
+			command_sync(repo_name)
+		elif command == "submit":
+			pull_body = None
+			pull_title = None
+
+			if arg_length >= 2:
+				pull_body = args[1]
+
+			if arg_length >= 3:
+				pull_title = args[2]
+
+			command_submit(
+				repo_name,
+				username,
+				reviewer_repo_name,
+				pull_body,
+				pull_title,
+				submitOpenGitHub,
+			)
+		elif command == "update":
+			if arg_length >= 2:
+				command_update(repo_name, args[1])
+			else:
+				command_update(repo_name, options["update-branch"])
+		elif command == "update-users":
+			command_update_users(users_alias_file)
+		elif command == "comment":
+			if older_than is not None:
+				command_comment_pull_requests(
+					repo_name,
+					get_pull_request_IDs_older_than(repo_name, older_than, "Comment on"),
+					"".join(args[1:2]),
+				)
+			elif arg_length > 3:
+				command_comment_pull_requests(repo_name, args[2:], args[1])
+			else:
+				command_comment(repo_name, *args[1:])
+		elif command == "stats" or args[0] == "stat":
+			pull_request_ID = None
+
+			if arg_length >= 2:
+				pull_request_ID = args[1]
+
+			get_pr_stats(repo_name, pull_request_ID, name_only)
+		else:
+			command_fetch(repo_name, args[0], fetch_auto_update)
+
+
+def mark_pull_request_closed(repo_name, pull_request_ID):
+	"""Sets the state of the pull request to closed on github"""
+
+	url = get_api_url("repos/%s/pulls/%s" % (repo_name, pull_request_ID))
+
+	params = {"state": "closed"}
+
+	pull_request = github_json_request(url, params)
+
+	if pull_request.get("state") != "closed":
+		raise UserWarning(pull_request.get("message") or "Invalid response from github")
+
+	remove_patch_ids(pull_request_ID)
+
+
+def meta(key=None, value=None):
+	branch_name = get_current_branch_name(False)
+
+	pull_request_ID = get_pull_request_ID(branch_name)
+
+	val = None
+
+	if pull_request_ID is not None:
+		meta_data_path = get_tmp_path("git-pull-request-treeish-%s" % pull_request_ID)
+
+		try:
+			f = open(meta_data_path, "r+")
+			current_value = json.load(f)
+			current_obj = current_value
+
+			val = current_value
+
+			if key != None:
+				pieces = key.split(".")
+
+				key = pieces.pop()
+
+				for word in pieces:
+					current_obj = current_obj[word]
+
+				if value == None:
+					if key in current_obj:
+						val = current_obj[key]
+					else:
+						val = ""
+
+			if value != None:
+				val = value
+				current_obj[key] = value
+				f.seek(0)
+				f.truncate(0)
+				json.dump(current_value, f)
+
+			f.close()
+
+			return val
+
+		except Exception:
+			log("Could not update '%s' with '%s'" % (key, value))
+
+
+def open_URL(url):
+	if shutil.which("open"):
+		ret, output = run_command(
+			["open", "-g", url], capture=False, read_only=True, quiet=True
+		)
+
+		if ret != 0:
+			run_command(["open", url], capture=False, read_only=True)
+	elif shutil.which("cygstart"):
+		run_command(["cygstart", url], capture=False, read_only=True)
+	else:
+		try:
+			import webbrowser
 
-		ret = (
-			os.popen(
-				r"echo '{2}, {3}' && git diff --numstat --pretty='%H' --no-renames {0}..{1} | xargs -0n1 echo -n | cut -f 3- | sed -e 's/^.*\.\(.*\)$/\\1/' | sort | uniq -c | tr '\n' ',' | sed 's/,$//'".format(
-					merge_base, branch_name, shortstat, stats
-				)
-			)
-			.read()
-			.strip()
-		)
+			webbrowser.open_new_tab(url)
+		except Exception:
+			pass
 
-		print(ret)
 
-		stats_footer = options["stats-footer"]
+def post_comment(repo_name, pull_request_ID, comment):
+	url = get_api_url("repos/%s/issues/%s/comments" % (repo_name, pull_request_ID))
+	params = {"body": comment}
 
-		if stats_footer:
-			committers = (
-				os.popen(
-					"git log {0}..{1} --pretty='%an' --reverse | awk ' !x[$0]++'".format(
-						merge_base, branch_name
-					)
-				)
-				.read()
-				.strip()
-			)
-			committers = committers.split(os.linesep)
-			committers = ", ".join(committers)
+	data = github_json_request(url, params)
 
-			fn = False
+	if "id" not in data:
+		raise UserWarning(data.get("message") or "Invalid response from github")
 
-			if stats_footer.startswith("`"):
-				stats_footer = stats_footer[1:]
-				fn = True
 
-			footer_tpl = Template(stats_footer)
+def print_profile(trace_path=None):
+	"""Prints the recorded timings grouped by phase and command, slowest first,
+	and optionally writes them as a Chrome trace"""
 
-			committers = committers.decode("utf-8")
+	records = PROFILE_RECORDS
 
-			pr_obj = pull_request.copy()
-			pr_obj.update(
-				{
-					"merge_base": merge_base[0:8],
-					"branch_name": branch_name,
-					"committers": committers,
-					"NEWLINE": os.linesep,
-				}
-			)
+	if not records:
+		return
 
-			footer_result = footer_tpl.safe_substitute(**pr_obj)
+	phases = {}
 
-			if fn:
-				footer_result = (
-					os.popen(footer_result.encode("utf-8"))
-					.read()
-					.strip()
-					.decode("utf-8")
-				)
+	for record in records:
+		command = record["command"].split(" ")
 
-			print(footer_result)
+		if record["kind"] == "http":
+			name = "%s %s" % (
+				command[0],
+				re.sub(r"/\d+(?=/|$)", "/{n}", command[1].split("?")[0]),
+			)
+		else:
+			name = " ".join(
+				[command[0]] + [arg for arg in command[1:] if not arg.startswith("-")][0:1]
+			)
 
-		print
-	else:
-		pull_requests = get_pull_requests(repo_name, options["filter-by-update-branch"])
+		group = phases.setdefault(record["phase"], {})
+		total = group.setdefault(name, [0, 0.0, 0])
 
-		for pull_request in pull_requests:
-			get_pr_stats(repo_name, pull_request)
+		total[0] += 1
+		total[1] += record["duration"]
+		total[2] += record["bytes"]
 
+	out = sys.stderr
 
-def get_pull_request(repo_name, pull_request_ID):
-	"""Returns information retrieved from github about the pull request"""
+	out.write("\nProfile: %.3fs in %s processes and %s github requests\n" % (
+		sum(record["duration"] for record in records),
+		len([record for record in records if record["kind"] != "http"]),
+		len([record for record in records if record["kind"] == "http"]),
+	))
 
-	url = get_api_url("repos/%s/pulls/%s" % (repo_name, pull_request_ID))
+	for phase, group in sorted(
+		phases.items(), key=lambda item: -sum(total[1] for total in item[1].values())
+	):
+		out.write("\n%s %.3fs\n" % (phase, sum(total[1] for total in group.values())))
 
-	data = github_json_request(url)
+		for name, total in sorted(group.items(), key=lambda item: -item[1][1]):
+			out.write("	%5d x %8.3fs %10d bytes  %s\n" % (total[0], total[1], total[2], name))
 
-	return data
+	failures = [record for record in records if record["failed"]]
 
+	if failures:
+		out.write("\n%s call(s) did not succeed:\n" % len(failures))
 
-def get_pull_request_ID(branch_name):
-	"""Returns the pull request number of the branch with the name"""
+		for record in failures:
+			out.write("	%s  %s\n" % (
+				"-" if record["exit_code"] is None else record["exit_code"],
+				record["command"],
+			))
 
-	m = re.search(r"^pull-request-(\d+)", branch_name)
+	if trace_path:
+		events = [
+			{
+				"name": record["command"],
+				"cat": record["kind"],
+				"ph": "X",
+				"ts": int(record["start"] * 1000000),
+				"dur": int(record["duration"] * 1000000),
+				"pid": os.getpid(),
+				"tid": record["thread"],
+				"args": {
+					"phase": record["phase"],
+					"exit_code": record["exit_code"],
+					"bytes": record["bytes"],
+				},
+			}
+			for record in records
+		]
+
+		f = open(trace_path, "w")
+		json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+		f.close()
 
-	pull_request_ID = None
+		out.write("\nWrote the trace to %s\n" % trace_path)
 
-	if m and m.group(1) != "":
-		pull_request_ID = int(m.group(1))
 
-	return pull_request_ID
+def profile_record(kind, command, start, exit_code, size, failed):
+	"""Records a git process or a github request, whose exit code is the HTTP
+	status (None when github could not be reached)"""
 
+	PROFILE_RECORDS.append({
+		"kind": kind,
+		"command": command,
+		"phase": get_profile_phase(),
+		"start": start - PROFILE_START,
+		"duration": time.perf_counter() - start,
+		"exit_code": exit_code,
+		"failed": failed,
+		"bytes": size,
+		"thread": threading.get_ident(),
+	})
 
-def get_pull_requests(repo_name, filter_by_update_branch=False):
-	"""Returns information retrieved from github about the open pull requests on
-	the repository"""
 
-	url = get_api_url("repos/%s/pulls" % repo_name)
+def remove_patch_ids(pull_request_ID):
+	"""Removes the patch ids cached by get_patch_ids for the pull request"""
 
-	pulls = github_json_request(url)
+	import glob
 
-	if filter_by_update_branch:
-		update_branch = options["update-branch"]
+	for path in glob.glob(
+		get_tmp_path("git-pull-request-patch-ids-%s-*" % pull_request_ID)
+	):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
 
-		pull_requests = [pull for pull in pulls if pull["base"]["ref"] == update_branch]
-	else:
-		pull_requests = pulls
 
-	return pull_requests
+def report_pull_requests(pull_request_IDs, results, done, failed, raise_failures=True):
+	"""Prints what happened to each pull request, given the results returned
+	by github_gather, and raises an error if any of them failed (or returns how
+	many failed, without raise_failures)"""
 
+	failures = 0
 
-def get_repo_name_for_remote(remote_name):
-	"""Returns the repository name for the remote with the name"""
+	for pull_request_ID, result in zip(pull_request_IDs, results):
+		if isinstance(result, Exception):
+			failures += 1
 
-	remotes = os.popen("git remote -v").read()
+			print("%s %s: %s" % (
+				color_text("Could not %s" % failed, "error"),
+				color_text(pull_request_ID, "display-title-number"),
+				result,
+			))
+		else:
+			print("%s %s" % (
+				color_text(done, "success"),
+				color_text(pull_request_ID, "display-title-number"),
+			))
 
-	m = re.search(
-		r"^%s[^\n]+?github\.com[^\n]*?[:/]([^\n]+?)\.git" % remote_name,
-		remotes,
-		re.MULTILINE,
-	)
+	print("")
 
-	if m is not None and m.group(1) != "":
-		return m.group(1)
+	if failures and raise_failures:
+		raise UserWarning(
+			"Could not %s %s of %s pull requests"
+			% (failed, failures, len(pull_request_IDs))
+		)
 
+	return failures
 
-def get_repo_url(pull_request, repo_name, force=False):
-	"""Returns the git URL of the repository the pull request originated from"""
 
-	if force is False:
-		repo_url = "git@github.com:%s.git" % repo_name
-	else:
-		repo_url = pull_request["head"]["repo"]["html_url"].replace("https", "git")
-		private_repo = pull_request["head"]["repo"]["private"]
+def run():
+	"""Runs main and reports user errors without a traceback"""
 
-		if private_repo:
-			repo_url = pull_request["head"]["repo"]["ssh_url"]
+	try:
+		main()
+	except UserWarning as e:
+		print(color_text(e, "error"))
+		sys.exit(1)
+	finally:
+		close_git_batch()
+
+		if PROFILE_RECORDS is not None:
+			print_profile(PROFILE_TRACE_PATH)
+
+
+def run_command(
+	args,
+	capture=True,
+	input=None,
+	cwd=None,
+	read_only=False,
+	cache=False,
+	quiet=False,
+	exit_codes=(0,),
+):
+	"""Runs a command, given as a list of arguments, without a shell and returns
+	its exit code and output as bytes (None when the output is not captured).
+	exit_codes are the ones that do not mean that the command failed, for the
+	commands that answer with their exit code.
 
-	return repo_url
+	At most 'workers' commands run at the same time. Commands that are not read
+	only are printed instead of run in dry-run mode, and clear the memoized
+	output of the read only commands that were run with cache=True."""
 
+	global EXECUTOR_SEMAPHORE
 
-def get_tmp_path(filename):
-	return TMP_PATH % filename
+	args = list(args)
+	key = None
 
+	if cache:
+		key = (cwd or os.getcwd(), tuple(args), input)
 
-def get_user_email(github_user_info):
-	email = None
+		if key in GIT_CACHE:
+			return GIT_CACHE[key]
 
-	if "email" in github_user_info:
-		email = github_user_info["email"]
+	if not read_only:
+		GIT_CACHE.clear()
 
-		if email != None and email.endswith("@liferay.com"):
-			email = email[:-12]
+		if options["dry-run"]:
+			print("Would run: %s" % shlex.join(args))
+			return 0, b""
 
-			if email.isdigit():
-				email = None
-		else:
-			email = None
+	if EXECUTOR_SEMAPHORE is None:
+		EXECUTOR_SEMAPHORE = threading.BoundedSemaphore(int(options["workers"]))
 
-	if email == None:
-		if (
-			"name" in github_user_info
-			and github_user_info["name"] != None
-			and " " in github_user_info["name"]
-		):
-			email = github_user_info["name"].lower()
-			email = email.replace(" ", ".")
-			email = email.replace("(", ".")
-			email = email.replace(")", ".")
+	if not capture:
+		sys.stdout.flush()
 
-			email = re.sub(r"\.+", ".", email)
+	start = time.perf_counter()
 
-			# Unicode characters usually do not appear in Liferay emails, so
-			# we'll replace them with the closest ASCII equivalent
+	with EXECUTOR_SEMAPHORE:
+		process = subprocess.Popen(
+			args,
+			cwd=cwd,
+			stdin=subprocess.PIPE if input is not None else None,
+			stdout=subprocess.PIPE if capture else None,
+			stderr=subprocess.DEVNULL if quiet else None,
+		)
 
-			email = email.replace(u"\u00e1", "a")
-			email = email.replace(u"\u00e3", "a")
-			email = email.replace(u"\u00e9", "e")
-			email = email.replace(u"\u00f3", "o")
-			email = email.replace(u"\u00fd", "y")
-			email = email.replace(u"\u0107", "c")
-			email = email.replace(u"\u010d", "c")
-			email = email.replace(u"\u0151", "o")
-			email = email.replace(u"\u0161", "s")
+		output, _ = process.communicate(input)
 
-	return email
+	for hook in EXECUTOR_HOOKS:
+		hook(
+			args,
+			start,
+			process.returncode,
+			len(output or b"") + len(input or b""),
+			process.returncode not in exit_codes,
+		)
 
+	result = (process.returncode, output)
 
-def get_work_dir():
-	global _work_dir
+	if key is not None:
+		GIT_CACHE[key] = result
 
-	if _work_dir == None:
-		symbolic_ref = (
-			os.popen("git symbolic-ref HEAD").read().strip().replace("refs/heads/", "")
-		)
-		work_dir_global = options["work-dir"]
+	return result
 
-		work_dir_option = None
 
-		if symbolic_ref:
-			work_dir_option = "work-dir-%s" % symbolic_ref
+def save_review_queue(queue):
+	with open(os.path.join(get_git_dirs()[1], "gitpr-review.json"), "w") as f:
+		json.dump(queue, f)
 
-		if work_dir_option:
-			_work_dir = (
-				os.popen("git config git-pull-request.%s" % work_dir_option)
-				.read()
-				.strip()
-			)
-			options[work_dir_option] = _work_dir
 
-		if not _work_dir or not os.path.exists(_work_dir):
-			_work_dir = False
+def save_search_index(index):
+	"""Writes the search index through a temporary file, so that a search never
+	reads a partly written one"""
 
-		if not _work_dir:
-			if work_dir_global and os.path.exists(work_dir_global):
-				_work_dir = work_dir_global
-			else:
-				_work_dir = False
+	path = get_search_index_path(index["repo"])
 
-	return _work_dir
+	if not os.path.isdir(os.path.dirname(path)):
+		os.makedirs(os.path.dirname(path))
 
+	with open(path + ".tmp", "w") as f:
+		json.dump(index, f, separators=(",", ":"))
 
-def github_json_request(url, params=None):
-	data = json.loads(github_request(url, params))
+	os.replace(path + ".tmp", path)
 
-	return data
 
+def send_github_request(url, params=None, token=None, preload_content=True):
+	"""Sends a request to github and returns the body of the response as a
+	string, or the response itself, for the caller to read, if preload_content
+	is False"""
 
-def github_request(url, params=None, token=None):
 	headers = {
 		"Accept" : "application/vnd.github.v3+json"
 	}
@@ -1555,25 +4802,133 @@ def github_request(url, params=None, token=None):
 	if DEBUG:
 		print(url)
 
-	response = None
+	cached = None
 
-	try:
-		http = urllib3.PoolManager()
+	if RESPONSE_CACHE is not None and not encode_data and not token:
+		cached = RESPONSE_CACHE.get((url, auth_token))
 
-		if encode_data:
-			response = http.request("POST", url, body=encode_data, headers=headers)
+		if cached is not None:
+			headers["If-None-Match"] = cached[0]
+
+	import urllib3
+
+	retries = int(options["api-retries"])
+
+	check_circuit()
+
+	method = "POST" if encode_data else "GET"
+
+	start = time.perf_counter()
+
+	for attempt in itertools.count():
+		try:
+			response = get_http().request(
+				method,
+				url,
+				body=encode_data,
+				headers=headers,
+				preload_content=preload_content,
+			)
+		except urllib3.exceptions.HTTPError as e:
+			if isinstance(e, urllib3.exceptions.MaxRetryError):
+				e = e.reason
+
+			# a request that could not connect was never sent, so it is safe to
+			# retry even when it changes something
+
+			if attempt >= retries or (
+				encode_data
+				and not isinstance(e, urllib3.exceptions.ConnectTimeoutError)
+			):
+				check_circuit(False)
+
+				if PROFILE_RECORDS is not None:
+					profile_record(
+						"http", "%s %s" % (method, url), start, None, len(encode_data or ""), True
+					)
+
+				raise UserWarning("Could not connect to github: %s" % e)
+
+			reason = "Could not connect to github"
+			retry_after = None
 		else:
-			response = http.request("GET", url, headers=headers)
+			retry_after = get_retry_after(
+				response.status,
+				response.headers,
+				response.data if preload_content else None,
+				bool(encode_data),
+			)
 
-	except Exception:
-		if response.status == 401 and auth_token:
+			if retry_after is None or attempt >= retries:
+				break
+
+			reason = "Github answered %s" % response.status
+
+			if not preload_content:
+				response.drain_conn()
+				response.release_conn()
+
+		delay = get_retry_delay(attempt, retry_after)
+
+		sys.stderr.write(
+			color_text("%s, retrying in %.1f seconds" % (reason, delay), "warning")
+			+ "\n"
+		)
+
+		time.sleep(delay)
+
+	check_circuit(response.status < 500)
+
+	# the responses that are read by the caller are recorded once read, unless
+	# they are errors
+
+	if PROFILE_RECORDS is not None and (
+		preload_content or response.status == 401 or response.status >= 500
+	):
+		profile_record(
+			"http",
+			"%s %s" % (method, url),
+			start,
+			response.status,
+			len(encode_data or "") + (len(response.data) if preload_content else 0),
+			response.status >= 400,
+		)
+
+	if response.status == 401 or response.status >= 500:
+		if not preload_content:
+			response.drain_conn()
+			response.release_conn()
+
+	if response.status == 401:
+		if auth_token and not token:
 			raise UserWarning(
 				'Could not authorize you to connect with Github. Try running "git config --global --unset github.oauth-token" and running your command again to reauthenticate.'
 			)
 
 		raise UserWarning("Could not authorize you to connect with Github.")
 
-	data = response.data.decode("utf-8")
+	if response.status >= 500:
+		raise UserWarning(
+			"Github answered %s %s for %s" % (response.status, response.reason, url)
+		)
+
+	if not preload_content:
+		return response
+
+	if cached is not None and response.status == 304:
+		data = cached[2]
+	else:
+		data = response.data
+
+		if RESPONSE_CACHE is not None and not encode_data and not token:
+			cache_response(
+				url,
+				response.headers.get("ETag") if response.status == 200 else None,
+				response.headers.get("Link"),
+				data,
+			)
+
+	data = data.decode("utf-8")
 
 	MAP_RESPONSE[url] = response
 
@@ -1583,370 +4938,301 @@ def github_request(url, params=None, token=None):
 	return data
 
 
-def in_work_dir():
-	git_base_path = get_git_base_path()
+def serve(socket_path):
+	"""Runs the commands sent to the socket one at a time, until it is told to
+	stop or this script changes"""
 
-	work_dir = get_work_dir()
+	global RESPONSE_CACHE, SERVING
 
-	return (
-		isinstance(work_dir, str)
-		and git_base_path.lower() == work_dir.lower()
-		and os.path.islink(os.path.join(git_base_path, ".git", "config"))
-	)
+	import signal
+	import socket
 
+	server_dir = os.path.dirname(socket_path)
 
-def load_options():
-	all_config = os.popen("git config -l").read().strip()
-	git_base_path = os.popen("git rev-parse --show-toplevel").read().strip()
+	os.makedirs(server_dir, mode=0o700, exist_ok=True)
 
-	path_prefix = "%s." % git_base_path
+	server_dir_stat = os.stat(server_dir)
 
-	overrides = {}
+	if server_dir_stat.st_uid != os.getuid() or server_dir_stat.st_mode & 0o077:
+		raise UserWarning("%s must only be accessible by you" % server_dir)
 
-	matches = re.findall(
-		r"^git-pull-request\.([^=]+)=([^\n]*)$", all_config, re.MULTILINE
-	)
+	try:
+		os.unlink(socket_path)
+	except OSError:
+		pass
 
-	for k in matches:
-		key = k[0]
-		value = k[1]
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	server.bind(socket_path)
+	server.listen(16)
 
-		if value.lower() in ("f", "false", "no"):
-			value = False
-		elif value.lower() in ("t", "true", "yes"):
-			value = True
-		elif value.lower() in ("", "none", "null", "nil"):
-			value = None
+	SERVING = True
+	RESPONSE_CACHE = {}
 
-		if key.find(path_prefix) == -1:
-			options[key] = value
-		else:
-			key = key.replace(path_prefix, "")
-			overrides[key] = value
+	script_path = os.path.abspath(sys.argv[0])
+	script_stamp = os.stat(script_path).st_mtime_ns
 
-	options.update(overrides)
+	default_options = dict(options)
 
+	# SIGUSR1 interrupts the command that is running, when its client is
+	# interrupted
 
-def load_users(filename):
-	try:
-		github_users_file = open(filename, "r")
-	except IOError:
-		print("File %s could not be found. Using email names will not be available. Run the update-users command to enable this functionality" % filename)
-		return {}
+	def interrupt(signum, frame):
+		if SERVING_COMMAND:
+			raise KeyboardInterrupt()
 
-	github_users = json.load(github_users_file)
+	signal.signal(signal.SIGUSR1, interrupt)
 
-	github_users_file.close()
+	os.chdir("/")
 
-	return github_users
+	try:
+		while True:
+			connection, address = server.accept()
 
+			with connection:
+				stop = os.stat(script_path).st_mtime_ns != script_stamp
 
-def log(*args):
-	for arg in args:
-		print(json.dumps(arg, sort_keys=True, indent=4))
-		print("/---")
+				try:
+					stop = serve_command(connection, default_options, stop) or stop
+				except Exception:
+					import traceback
 
+					traceback.print_exc()
 
-def lookup_alias(key):
-	user_alias = key
+			if stop:
+				break
+	finally:
+		server.close()
 
-	try:
-		if users and (key in users) and users[key]:
-			user_alias = users[key]
-	except Exception as e:
-		pass
+		try:
+			os.unlink(socket_path)
+		except OSError:
+			pass
 
-	return user_alias
 
+def serve_command(connection, default_options, stop=False):
+	"""Runs a command sent by gitpr-client.py with the terminal, the directory
+	and the environment of the client, and returns whether the server has been
+	told to stop"""
 
-def main():
-	global DEBUG
-	global FORCE_COLOR
+	global CHDIR_PATH, EXECUTOR_SEMAPHORE, PROFILE_RECORDS, PROFILE_START
+	global PROFILE_TRACE_PATH, SERVING_COMMAND
 
-	FORCE_COLOR = False
+	import signal
+	import socket
+	import struct
 
-	# parse command line options
-	try:
-		opts, args = getopt.gnu_getopt(
-			sys.argv[1:],
-			"hqar:u:l:b:",
-			[
-				"help",
-				"quiet",
-				"all",
-				"repo=",
-				"reviewer=",
-				"update",
-				"no-update",
-				"user=",
-				"update-branch=",
-				"authenticate",
-				"debug",
-				"force-color",
-			],
-		)
-	except getopt.GetoptError as e:
-		raise UserWarning("%s\nFor help use --help" % e)
+	if hasattr(socket, "SO_PEERCRED"):
+		pid, uid, gid = struct.unpack(
+			"3i",
+			connection.getsockopt(
+				socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+			),
+		)
 
-	arg_length = len(args)
-	command = "show"
+		if uid != os.getuid():
+			return False
 
-	if arg_length > 0:
-		command = args[0]
+	# the request is a line of JSON, sent along with the client's stdin,
+	# stdout and stderr
 
-	if command == "help":
-		command_help()
-		sys.exit(0)
+	data, fds, flags, address = socket.recv_fds(connection, 65536, 3)
 
-	# load git options
-	load_options()
+	while data and not data.endswith(b"\n"):
+		chunk = connection.recv(65536)
 
-	global users, DEFAULT_USERNAME
-	global _work_dir
-	global auth_token
+		if not chunk:
+			break
 
-	DEBUG = options["debug-mode"]
+		data += chunk
 
-	_work_dir = None
+	try:
+		request = json.loads(data) if data.endswith(b"\n") else {}
+	except ValueError:
+		request = {}
 
-	repo_name = None
-	reviewer_repo_name = None
+	def reply(exit_code):
+		connection.sendall(
+			(json.dumps({"exit": exit_code, "chdir": CHDIR_PATH}) + "\n").encode("utf-8")
+		)
 
-	username = os.popen("git config github.user").read().strip()
+	# server commands and requests that arrive after this script changed are
+	# run by the client in a new process
 
-	auth_token = os.popen("git config github.oauth-token").read().strip()
+	if request.get("stop") or stop or request.get("argv", [])[0:1] == ["server"]:
+		for fd in fds:
+			os.close(fd)
 
-	fetch_auto_update = options["fetch-auto-update"]
+		CHDIR_PATH = None
 
-	info_user = username
-	submitOpenGitHub = options["submit-open-github"]
+		reply(0 if request.get("stop") else SERVER_FALLBACK)
 
-	# manage github usernames
-	users_alias_file = (
-		os.popen("git config git-pull-request.users-alias-file").read().strip()
-	)
+		return bool(request.get("stop"))
 
-	if len(users_alias_file) == 0:
-		users_alias_file = "git-pull-request.users"
+	if "argv" not in request or len(fds) != 3:
+		for fd in fds:
+			os.close(fd)
 
-	if command != "update-users":
-		users = load_users(users_alias_file)
+		return False
 
-	# process options
-	for o, a in opts:
-		if o in ("-h", "--help"):
-			command_help()
-			sys.exit(0)
-		elif o in ("-q", "--quiet"):
-			submitOpenGitHub = False
-		elif o in ("-a", "--all"):
-			options["filter-by-update-branch"] = False
-		elif o in ("-r", "--repo"):
-			if re.search("/", a):
-				repo_name = a
-			else:
-				repo_name = get_repo_name_for_remote(a)
-		elif o in ("-b", "--update-branch"):
-			options["update-branch"] = a
-		elif o in ("-u", "--user", "--reviewer"):
-			reviewer_repo_name = a
-			info_user = lookup_alias(a)
-		elif o == "--update":
-			fetch_auto_update = True
-		elif o == "--no-update":
-			fetch_auto_update = False
-		elif o == "--authenticate":
-			username = ""
-			auth_token = ""
-		elif o == "--debug":
-			DEBUG = True
-		elif o == "--force-color":
-			FORCE_COLOR = True
+	sys.stdout.flush()
+	sys.stderr.flush()
 
-	if len(auth_token) == 0:
-		token = getpass.getpass("Github token: ").strip()
+	saved_fds = [os.dup(fd) for fd in (0, 1, 2)]
+	saved_environ = dict(os.environ)
 
-		# check if the token is valid
-		github_request("https://api.github.com/user/repos", None, token)
+	for fd, client_fd in enumerate(fds):
+		os.dup2(client_fd, fd)
+		os.close(client_fd)
 
-		auth_token = token
+	os.environ.clear()
+	os.environ.update(request["env"])
 
-		os.system("git config --global github.oauth-token %s" % auth_token)
+	# the commands that need the terminal are run by the client, so any other
+	# prompt or editor fails at once instead of waiting for a terminal that the
+	# server does not have
 
-		# get repo name from git config
-	if repo_name is None or repo_name == "":
-		repo_name = get_default_repo_name()
+	os.environ["GIT_EDITOR"] = "false"
+	os.environ["GIT_TERMINAL_PROMPT"] = "0"
 
-	if (not reviewer_repo_name) and (command == "submit"):
-		reviewer_repo_name = os.popen("git config github.reviewer").read().strip()
+	sys.argv = sys.argv[0:1] + request["argv"]
 
-	if reviewer_repo_name:
-		reviewer_repo_name = lookup_alias(reviewer_repo_name)
+	# everything but the connections and the caches that are validated before
+	# being used starts over for every command
 
-		if command != 'forward' and command != "submit":
-			repo_name = reviewer_repo_name + "/" + repo_name.split("/")[1]
+	options.clear()
+	options.update(default_options)
 
-	DEFAULT_USERNAME = username
+	GIT_CACHE.clear()
+	GIT_DIRS.clear()
+	MAP_RESPONSE.clear()
+	PULL_REQUEST_BRANCHES.clear()
+	REQUEST_MEMO.clear()
 
-	# process arguments
-	if command == "show":
-		command_show(repo_name)
-	elif arg_length > 0:
-		if command == "alias":
-			if arg_length >= 2:
-				command_alias(args[1], args[2], users_alias_file)
-		elif command == "close":
-			if arg_length >= 2:
-				comment = args[1]
-				pull_request_ID = comment
+	del EXECUTOR_HOOKS[:]
 
-				if comment.isdigit():
-					comment = ""
+	CHDIR_PATH = None
+	EXECUTOR_SEMAPHORE = None
+	PROFILE_RECORDS = None
+	PROFILE_START = None
+	PROFILE_TRACE_PATH = None
 
-					if arg_length == 3:
-						comment = args[2]
+	# the client sends a byte when it is interrupted, and closes the connection
+	# if it is killed
 
-					print(color_text("Closing pull request", "status"))
-					close_pull_request(repo_name, pull_request_ID, comment)
-				else:
-					command_close(repo_name, comment)
-			else:
-				command_close(repo_name)
-		elif command in ("continue-update", "cu"):
-			command_continue_update()
-		elif command == "fetch":
-			command_fetch(repo_name, args[1], fetch_auto_update)
-		elif command == "fetch-all":
-			command_fetch_all(repo_name)
-		elif command == "forward":
-			command_forward(repo_name, args[1], username, reviewer_repo_name)
-		elif command == "help":
-			command_help()
-		elif command == "info":
-			command_info(info_user)
-		elif command == "info-detailed":
-			command_info(info_user, True)
-		elif command == "merge":
-			if arg_length >= 2:
-				command_merge(repo_name, args[1])
-			else:
-				command_merge(repo_name)
-		elif command == "open":
-			if arg_length >= 2:
-				command_open(repo_name, args[1])
-			else:
-				command_open(repo_name)
-		elif command == "pull":
-			command_pull(repo_name)
-		elif command == "update-meta":
-			command_update_meta()
-		elif command == "submit":
-			pull_body = None
-			pull_title = None
+	main_thread_ident = threading.get_ident()
+	finished = threading.Event()
+	finished_lock = threading.Lock()
 
-			if arg_length >= 2:
-				pull_body = args[1]
+	def watch():
+		try:
+			connection.recv(1)
+		except OSError:
+			pass
 
-			if arg_length >= 3:
-				pull_title = args[2]
+		with finished_lock:
+			if not finished.is_set():
+				signal.pthread_kill(main_thread_ident, signal.SIGUSR1)
 
-			command_submit(
-				repo_name,
-				username,
-				reviewer_repo_name,
-				pull_body,
-				pull_title,
-				submitOpenGitHub,
-			)
-		elif command == "update":
-			if arg_length >= 2:
-				command_update(repo_name, args[1])
-			else:
-				command_update(repo_name, options["update-branch"])
-		elif command == "update-users":
-			command_update_users(users_alias_file)
-		elif command == "show-alias":
-			if arg_length >= 2:
-				command_show_alias(args[1])
-		elif command == "comment":
-			command_comment(repo_name, *args[1:])
-		elif command == "stats" or args[0] == "stat":
-			pull_request_ID = None
+	threading.Thread(target=watch, daemon=True).start()
 
-			if arg_length >= 2:
-				pull_request_ID = args[1]
+	exit_code = 0
 
-			get_pr_stats(repo_name, pull_request_ID)
-		else:
-			command_fetch(repo_name, args[0], fetch_auto_update)
+	try:
+		try:
+			SERVING_COMMAND = True
+
+			os.chdir(request["cwd"])
+
+			run()
+		except SystemExit as e:
+			if isinstance(e.code, int):
+				exit_code = e.code
+			elif e.code is not None:
+				exit_code = 1
+		except KeyboardInterrupt:
+			raise
+		except Exception:
+			import traceback
 
+			traceback.print_exc()
+			exit_code = 1
+	except KeyboardInterrupt:
+		exit_code = 130
+	finally:
+		SERVING_COMMAND = False
 
-def meta(key=None, value=None):
-	branch_name = get_current_branch_name(False)
+		with finished_lock:
+			finished.set()
 
-	pull_request_ID = get_pull_request_ID(branch_name)
+		sys.stdout.flush()
+		sys.stderr.flush()
 
-	val = None
+		for fd, saved_fd in enumerate(saved_fds):
+			os.dup2(saved_fd, fd)
+			os.close(saved_fd)
 
-	if pull_request_ID is not None:
-		meta_data_path = get_tmp_path("git-pull-request-treeish-%s" % pull_request_ID)
+		os.environ.clear()
+		os.environ.update(saved_environ)
 
-		try:
-			f = open(meta_data_path, "r+")
-			current_value = json.load(f)
-			current_obj = current_value
+		os.chdir("/")
 
-			val = current_value
+	try:
+		reply(exit_code)
+	except OSError:
+		pass
 
-			if key != None:
-				pieces = key.split(".")
+	return False
 
-				key = pieces.pop()
 
-				for word in pieces:
-					current_obj = current_obj[word]
+def shell_output(script):
+	"""Runs a user configured shell script and returns its output as a
+	stripped string"""
 
-				if value == None:
-					if key in current_obj:
-						val = current_obj[key]
-					else:
-						val = ""
+	ret, output = run_command(["/bin/sh", "-c", script], read_only=True)
 
-			if value != None:
-				val = value
-				current_obj[key] = value
-				f.seek(0)
-				f.truncate(0)
-				json.dump(current_value, f)
+	return output.decode("utf-8", "replace").strip()
 
-			f.close()
 
-			return val
+def split_stream(chunks, separator):
+	"""Yields the separated tokens of a stream of chunks as they are read"""
 
-		except Exception:
-			log("Could not update '%s' with '%s'" % (key, value))
+	remainder = separator[0:0]
 
+	for chunk in chunks:
+		tokens = (remainder + chunk).split(separator)
+		remainder = tokens.pop()
 
-def open_URL(url):
-	if os.popen("command -v open").read().strip() != "":
-		ret = os.system('open -g "%s" 2>/dev/null' % url)
+		for token in tokens:
+			yield token
 
-		if ret != 0:
-			os.system('open "%s"' % url)
-	elif os.popen("command -v cygstart").read().strip() != "":
-		os.system('cygstart "%s"' % url)
-	else:
-		try:
-			webbrowser.open_new_tab(url)
-		except Exception:
-			pass
+	if remainder:
+		yield remainder
 
 
-def post_comment(repo_name, pull_request_ID, comment):
-	url = get_api_url("repos/%s/issues/%s/comments" % (repo_name, pull_request_ID))
-	params = {"body": comment}
+def start_profile(trace_path=None):
+	"""Starts recording every git process and github request"""
+
+	global PROFILE_RECORDS, PROFILE_START, PROFILE_TRACE_PATH
+
+	if trace_path:
+		PROFILE_TRACE_PATH = trace_path
 
-	github_json_request(url, params)
+	if PROFILE_RECORDS is not None:
+		return
+
+	PROFILE_RECORDS = []
+	PROFILE_START = time.perf_counter()
+
+	EXECUTOR_HOOKS.append(
+		lambda args, start, exit_code, size, failed: profile_record(
+			"git" if args[0] == "git" else "shell",
+			shlex.join(args),
+			start,
+			exit_code,
+			size,
+			failed,
+		)
+	)
 
 
 def strip_empty_lines(text):
@@ -1976,6 +5262,56 @@ def strip_html_tags(html_raw):
 	return html
 
 
+def sync_search_index(repo_name):
+	"""Adds the pull requests updated since the last sync to the search index of
+	the repository and returns the index along with them. They are listed by
+	github from the most recently updated one, so the listing stops at the
+	first one that is older than the last sync."""
+
+	index = load_search_index(repo_name)
+
+	synced_at = index["synced_at"]
+
+	url = get_api_url(
+		"repos/%s/pulls?state=all&sort=updated&direction=desc&per_page=100"
+		% repo_name
+	)
+
+	pull_requests = []
+	stream = github_json_stream(url, PullRequest.object_hook)
+
+	try:
+		for pull_request in stream:
+			if synced_at and pull_request.updated_at < synced_at:
+				break
+
+			pull_requests.append(pull_request)
+	finally:
+		stream.close()
+
+	index_pull_requests(index, pull_requests)
+
+	if pull_requests:
+		index["synced_at"] = max(
+			[synced_at or ""] + [pull_request.updated_at for pull_request in pull_requests]
+		)
+
+	save_search_index(index)
+
+	return index, pull_requests
+
+
+EXECUTOR_CODE = (
+	close_git_batch.__code__,
+	git_output.__code__,
+	git_rev_parse.__code__,
+	git_run.__code__,
+	git_stream.__code__,
+	run_command.__code__,
+	shell_output.__code__,
+)
+
+
 def update_branch(branch_name):
 	if in_work_dir():
 		raise UserWarning(
@@ -1994,11 +5330,11 @@ def update_branch(branch_name):
 		f.write(original_dir_path)
 		f.close()
 
-		ret = os.system("git reset --hard && git clean -f")
+		ret = git_run("reset", "--hard") or git_run("clean", "-f")
 		if ret != 0:
 			raise UserWarning("Cleaning up work directory failed, update not performed")
 
-	ret = os.system("git checkout %s" % branch_name)
+	ret = git_run("checkout", branch_name)
 	if ret != 0:
 		if work_dir:
 			raise UserWarning(
@@ -2012,7 +5348,7 @@ def update_branch(branch_name):
 
 	update_branch_option = options["update-branch"]
 
-	ret = os.system("git %(update-method)s %(update-branch)s" % (options))
+	ret = git_run(options["update-method"], options["update-branch"])
 
 	if ret != 0:
 		if work_dir:
@@ -2028,12 +5364,8 @@ def update_branch(branch_name):
 def update_meta():
 	branch_name = get_current_branch_name()
 	update_branch_option = options["update-branch"]
-	parent_commit = (
-		os.popen("git merge-base %s %s" % (update_branch_option, branch_name))
-		.read()
-		.strip()[0:10]
-	)
-	head_commit = os.popen("git rev-parse HEAD").read().strip()[0:10]
+	parent_commit = git_output("merge-base", update_branch_option, branch_name)[0:10]
+	head_commit = git_rev_parse("HEAD")[0:10]
 
 	updated = {"parent_commit": parent_commit, "head_commit": head_commit}
 
@@ -2049,9 +5381,103 @@ def update_meta():
 	return branch_treeish
 
 
+def use_remote_stats(pull_request):
+	"""Returns whether the stats of the pull request are read from the github
+	API instead of a local diff"""
+
+	source = options["stats-source"]
+
+	if source != "auto":
+		return source == "remote"
+
+	if options["stats-footer"]:
+		return False
+
+	return not branch_exists(build_branch_name(pull_request)) and not git_rev_parse(
+		pull_request.head_sha
+	)
+
+
+def write_branch_info(pull_request):
+	"""Records the commits the pull request was fetched at, which close uses to
+	link the changes made since"""
+
+	branch_info = {
+		"repo": pull_request.base_repo_name,
+		"username": pull_request.user_login,
+		"original": {
+			"parent_commit": pull_request.base_sha[0:10],
+			"head_commit": pull_request.head_sha[0:10],
+		},
+	}
+
+	f = open(
+		get_tmp_path("git-pull-request-treeish-%s" % pull_request.number), "w"
+	)
+	json.dump(branch_info, f)
+	f.close()
+
+
+def write_completion_cache(pull_requests):
+	"""Writes the words that git-pull-request-completion.bash completes to the
+	gitpr-completion file of the git directory, one per line with its kind
+	first, so that completing reads a single small file instead of running
+	gitpr or asking github. The pull requests are PullRequest objects or
+	(number, title) pairs."""
+
+	commands = []
+
+	for names in re.findall(
+		r"^\t([a-z][a-z-]*)(?:, ([a-z-]+))?", __doc__.split("Commands:")[1], re.M
+	):
+		commands.extend(name for name in names if name)
+
+	lines = [
+		"command\t%s" % command for command in dict.fromkeys(commands + ["show"])
+	]
+
+	for pull_request in pull_requests:
+		if isinstance(pull_request, PullRequest):
+			pull_request = (pull_request.number, pull_request.title)
+
+		lines.append("pull\t%s\t%s" % (
+			pull_request[0], " ".join((pull_request[1] or "").split())
+		))
+
+	# sync-origin takes the names of the branches that upstream also has, and
+	# the other commands the pull request branches
+
+	sync_branch_names = []
+
+	for ref_name in git_output(
+		"for-each-ref", "--format=%(refname)", "refs/heads/", "refs/remotes/upstream/"
+	).split():
+		if ref_name.startswith("refs/heads/pull-request-"):
+			lines.append("branch\t%s" % ref_name[11:])
+		elif ref_name.startswith("refs/heads/"):
+			sync_branch_names.append(ref_name[11:])
+		elif ref_name != "refs/remotes/upstream/HEAD":
+			sync_branch_names.append(ref_name[22:])
+
+	lines.extend(
+		"sync-branch\t%s" % branch_name
+		for branch_name in sorted(set(sync_branch_names))
+	)
+
+	users_alias_file = (
+		get_config("git-pull-request.users-alias-file") or "git-pull-request.users"
+	)
+
+	if os.path.exists(users_alias_file):
+		lines.extend("alias\t%s" % alias for alias in sorted(load_users(users_alias_file)))
+
+	path = os.path.join(get_git_dirs()[1], "gitpr-completion")
+
+	with open(path + ".tmp", "w") as f:
+		f.write("\n".join(lines) + "\n")
+
+	os.replace(path + ".tmp", path)
+
+
 if __name__ == "__main__":
-	try:
-		main()
-	except UserWarning as e:
-		print(color_text(e, "error"))
-		sys.exit(1)
\ No newline at end of file
+	run()
\ No newline at end of file
@@ -6,7 +6,25 @@
 > /tmp/git-pull-request-chdir
 
 PR=`dirname "$BASH_SOURCE"`
-"$PR/git-pull-request.py" "$@"
+
+# Send the command to the server started by "gitpr server start" if it is
+# running, which exits with 75 when the command has to be run here instead
+STATUS=75
+
+if [ -S "${TMPDIR:-/tmp}/git-pull-request-$UID/server.sock" ]; then
+	python3 -S "$PR/gitpr-client.py" "$@"
+	STATUS=$?
+fi
+
+# Run the zipapp built by build-zipapp.py, unless the script changed after it
+# was built
+if [ $STATUS -eq 75 ]; then
+	if [ "$PR/gitpr.pyz" -nt "$PR/git-pull-request.py" ]; then
+		python3 "$PR/gitpr.pyz" "$@"
+	else
+		"$PR/git-pull-request.py" "$@"
+	fi
+fi
 
 DIR=`cat /tmp/git-pull-request-chdir`
 
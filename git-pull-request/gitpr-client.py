@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sends a command to the server started by "gitpr server start", which runs it
+with the terminal, the directory and the environment of this process.
+
+Usage:
+
+	python3 -S gitpr-client.py [<options>] <command> [<args>]
+
+git-pull-request.sh runs it when the server socket exists. It exits with 75 when
+the server is not running or asks for the command to be run without it (after
+git-pull-request.py changed, or for commands that prompt), and
+git-pull-request.sh then runs git-pull-request.py instead.
+"""
+
+import json
+import os
+import signal
+import socket
+import sys
+
+SERVER_FALLBACK = 75
+
+
+def main():
+	socket_path = os.path.join(
+		os.environ.get("TMPDIR") or "/tmp",
+		"git-pull-request-%d" % os.getuid(),
+		"server.sock",
+	)
+
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+	try:
+		client.connect(socket_path)
+	except OSError:
+		return SERVER_FALLBACK
+
+	request = json.dumps({
+		"argv": sys.argv[1:],
+		"cwd": os.getcwd(),
+		"env": dict(os.environ),
+	})
+
+	request = (request + "\n").encode("utf-8")
+
+	sent = socket.send_fds(client, [request], [0, 1, 2])
+
+	if sent < len(request):
+		client.sendall(request[sent:])
+
+	# the server interrupts the command when it receives a byte
+
+	signal.signal(signal.SIGINT, lambda signum, frame: client.send(b"\x03"))
+
+	reply = b""
+
+	while not reply.endswith(b"\n"):
+		chunk = client.recv(4096)
+
+		if not chunk:
+			sys.stderr.write("The gitpr server stopped while running the command\n")
+			return 1
+
+		reply += chunk
+
+	reply = json.loads(reply)
+
+	if reply.get("chdir"):
+		with open("/tmp/git-pull-request-chdir", "w") as f:
+			f.write(reply["chdir"])
+
+	return reply["exit"]
+
+
+if __name__ == "__main__":
+	sys.exit(main())